@@ -0,0 +1,154 @@
+# async_db.py
+import asyncio
+import logging
+import os
+import uuid
+from typing import Any, Callable, Optional, TypeVar
+
+LOG = logging.getLogger(__name__)
+
+# Pool do engine assíncrono (mesmos limites do engine síncrono: Supabase free)
+ASYNC_DB_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", "5"))
+ASYNC_DB_MAX_OVERFLOW = int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "10"))
+ASYNC_DB_ENABLED = os.getenv("ASYNC_DB_ENABLED", "1") == "1"
+
+T = TypeVar("T")
+
+
+def async_url(sync_url: Any):
+    """
+    URL do engine síncrono -> (URL assíncrona, connect_args), ou (None, None)
+    se o banco não tiver equivalente assíncrono (ex.: SQLite em memória, que
+    não é compartilhado entre engines).
+    """
+    from sqlalchemy.engine import make_url
+
+    url = make_url(str(sync_url)) if not hasattr(sync_url, "drivername") else sync_url
+    backend = url.get_backend_name()
+
+    if backend == "sqlite":
+        if not url.database or url.database == ":memory:":
+            return None, None
+        return url.set(drivername="sqlite+aiosqlite"), {}
+
+    if backend == "postgresql":
+        query = dict(url.query)
+        connect_args = {
+            # pgbouncer (Supabase porta 6543) em transaction mode não aguenta
+            # prepared statements nomeados reaproveitados entre conexões
+            "statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+            "timeout": 30,
+        }
+        # Parâmetros do libpq que o asyncpg não entende
+        sslmode = query.pop("sslmode", None)
+        if sslmode:
+            # asyncpg aceita os mesmos modos do libpq (require, verify-full, ...)
+            connect_args["ssl"] = sslmode
+        for key in ("connect_timeout", "keepalives", "keepalives_idle",
+                    "keepalives_interval", "keepalives_count", "application_name"):
+            query.pop(key, None)
+        query["prepared_statement_cache_size"] = "0"
+        return url.set(drivername="postgresql+asyncpg", query=query), connect_args
+
+    return None, None
+
+
+class AsyncDatabase:
+    """
+    Engine assíncrono paralelo ao engine síncrono do main (asyncpg no
+    Postgres/Supabase, aiosqlite no SQLite em arquivo).
+
+    run(fn, *args) executa código de sessão já existente (estilo
+    session.query) via AsyncSession.run_sync: o I/O do banco roda no driver
+    assíncrono e o event loop segue atendendo outros updates enquanto isso.
+    Sem engine assíncrono (driver ausente, SQLite em memória, desativado),
+    run() cai para a sessão síncrona no executor — nunca no próprio loop.
+    """
+
+    def __init__(self):
+        self.engine = None
+        self.session_factory: Optional[Callable] = None
+        self._sync_session_factory: Optional[Callable] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.session_factory is not None
+
+    def configure(self, sync_url: Any, sync_session_factory: Callable):
+        """Cria o engine assíncrono a partir da URL do engine síncrono"""
+        self._sync_session_factory = sync_session_factory
+        if not ASYNC_DB_ENABLED:
+            LOG.info("[ASYNC-DB] Desativado por ASYNC_DB_ENABLED=0 - usando executor")
+            return
+        try:
+            from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+            url, connect_args = async_url(sync_url)
+            if url is None:
+                LOG.info("[ASYNC-DB] Banco sem driver assíncrono - usando executor")
+                return
+            if url.get_backend_name() == "sqlite":
+                self.engine = create_async_engine(url, future=True, echo=False)
+            else:
+                self.engine = create_async_engine(
+                    url,
+                    pool_pre_ping=True,
+                    pool_size=ASYNC_DB_POOL_SIZE,
+                    max_overflow=ASYNC_DB_MAX_OVERFLOW,
+                    pool_timeout=30,
+                    pool_recycle=300,  # 5 min — compatível com Supabase pgbouncer
+                    echo=False,
+                    connect_args=connect_args,
+                )
+            self.session_factory = async_sessionmaker(self.engine, expire_on_commit=False, autoflush=False)
+            LOG.info(f"[ASYNC-DB] Engine assíncrono pronto ({url.drivername})")
+        except Exception as e:
+            # Driver não instalado (asyncpg/aiosqlite) ou URL incompatível
+            self.engine = None
+            self.session_factory = None
+            LOG.warning(f"[ASYNC-DB] Engine assíncrono indisponível, usando executor: {e}")
+
+    def _run_blocking(self, fn: Callable[..., T], *args) -> T:
+        with self._sync_session_factory(expire_on_commit=False) as s:
+            try:
+                result = fn(s, *args)
+                s.commit()
+                return result
+            except Exception:
+                s.rollback()
+                raise
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        """
+        Executa fn(session, *args) e faz commit; rollback em caso de erro.
+        Objetos retornados continuam legíveis (sem expirar no commit).
+        """
+        if self.session_factory is not None:
+            async with self.session_factory() as s:
+                try:
+                    result = await s.run_sync(fn, *args)
+                    await s.commit()
+                    return result
+                except Exception:
+                    await s.rollback()
+                    raise
+        if self._sync_session_factory is None:
+            from main import SessionLocal
+            self._sync_session_factory = SessionLocal
+        return await asyncio.get_running_loop().run_in_executor(None, self._run_blocking, fn, *args)
+
+    async def dispose(self):
+        if self.engine is not None:
+            await self.engine.dispose()
+
+    def get_stats(self) -> dict:
+        if self.engine is None:
+            return {"enabled": False}
+        pool = self.engine.sync_engine.pool
+        status = getattr(pool, "status", None)
+        return {"enabled": True, "driver": self.engine.url.drivername, "pool": status() if status else None}
+
+
+# Instância global do banco assíncrono
+async_db = AsyncDatabase()
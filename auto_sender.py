@@ -28,6 +28,8 @@ from telegram import Bot, Message, Update, InputMediaVideo, InputMediaPhoto, Inp
 from telegram.error import TelegramError
 from sqlalchemy.orm import Session
 from config import SOURCE_CHAT_ID
+from async_db import async_db
+from stats_rollup import stats_rollup
 
 LOG = logging.getLogger(__name__)
 
@@ -157,6 +159,7 @@ async def index_message_file(update: Update, session: Session) -> bool:
         )
         session.add(source_file)
         session.commit()
+        stats_rollup.invalidate('auto_sender')
 
         LOG.info(f"[INDEX] ✅ Arquivo indexado: {file_data['file_type']} - ID {msg.message_id}")
 
@@ -275,6 +278,24 @@ def get_all_parts(session: Session, source_file: SourceFile) -> list:
 async def get_random_file_from_source(
     session: Session,
     tier: str
+) -> Optional[SourceFile]:
+    """
+    Busca um arquivo aleatório ainda não enviado para o tier (ver
+    _pick_random_file). Com o async_db ativo a consulta roda no engine
+    assíncrono e não trava o event loop; senão usa a sessão recebida.
+    """
+    if async_db.enabled:
+        try:
+            return await async_db.run(_pick_random_file, tier)
+        except Exception as e:
+            LOG.error(f"[AUTO-SEND] ❌ Erro ao buscar arquivo aleatório: {e}")
+            return None
+    return _pick_random_file(session, tier)
+
+
+def _pick_random_file(
+    session: Session,
+    tier: str
 ) -> Optional[SourceFile]:
     """
     Busca um arquivo aleatório do índice que ainda não foi enviado para o tier.
@@ -492,23 +513,30 @@ async def mark_file_as_sent(
     Marca um arquivo como já enviado no banco de dados.
     """
     try:
-        sent_file = SentFile(
-            file_unique_id=source_file.file_unique_id,
-            file_type=source_file.file_type,
-            message_id=source_file.message_id,
-            source_chat_id=source_file.source_chat_id,
-            sent_to_tier=tier,
-            sent_at=datetime.now(timezone.utc),
-            caption=source_file.caption
-        )
-        session.add(sent_file)
-        session.commit()
+        if async_db.enabled:
+            await async_db.run(_insert_sent_file, source_file, tier)
+        else:
+            _insert_sent_file(session, source_file, tier)
+            session.commit()
+        stats_rollup.invalidate('auto_sender')
         LOG.info(f"[AUTO-SEND] Arquivo marcado como enviado: {source_file.file_unique_id} para {tier}")
     except Exception as e:
         LOG.error(f"[AUTO-SEND] ❌ Erro ao marcar arquivo como enviado: {e}")
         session.rollback()
 
 
+def _insert_sent_file(session: Session, source_file: SourceFile, tier: str):
+    session.add(SentFile(
+        file_unique_id=source_file.file_unique_id,
+        file_type=source_file.file_type,
+        message_id=source_file.message_id,
+        source_chat_id=source_file.source_chat_id,
+        sent_to_tier=tier,
+        sent_at=datetime.now(timezone.utc),
+        caption=source_file.caption
+    ))
+
+
 async def send_teaser_to_free(bot: Bot, all_parts: list):
     """
     Envia um arquivo .txt com informações do arquivo VIP para o canal FREE.
@@ -1108,6 +1136,8 @@ def setup_auto_sender(vip_channel: int, free_channel: int, source_file_class=Non
     if source_file_class and sent_file_class:
         LOG.info(f"[AUTO-SEND] Classes de modelo configuradas corretamente")
 
+    stats_rollup.register('auto_sender', collect_stats)
+
 
 # ===== COMANDOS DE ADMINISTRAÇÃO =====
 
@@ -1128,6 +1158,7 @@ async def reset_sent_history(session: Session, tier: Optional[str] = None):
         count = query.count()
         query.delete()
         session.commit()
+        stats_rollup.invalidate('auto_sender')
 
         LOG.info(f"[ADMIN] ✅ Histórico resetado: {count} registros removidos (tier={tier or 'all'})")
         return count
@@ -1138,91 +1169,58 @@ async def reset_sent_history(session: Session, tier: Optional[str] = None):
         return 0
 
 
-async def get_stats(session: Session) -> Dict[str, Any]:
+def collect_stats(session: Session) -> Dict[str, Any]:
     """
-    Retorna estatísticas do sistema de envio automático.
+    Estatísticas do envio automático em quatro consultas agregadas (coletor
+    do stats_rollup): disponíveis via NOT EXISTS, sem carregar os ids enviados.
     """
-    try:
-        # Verificar se tabelas existem
-        from sqlalchemy import inspect
-        inspector = inspect(session.bind)
-        tables = inspector.get_table_names()
-
-        if 'source_files' not in tables or 'sent_files' not in tables:
-            LOG.warning("[STATS] Tabelas ainda não criadas")
-            return {
-                'indexed_files': 0,
-                'vip': {'total_sent': 0, 'available': 0, 'last_sent': None},
-                'free': {'total_sent': 0, 'available': 0, 'last_sent': None}
-            }
+    from sqlalchemy import case, func
 
-        total_indexed = session.query(SourceFile).filter(
-            SourceFile.source_chat_id == SOURCE_CHAT_ID,
-            SourceFile.active == True
-        ).count()
-
-        total_sent_vip = session.query(SentFile).filter(
-            SentFile.sent_to_tier == 'vip',
-            SentFile.source_chat_id == SOURCE_CHAT_ID
-        ).count()
-
-        total_sent_free = session.query(SentFile).filter(
-            SentFile.sent_to_tier == 'free',
-            SentFile.source_chat_id == SOURCE_CHAT_ID
-        ).count()
-
-        # Arquivos disponíveis - corrigir para retornar apenas o valor único
-        sent_vip_query = session.query(SentFile.file_unique_id).filter(
-            SentFile.sent_to_tier == 'vip'
-        ).all()
-        sent_vip_ids = {row[0] if isinstance(row, tuple) else row.file_unique_id for row in sent_vip_query}
-
-        sent_free_query = session.query(SentFile.file_unique_id).filter(
-            SentFile.sent_to_tier == 'free'
-        ).all()
-        sent_free_ids = {row[0] if isinstance(row, tuple) else row.file_unique_id for row in sent_free_query}
-
-        # Contar arquivos disponíveis para VIP
-        query_vip = session.query(SourceFile).filter(
-            SourceFile.source_chat_id == SOURCE_CHAT_ID,
-            SourceFile.active == True
-        )
-        if sent_vip_ids:  # Só aplica filtro se houver IDs enviados
-            query_vip = query_vip.filter(~SourceFile.file_unique_id.in_(sent_vip_ids))
-        available_vip = query_vip.count()
+    active_files = session.query(func.count(SourceFile.id)).filter(
+        SourceFile.source_chat_id == SOURCE_CHAT_ID,
+        SourceFile.active == True
+    )
+    total_indexed = active_files.scalar() or 0
 
-        # Contar arquivos disponíveis para FREE
-        query_free = session.query(SourceFile).filter(
-            SourceFile.source_chat_id == SOURCE_CHAT_ID,
-            SourceFile.active == True
+    def available(tier: str) -> int:
+        sent = session.query(SentFile.id).filter(
+            SentFile.sent_to_tier == tier,
+            SentFile.file_unique_id == SourceFile.file_unique_id
         )
-        if sent_free_ids:  # Só aplica filtro se houver IDs enviados
-            query_free = query_free.filter(~SourceFile.file_unique_id.in_(sent_free_ids))
-        available_free = query_free.count()
-
-        # Últimos envios
-        last_vip = session.query(SentFile).filter(
-            SentFile.sent_to_tier == 'vip'
-        ).order_by(SentFile.sent_at.desc()).first()
-
-        last_free = session.query(SentFile).filter(
-            SentFile.sent_to_tier == 'free'
-        ).order_by(SentFile.sent_at.desc()).first()
-
-        return {
-            'indexed_files': total_indexed,
-            'vip': {
-                'total_sent': total_sent_vip,
-                'available': available_vip,
-                'last_sent': last_vip.sent_at if last_vip else None
-            },
-            'free': {
-                'total_sent': total_sent_free,
-                'available': available_free,
-                'last_sent': last_free.sent_at if last_free else None
-            }
+        return active_files.filter(~sent.exists()).scalar() or 0
+
+    # Enviados (do grupo fonte atual) e último envio por tier
+    sent_rows = session.query(
+        SentFile.sent_to_tier,
+        func.sum(case((SentFile.source_chat_id == SOURCE_CHAT_ID, 1), else_=0)),
+        func.max(SentFile.sent_at),
+    ).group_by(SentFile.sent_to_tier).all()
+    sent = {tier: (int(total or 0), last) for tier, total, last in sent_rows}
+
+    return {
+        'indexed_files': total_indexed,
+        'vip': {
+            'total_sent': sent.get('vip', (0, None))[0],
+            'available': available('vip'),
+            'last_sent': sent.get('vip', (0, None))[1]
+        },
+        'free': {
+            'total_sent': sent.get('free', (0, None))[0],
+            'available': available('free'),
+            'last_sent': sent.get('free', (0, None))[1]
         }
+    }
+
+
+async def get_stats(session: Session) -> Dict[str, Any]:
+    """
+    Retorna estatísticas do sistema de envio automático (do stats_rollup;
+    recalculadas na hora se ainda não houver ou após envio/indexação).
+    """
+    from stats_rollup import stats_rollup
 
+    try:
+        return stats_rollup.get('auto_sender', session) or {}
     except Exception as e:
         LOG.error(f"[STATS] ❌ Erro ao obter estatísticas: {e}")
         return {}
@@ -1243,6 +1241,7 @@ async def deactivate_file(session: Session, file_unique_id: str) -> bool:
 
         source_file.active = False
         session.commit()
+        stats_rollup.invalidate('auto_sender')
 
         LOG.info(f"[ADMIN] ✅ Arquivo desativado: {file_unique_id}")
         return True
@@ -1268,6 +1267,7 @@ async def reactivate_file(session: Session, file_unique_id: str) -> bool:
 
         source_file.active = True
         session.commit()
+        stats_rollup.invalidate('auto_sender')
 
         LOG.info(f"[ADMIN] ✅ Arquivo reativado: {file_unique_id}")
         return True
@@ -2,7 +2,11 @@
 import json
 import logging
 import os
-from typing import Any, Optional, List
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional, List, Tuple
 import asyncio
 from datetime import datetime, timedelta
 
@@ -143,6 +147,172 @@ class CacheManager:
 # Instância global do cache
 cache = CacheManager()
 
+
+# Arquivo SQLite local com os snapshots dos caches persistentes
+CACHE_SNAPSHOT_PATH = os.getenv("CACHE_SNAPSHOT_PATH", "cache_snapshot.sqlite3")
+CACHE_SNAPSHOT_INTERVAL = int(os.getenv("CACHE_SNAPSHOT_INTERVAL", "300"))
+
+_BOUNDED_CACHES: List["BoundedTTLCache"] = []
+
+
+class BoundedTTLCache:
+    """
+    Cache em memória limitado (LRU) com TTL por entrada e contadores de hit/miss.
+
+    Com persist=True o conteúdo é gravado periodicamente em um snapshot SQLite
+    local (CACHE_SNAPSHOT_PATH) e recarregado na criação, sobrevivendo a
+    reinícios do processo. Os valores precisam ser serializáveis em JSON.
+    """
+
+    def __init__(self,
+                 name: str,
+                 max_entries: int = 1000,
+                 ttl: float = 3600,
+                 persist: bool = False):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist = persist
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+        _BOUNDED_CACHES.append(self)
+        if persist:
+            self.load_snapshot()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.stats["misses"] += 1
+                return default
+            expires_at, value = item
+            if expires_at < time.time():
+                del self._data[key]
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return default
+            self._data.move_to_end(key)
+            self.stats["hits"] += 1
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            item = self._data.get(key)
+            return item is not None and item[0] >= time.time()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        """Entradas válidas (não expiradas), sem alterar a ordem LRU"""
+        now = time.time()
+        with self._lock:
+            snapshot = [(k, v) for k, (exp, v) in self._data.items() if exp >= now]
+        return iter(snapshot)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        total = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": len(self._data),
+            "max_entries": self.max_entries,
+            "hit_rate": round(self.stats["hits"] / total, 3) if total else 0.0,
+        }
+
+    # ----- snapshot SQLite -----
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(CACHE_SNAPSHOT_PATH, timeout=5)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_snapshot ("
+            "cache TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL NOT NULL, "
+            "PRIMARY KEY (cache, key))"
+        )
+        return conn
+
+    def load_snapshot(self) -> int:
+        try:
+            conn = self._connect()
+            try:
+                rows = conn.execute(
+                    "SELECT key, value, expires_at FROM cache_snapshot WHERE cache = ? AND expires_at > ? "
+                    "ORDER BY expires_at",
+                    (self.name, time.time()),
+                ).fetchall()
+            finally:
+                conn.close()
+        except Exception as e:
+            LOG.warning(f"[CACHE {self.name}] Snapshot não carregado: {e}")
+            return 0
+
+        with self._lock:
+            for key, value, expires_at in rows[-self.max_entries:]:
+                self._data[key] = (expires_at, json.loads(value))
+        if rows:
+            LOG.info(f"[CACHE {self.name}] {len(self._data)} entradas restauradas do snapshot")
+        return len(rows)
+
+    def save_snapshot(self) -> int:
+        now = time.time()
+        with self._lock:
+            rows = [
+                (self.name, k, json.dumps(v, default=str), exp)
+                for k, (exp, v) in self._data.items() if exp >= now
+            ]
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("DELETE FROM cache_snapshot WHERE cache = ?", (self.name,))
+                    conn.executemany(
+                        "INSERT INTO cache_snapshot (cache, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                        rows,
+                    )
+            finally:
+                conn.close()
+        except Exception as e:
+            LOG.warning(f"[CACHE {self.name}] Falha ao salvar snapshot: {e}")
+            return 0
+        return len(rows)
+
+
+def save_persistent_caches():
+    """Grava o snapshot de todos os caches persistentes (síncrono)"""
+    for c in list(_BOUNDED_CACHES):
+        if c.persist:
+            c.save_snapshot()
+
+
+async def persistent_cache_snapshot_loop(interval: int = CACHE_SNAPSHOT_INTERVAL):
+    """Loop de snapshot periódico (em thread pool para não bloquear o event loop)"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, save_persistent_caches)
+        except Exception as e:
+            LOG.warning(f"Erro no snapshot dos caches: {e}")
+
+
+def get_bounded_cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {c.name: c.get_stats() for c in _BOUNDED_CACHES}
+
 # Funções de conveniência para caching de dados específicos
 async def cache_price(symbol: str, price: float, ttl: int = 1800):
     """Cache preço de criptomoeda por 30 minutos"""
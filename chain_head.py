@@ -0,0 +1,88 @@
+# chain_head.py
+import logging
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from singleflight import SingleFlight
+
+LOG = logging.getLogger(__name__)
+
+# Tempo médio de bloco (segundos) das chains mais usadas
+BLOCK_TIMES: Dict[str, float] = {
+    "0x1": 12.0,      # Ethereum
+    "0x38": 3.0,      # BSC
+    "0x89": 2.0,      # Polygon
+    "0xa4b1": 0.25,   # Arbitrum
+    "0xa": 2.0,       # OP Mainnet
+    "0x2105": 2.0,    # Base
+    "0xa86a": 2.0,    # Avalanche
+    "0xfa": 1.0,      # Fantom
+    "0x64": 5.0,      # Gnosis
+    "0x19": 6.0,      # Cronos
+}
+DEFAULT_BLOCK_TIME = float(os.getenv("DEFAULT_BLOCK_TIME", "2.0"))
+# Fração do tempo de bloco usada como TTL (cache nunca "pula" mais de um bloco)
+HEAD_TTL_FRACTION = float(os.getenv("HEAD_TTL_FRACTION", "0.5"))
+HEAD_TTL_MIN = float(os.getenv("HEAD_TTL_MIN", "0.25"))
+
+
+class ChainHeadTracker:
+    """
+    Cache do bloco mais recente por chain.
+
+    O TTL acompanha o tempo de bloco da chain, então o valor em cache fica no
+    máximo um bloco atrás (conta de confirmações conservadora). Validações
+    concorrentes na mesma chain compartilham a mesma chamada eth_blockNumber.
+    """
+
+    def __init__(self):
+        self._heads: Dict[str, Tuple[int, float]] = {}
+        # Busca em task própria: cancelar um chamador não deixa os outros presos
+        self._flight = SingleFlight("head")
+        self.stats = {"hits": 0, "misses": 0}
+
+    def ttl(self, chain_id: str) -> float:
+        block_time = BLOCK_TIMES.get(chain_id, DEFAULT_BLOCK_TIME)
+        return max(HEAD_TTL_MIN, block_time * HEAD_TTL_FRACTION)
+
+    def peek(self, chain_id: str) -> Optional[int]:
+        """Bloco em cache se ainda dentro do TTL, senão None"""
+        entry = self._heads.get(chain_id)
+        if entry and time.monotonic() - entry[1] < self.ttl(chain_id):
+            self.stats["hits"] += 1
+            return entry[0]
+        return None
+
+    def observe(self, chain_id: str, block_number: Optional[int]):
+        """Registra um bloco visto (ex.: vindo de um batch JSON-RPC)"""
+        if block_number is None:
+            return
+        current = self._heads.get(chain_id)
+        # Nunca regride (endpoints de backup podem estar alguns blocos atrás)
+        if current is None or block_number >= current[0]:
+            self._heads[chain_id] = (block_number, time.monotonic())
+
+    async def latest(self, rpc) -> int:
+        """Bloco mais recente da chain do cliente, com cache e chamada compartilhada"""
+        chain_id = rpc.chain_id
+        cached = self.peek(chain_id)
+        if cached is not None:
+            return cached
+
+        self.stats["misses"] += 1
+
+        async def fetch() -> int:
+            raw = await rpc.call("eth_blockNumber", [])
+            block = int(raw, 16) if isinstance(raw, str) else int(raw or 0)
+            self.observe(chain_id, block)
+            return block
+
+        return await self._flight.do(chain_id, fetch)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, "shared": self._flight.stats["shared"], "chains": len(self._heads)}
+
+
+# Instância global do tracker
+head_tracker = ChainHeadTracker()
@@ -0,0 +1,115 @@
+# chain_planner.py
+import logging
+import os
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+LOG = logging.getLogger(__name__)
+
+# Quantas chains sondar na primeira onda antes de ampliar a busca
+CHAIN_PLANNER_TOP_K = int(os.getenv("CHAIN_PLANNER_TOP_K", "3"))
+# Peso dos acertos do próprio usuário em relação aos acertos globais
+CHAIN_PLANNER_USER_WEIGHT = float(os.getenv("CHAIN_PLANNER_USER_WEIGHT", "5"))
+# Ordem usada enquanto não há histórico (ETH, BSC, Polygon)
+DEFAULT_PRIORITY_CHAINS = ["0x1", "0x38", "0x89"]
+
+
+class ChainProbePlanner:
+    """
+    Ordena as chains a sondar pela taxa de acerto observada.
+
+    Conta onde os pagamentos foram encontrados (globalmente e por usuário),
+    semeado a partir da coluna Payment.chain no startup. A busca autochain
+    sonda primeiro as top-k chains, depois as que já tiveram algum acerto e
+    só então o restante.
+    """
+
+    def __init__(self,
+                 top_k: int = CHAIN_PLANNER_TOP_K,
+                 user_weight: float = CHAIN_PLANNER_USER_WEIGHT,
+                 default_priority: Optional[List[str]] = None):
+        self.top_k = max(1, top_k)
+        self.user_weight = user_weight
+        self.default_priority = list(default_priority or DEFAULT_PRIORITY_CHAINS)
+        self.global_hits: Counter = Counter()
+        self.user_hits: Dict[int, Counter] = {}
+        self._lock = threading.Lock()
+
+    def record_hit(self, chain_id: str, user_id: Optional[int] = None, count: int = 1):
+        """Registra que um pagamento foi encontrado em chain_id"""
+        with self._lock:
+            self.global_hits[chain_id] += count
+            if user_id:
+                self.user_hits.setdefault(int(user_id), Counter())[chain_id] += count
+
+    def seed_from_db(self, session_factory, payment_model) -> int:
+        """Carrega o histórico de Payment.chain (pagamentos aprovados)"""
+        from sqlalchemy import func
+
+        with session_factory() as s:
+            rows = (
+                s.query(payment_model.chain, payment_model.user_id, func.count(payment_model.id))
+                .filter(payment_model.status == "approved")
+                .group_by(payment_model.chain, payment_model.user_id)
+                .all()
+            )
+
+        with self._lock:
+            self.global_hits.clear()
+            self.user_hits.clear()
+        total = 0
+        for chain_id, user_id, count in rows:
+            if not chain_id or not str(chain_id).startswith("0x"):
+                continue
+            self.record_hit(str(chain_id).lower(), user_id, int(count))
+            total += int(count)
+
+        LOG.info(f"[CHAIN-PLANNER] Histórico carregado: {total} pagamentos em {len(self.global_hits)} chains")
+        return total
+
+    def _score(self, chain_id: str, user_counts: Optional[Counter]) -> float:
+        score = float(self.global_hits.get(chain_id, 0))
+        if user_counts:
+            score += self.user_weight * user_counts.get(chain_id, 0)
+        return score
+
+    def rank(self, chains: Iterable[str], user_id: Optional[int] = None) -> List[str]:
+        """Chains ordenadas da mais provável para a menos provável"""
+        chains = list(chains)
+        with self._lock:
+            user_counts = Counter(self.user_hits.get(int(user_id), {})) if user_id else None
+            scores = {cid: self._score(cid, user_counts) for cid in chains}
+
+        def key(item):
+            idx, cid = item
+            default_rank = (
+                self.default_priority.index(cid) if cid in self.default_priority
+                else len(self.default_priority)
+            )
+            # Maior score primeiro; empate mantém prioridade padrão e ordem de CHAINS
+            return (-scores[cid], default_rank, idx)
+
+        return [cid for _, cid in sorted(enumerate(chains), key=key)]
+
+    def plan(self, chains: Iterable[str], user_id: Optional[int] = None) -> List[List[str]]:
+        """
+        Ondas de busca: [top-k], [demais chains com acertos], [restante].
+        Ondas vazias são omitidas.
+        """
+        ranked = self.rank(chains, user_id)
+        first = ranked[:self.top_k]
+        rest = ranked[self.top_k:]
+        with self._lock:
+            user_counts = self.user_hits.get(int(user_id), {}) if user_id else {}
+            seen = [cid for cid in rest if self.global_hits.get(cid) or user_counts.get(cid)]
+        unseen = [cid for cid in rest if cid not in seen]
+        return [wave for wave in (first, seen, unseen) if wave]
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.global_hits.most_common())
+
+
+# Instância global do planner
+chain_planner = ChainProbePlanner()
@@ -0,0 +1,140 @@
+# config_snapshot.py
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+LOG = logging.getLogger(__name__)
+
+# De quanto em quanto tempo conferir se outra instância alterou a config
+CONFIG_SNAPSHOT_CHECK_SECONDS = float(os.getenv("CONFIG_SNAPSHOT_CHECK_SECONDS", "30"))
+
+# Linha da própria config_kv com o carimbo da última escrita (trocado a cada cfg_set)
+VERSION_KEY = "__config_version__"
+
+# Sentinela: snapshot ainda não carregado (quem chama cai para o banco)
+MISSING = object()
+
+
+def new_stamp() -> str:
+    """Carimbo único por escrita: duas instâncias nunca geram o mesmo"""
+    return f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+
+
+class ConfigSnapshot:
+    """
+    Cópia em memória de toda a tabela config_kv.
+
+    cfg_get vira uma consulta ao dicionário; cfg_set grava no banco, troca o
+    carimbo VERSION_KEY na mesma transação e atualiza o snapshot após o
+    commit — ou recarrega tudo, se o carimbo substituído não era o da cópia
+    local (outra instância escreveu no meio tempo). As outras instâncias leem só a linha do carimbo a cada
+    CONFIG_SNAPSHOT_CHECK_SECONDS e recarregam a tabela inteira quando ele
+    muda. Antes da primeira carga get() devolve MISSING.
+    """
+
+    def __init__(self):
+        self._values: Dict[str, Optional[str]] = {}
+        self.version: Optional[str] = None
+        self.loaded = False
+        self._lock = threading.Lock()
+        self._session_factory: Optional[Callable] = None
+        self._cfg_cls: Any = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"hits": 0, "misses": 0, "reloads": 0, "checks": 0}
+
+    # ----- leitura -----
+    def get(self, key: str, default: Optional[str] = None):
+        if not self.loaded:
+            self.stats["misses"] += 1
+            return MISSING
+        self.stats["hits"] += 1
+        return self._values.get(key, default)
+
+    # ----- escrita -----
+    def apply(self, key: str, value: Optional[str], version: str, previous: Optional[str]) -> bool:
+        """
+        Escrita local já commitada (chamado pelo cfg_set após o commit).
+        False se a cópia estava desatualizada (`previous` não é a versão
+        local): quem chamou deve usar reload(), senão a escrita alheia se perde.
+        """
+        with self._lock:
+            if not self.loaded:
+                return True
+            if previous != self.version:
+                return False
+            values = dict(self._values)
+            values[key] = value
+            values[VERSION_KEY] = version
+            self._values = values
+            self.version = version
+        return True
+
+    def reload(self) -> int:
+        """Recarrega a tabela inteira (síncrono; rodar no executor em coroutines)"""
+        if self._session_factory is None:
+            return 0
+        return self.load(self._session_factory, self._cfg_cls)
+
+    # ----- carga / verificação -----
+    def load(self, session_factory: Callable, cfg_cls: Any) -> int:
+        """Lê a tabela inteira (síncrono; no startup ou no executor)"""
+        self._session_factory = session_factory
+        self._cfg_cls = cfg_cls
+        with session_factory() as s:
+            rows = s.query(cfg_cls.key, cfg_cls.value).all()
+        values = {key: value for key, value in rows}
+        with self._lock:
+            self._values = values
+            self.version = values.get(VERSION_KEY)
+            self.loaded = True
+        self.stats["reloads"] += 1
+        return len(values)
+
+    def _check(self) -> bool:
+        """Recarrega se o carimbo no banco mudou; True se recarregou"""
+        cfg_cls = self._cfg_cls
+        with self._session_factory() as s:
+            row = s.query(cfg_cls.value).filter(cfg_cls.key == VERSION_KEY).first()
+        self.stats["checks"] += 1
+        remote = row[0] if row else None
+        if self.loaded and remote == self.version:
+            return False
+        self.load(self._session_factory, cfg_cls)
+        LOG.info(f"[CONFIG] Snapshot recarregado (versão {self.version})")
+        return True
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(CONFIG_SNAPSHOT_CHECK_SECONDS)
+            try:
+                await loop.run_in_executor(None, self._check)
+            except Exception as e:
+                LOG.warning(f"[CONFIG] Falha ao verificar versão da config: {e}")
+
+    def start(self, session_factory: Callable, cfg_cls: Any):
+        """Inicia a verificação periódica (precisa do event loop ativo)"""
+        self._session_factory = session_factory
+        self._cfg_cls = cfg_cls
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "loaded": self.loaded, "keys": len(self._values), "version": self.version}
+
+
+# Instância global do snapshot de configuração
+config_snapshot = ConfigSnapshot()
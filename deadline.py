@@ -0,0 +1,100 @@
+# deadline.py
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Iterator, Optional, TypeVar
+
+LOG = logging.getLogger(__name__)
+
+# Orçamento total de uma validação (/tx, /api/validate), do worker até a resposta
+VALIDATION_DEADLINE_SECONDS = float(os.getenv("VALIDATION_DEADLINE_SECONDS", "20"))
+# Menor fatia que ainda vale gastar numa tentativa (RPC de backup, retry, API de preço)
+DEADLINE_MIN_STEP = float(os.getenv("DEADLINE_MIN_STEP", "0.25"))
+
+T = TypeVar("T")
+
+# Instante limite (time.monotonic) da operação corrente; None = sem prazo.
+# ContextVar acompanha o fluxo async: tasks criadas dentro do escopo
+# (gather, hedges, single-flight) herdam o mesmo prazo.
+_DEADLINE: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """O orçamento de tempo da operação acabou antes deste passo"""
+
+
+@contextmanager
+def budget(seconds: float) -> Iterator[float]:
+    """
+    Abre um escopo com prazo de `seconds` a partir de agora. Escopos
+    aninhados só encurtam o prazo: o mais apertado vale.
+    """
+    at = time.monotonic() + seconds
+    current = _DEADLINE.get()
+    if current is not None:
+        at = min(at, current)
+    token = _DEADLINE.set(at)
+    try:
+        yield at
+    finally:
+        _DEADLINE.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Segundos restantes do prazo corrente (None = sem prazo)"""
+    at = _DEADLINE.get()
+    if at is None:
+        return None
+    return at - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def can_afford(seconds: float = DEADLINE_MIN_STEP) -> bool:
+    """Ainda sobra pelo menos `seconds` (decide se vale mais uma tentativa)"""
+    left = remaining()
+    return left is None or left >= seconds
+
+
+def clamp(timeout: Optional[float]) -> Optional[float]:
+    """Timeout do passo limitado ao que resta do prazo; DeadlineExceeded se já acabou"""
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded("prazo da operação esgotado")
+    return left if timeout is None else min(timeout, left)
+
+
+def is_clamped(timeout: Optional[float]) -> bool:
+    """True se o prazo corrente é menor que `timeout` (o corte será do prazo, não do passo)"""
+    left = remaining()
+    return left is not None and (timeout is None or left < timeout)
+
+
+async def wait(aw: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """
+    Aguarda `aw` respeitando o prazo (e `timeout`, se menor). Útil para
+    trabalho no executor (banco): a thread termina sozinha, mas quem espera
+    desiste a tempo.
+    """
+    try:
+        limit = clamp(timeout)
+    except DeadlineExceeded:
+        if asyncio.iscoroutine(aw):
+            aw.close()
+        raise
+    if limit is None:
+        return await aw
+    try:
+        return await asyncio.wait_for(aw, limit)
+    except asyncio.TimeoutError:
+        if is_clamped(timeout):
+            raise DeadlineExceeded("prazo da operação esgotado") from None
+        raise
@@ -0,0 +1,101 @@
+# keyset.py
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, List, Optional, Tuple
+
+LOG = logging.getLogger(__name__)
+
+# Direções de navegação (listas sempre do mais novo para o mais antigo)
+NEXT = "n"  # itens mais antigos que o cursor
+PREV = "p"  # itens mais novos que o cursor
+
+_EPOCH_NAIVE = datetime(1970, 1, 1)
+_EPOCH_AWARE = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICRO = timedelta(microseconds=1)
+
+
+@dataclass(frozen=True)
+class Cursor:
+    """
+    Posição na lista: (valor da coluna de ordenação, id) do item de borda da
+    página; `page` é só o número exibido da página de destino.
+    """
+    prefix: str
+    direction: str
+    key: datetime
+    id: int
+    page: int = 1
+
+    def encode(self) -> str:
+        """callback_data do botão (limite do Telegram: 64 bytes)"""
+        if self.key.tzinfo is None:
+            stamp = f"n{(self.key - _EPOCH_NAIVE) // _MICRO}"
+        else:
+            stamp = f"a{(self.key - _EPOCH_AWARE) // _MICRO}"
+        return f"{self.prefix}:{self.direction}:{stamp}:{self.id}:{self.page}"
+
+
+def decode(data: str) -> Optional[Cursor]:
+    """callback_data -> Cursor (None se malformado); preserva naive/aware do valor original"""
+    try:
+        prefix, direction, stamp, row_id, page = data.split(":")
+        if direction not in (NEXT, PREV) or stamp[:1] not in ("n", "a"):
+            return None
+        epoch = _EPOCH_NAIVE if stamp[0] == "n" else _EPOCH_AWARE
+        return Cursor(prefix, direction, epoch + int(stamp[1:]) * _MICRO, int(row_id), max(1, int(page)))
+    except (ValueError, IndexError):
+        return None
+
+
+@dataclass
+class Page:
+    rows: List[Any]
+    has_newer: bool
+    has_older: bool
+
+
+def fetch_page(query: Any, key_col: Any, id_col: Any, per_page: int,
+               cursor: Optional[Cursor] = None, offset: int = 0) -> Page:
+    """
+    Uma página da consulta ordenada por (key_col, id_col) DESC, buscando só
+    per_page + 1 linhas (a extra indica se há mais). Sem cursor começa do
+    topo (offset opcional: salto direto para uma página, compatível com
+    "/comando N"); com cursor usa a comparação de keyset, que aproveita o
+    índice e não depende do tamanho da tabela. As linhas podem ser
+    entidades ou tuplas (join).
+    """
+    from sqlalchemy import and_, or_
+
+    if cursor is None:
+        rows = query.order_by(key_col.desc(), id_col.desc()).offset(offset).limit(per_page + 1).all()
+        return Page(rows[:per_page], has_newer=offset > 0, has_older=len(rows) > per_page)
+
+    if cursor.direction == NEXT:
+        rows = (
+            query.filter(or_(key_col < cursor.key, and_(key_col == cursor.key, id_col < cursor.id)))
+            .order_by(key_col.desc(), id_col.desc())
+            .limit(per_page + 1)
+            .all()
+        )
+        return Page(rows[:per_page], has_newer=True, has_older=len(rows) > per_page)
+
+    rows = (
+        query.filter(or_(key_col > cursor.key, and_(key_col == cursor.key, id_col > cursor.id)))
+        .order_by(key_col.asc(), id_col.asc())
+        .limit(per_page + 1)
+        .all()
+    )
+    has_newer = len(rows) > per_page
+    return Page(list(reversed(rows[:per_page])), has_newer=has_newer, has_older=True)
+
+
+def nav_cursors(prefix: str, page: Page, number: int, key_of) -> Tuple[Optional[Cursor], Optional[Cursor]]:
+    """(cursor "anteriores", cursor "próximos") a partir das bordas da página `number`"""
+    if not page.rows:
+        return None, None
+    first_key, first_id = key_of(page.rows[0])
+    last_key, last_id = key_of(page.rows[-1])
+    newer = Cursor(prefix, PREV, first_key, first_id, max(1, number - 1)) if page.has_newer else None
+    older = Cursor(prefix, NEXT, last_key, last_id, number + 1) if page.has_older else None
+    return newer, older
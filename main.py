@@ -13,7 +13,7 @@ import pytz
 from dotenv import load_dotenv
 
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import PlainTextResponse, JSONResponse, HTMLResponse, FileResponse
+from fastapi.responses import PlainTextResponse, JSONResponse, HTMLResponse, FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 import httpx
@@ -92,7 +92,7 @@ from sqlalchemy.engine import make_url
 
 # Importar apenas User, PendingNotification e MemberLog do models.py
 # Pack e Payment já estão definidos no main.py com mais campos
-from models import User, PendingNotification, MemberLog, SupportTicket, FabImageCache, FreeGroupMember, Base as ModelsBase
+from models import User, PendingNotification, MemberLog, SupportTicket, FabImageCache, FreeGroupMember, TokenMetadata, IncomingPayment, WatcherCheckpoint, PendingTx, QuotaUsage, Base as ModelsBase
 
 # Fab.com image scraper
 try:
@@ -161,6 +161,7 @@ from cache import (
     cache_user_vip_status,
     get_cached_vip_status,
     invalidate_user_cache,
+    get_bounded_cache_stats,
 )
 
 # Sistema de filas assíncronas para alta concorrência
@@ -630,8 +631,8 @@ def init_db():
     for attempt in range(max_retries):
         try:
             logging.info(f"[DB] Tentativa {attempt + 1}/{max_retries} de conectar ao banco...")
-            Base.metadata.create_all(bind=engine)
-            ensure_member_log_fields()
+            # Tabelas, colunas e defaults de config vêm das migrações versionadas
+            run_migrations()
             logging.info(f"[DB] ✅ Conexão estabelecida com sucesso!")
             break
         except Exception as e:
@@ -655,46 +656,43 @@ def init_db():
             except Exception:
                 s.rollback()
                 raise
-    if not cfg_get("daily_pack_vip_hhmm"):  cfg_set("daily_pack_vip_hhmm", "09:00")
-    if not cfg_get("daily_pack_free_hhmm"): cfg_set("daily_pack_free_hhmm", "10:00")
+
+# Índices críticos para alta performance (aplicados pela migração 2)
+CRITICAL_INDEXES = [
+    # Payments - busca por hash é muito frequente
+    "CREATE INDEX IF NOT EXISTS idx_payments_tx_hash ON payments(tx_hash)",
+    "CREATE INDEX IF NOT EXISTS idx_payments_user_status ON payments(user_id, status)",
+    "CREATE INDEX IF NOT EXISTS idx_payments_created_at ON payments(created_at DESC)",
+
+    # VIP memberships - consultas frequentes por usuário e expiração
+    "CREATE INDEX IF NOT EXISTS idx_vip_user_expires ON vip_memberships(user_id, expires_at)",
+    "CREATE INDEX IF NOT EXISTS idx_vip_active_expires ON vip_memberships(active, expires_at) WHERE active = true",
+    "CREATE INDEX IF NOT EXISTS idx_vip_expires_at ON vip_memberships(expires_at DESC)",
+
+    # Packs - envio por tier e status
+    "CREATE INDEX IF NOT EXISTS idx_packs_tier_sent ON packs(tier, sent, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_packs_header_message ON packs(header_message_id)",
+    "CREATE INDEX IF NOT EXISTS idx_packs_scheduled_for ON packs(scheduled_for)",
+
+    # Pack files - busca por pack
+    "CREATE INDEX IF NOT EXISTS idx_pack_files_pack_id ON pack_files(pack_id, id)",
+    "CREATE INDEX IF NOT EXISTS idx_pack_files_src_msg ON pack_files(src_chat_id, src_message_id)",
+
+    # Admins - verificação de admin é muito frequente
+    "CREATE INDEX IF NOT EXISTS idx_admins_user_id ON admins(user_id)",
+
+    # VIP notifications - evitar duplicatas
+    "CREATE INDEX IF NOT EXISTS idx_vip_notifications_user_type ON vip_notifications(user_id, notification_type, sent_at)",
+
+    # Scheduled messages - execução por horário
+    "CREATE INDEX IF NOT EXISTS idx_scheduled_messages_enabled_tier ON scheduled_messages(enabled, tier, hhmm)",
+]
 
 def ensure_critical_indexes():
     """Criar índices críticos para performance em larga escala"""
     try:
         with engine.begin() as conn:
-            # Índices críticos para alta performance
-            indexes = [
-                # Payments - busca por hash é muito frequente
-                "CREATE INDEX IF NOT EXISTS idx_payments_tx_hash ON payments(tx_hash)",
-                "CREATE INDEX IF NOT EXISTS idx_payments_user_status ON payments(user_id, status)",
-                "CREATE INDEX IF NOT EXISTS idx_payments_temp_user_id ON payments(temp_user_id)",
-                "CREATE INDEX IF NOT EXISTS idx_payments_created_at ON payments(created_at DESC)",
-
-                # VIP memberships - consultas frequentes por usuário e expiração
-                "CREATE INDEX IF NOT EXISTS idx_vip_user_expires ON vip_memberships(user_id, expires_at)",
-                "CREATE INDEX IF NOT EXISTS idx_vip_active_expires ON vip_memberships(active, expires_at) WHERE active = true",
-                "CREATE INDEX IF NOT EXISTS idx_vip_expires_at ON vip_memberships(expires_at DESC)",
-
-                # Packs - envio por tier e status
-                "CREATE INDEX IF NOT EXISTS idx_packs_tier_sent ON packs(tier, sent, created_at)",
-                "CREATE INDEX IF NOT EXISTS idx_packs_header_message ON packs(header_message_id)",
-                "CREATE INDEX IF NOT EXISTS idx_packs_scheduled_for ON packs(scheduled_for)",
-
-                # Pack files - busca por pack
-                "CREATE INDEX IF NOT EXISTS idx_pack_files_pack_id ON pack_files(pack_id, id)",
-                "CREATE INDEX IF NOT EXISTS idx_pack_files_src_msg ON pack_files(src_chat_id, src_message_id)",
-
-                # Admins - verificação de admin é muito frequente
-                "CREATE INDEX IF NOT EXISTS idx_admins_user_id ON admins(user_id)",
-
-                # VIP notifications - evitar duplicatas
-                "CREATE INDEX IF NOT EXISTS idx_vip_notifications_user_type ON vip_notifications(user_id, notification_type, created_at)",
-
-                # Scheduled messages - execução por horário
-                "CREATE INDEX IF NOT EXISTS idx_scheduled_messages_enabled_tier ON scheduled_messages(enabled, tier, hhmm)",
-            ]
-
-            for index_sql in indexes:
+            for index_sql in CRITICAL_INDEXES:
                 try:
                     conn.execute(text(index_sql))
                     logging.debug(f"Índice criado/verificado: {index_sql.split('idx_')[1].split(' ')[0] if 'idx_' in index_sql else 'unknown'}")
@@ -707,6 +705,53 @@ def ensure_critical_indexes():
         logging.warning(f"Erro ao criar índices críticos: {e}")
         pass
 
+# =========================
+# Migrações versionadas (tabela schema_version)
+# =========================
+def _migrate_baseline(eng):
+    """Tudo que os ensure_* faziam a cada boot (idempotente para bancos antigos)"""
+    Base.metadata.create_all(bind=eng)
+    ensure_bigint_columns()
+    ensure_pack_tier_column()
+    ensure_pack_scheduled_for_column()
+    ensure_packfile_src_columns()
+    ensure_vip_invite_column()
+    ensure_vip_notification_columns()
+    ensure_vip_plan_column()
+    ensure_payment_fields()
+    ensure_member_log_fields()
+
+def _migrate_critical_indexes(eng):
+    from migrations import create_indexes
+    create_indexes(eng, CRITICAL_INDEXES)
+
+def _migrate_config_defaults(eng):
+    # Linha do carimbo do config_snapshot sempre existe: cfg_set só faz UPDATE nela
+    from config_snapshot import VERSION_KEY, new_stamp
+    from sqlalchemy.exc import IntegrityError
+    with SessionLocal() as s:
+        if not s.query(ConfigKV).filter(ConfigKV.key == VERSION_KEY).first():
+            s.add(ConfigKV(key=VERSION_KEY, value=new_stamp()))
+            try:
+                s.commit()
+            except IntegrityError:
+                s.rollback()  # outra instância semeou primeiro
+    if not cfg_get("daily_pack_vip_hhmm"):  cfg_set("daily_pack_vip_hhmm", "09:00")
+    if not cfg_get("daily_pack_free_hhmm"): cfg_set("daily_pack_free_hhmm", "10:00")
+
+def schema_migrations():
+    """Lista ordenada de migrações. Tabela/coluna/índice novo = nova Migration no fim."""
+    from migrations import Migration
+    return [
+        Migration(1, "baseline", _migrate_baseline),
+        Migration(2, "critical_indexes", _migrate_critical_indexes),
+        Migration(3, "config_defaults", _migrate_config_defaults),
+    ]
+
+def run_migrations() -> int:
+    from migrations import MigrationRunner
+    return MigrationRunner(schema_migrations()).run(engine)
+
 def ensure_schema():
     global engine, SessionLocal, url, DB_URL
 
@@ -727,6 +772,27 @@ def ensure_schema():
             FabImageCache.__table__.create(bind=engine, checkfirst=True)
         except Exception:
             pass
+        # Garante tabela do registro de tokens ERC-20
+        try:
+            TokenMetadata.__table__.create(bind=engine, checkfirst=True)
+        except Exception:
+            pass
+        # Garante tabelas do wallet_watcher (índice de pagamentos recebidos + checkpoints)
+        for table in (IncomingPayment.__table__, WatcherCheckpoint.__table__):
+            try:
+                table.create(bind=engine, checkfirst=True)
+            except Exception:
+                pass
+        # Garante tabela de transações pendentes (reverificação com backoff)
+        try:
+            PendingTx.__table__.create(bind=engine, checkfirst=True)
+        except Exception:
+            pass
+        # Garante tabela do livro de cotas dos provedores (RPC/APIs de preço)
+        try:
+            QuotaUsage.__table__.create(bind=engine, checkfirst=True)
+        except Exception:
+            pass
         
         # Show appropriate success message based on database type
         db_type = "PostgreSQL" if url.get_backend_name() == "postgresql" else "SQLite"
@@ -1276,6 +1342,10 @@ async def startup_event():
     start_time = time.time()
 
     try:
+        # Engine assíncrono paralelo (asyncpg/aiosqlite) para os caminhos quentes
+        from async_db import async_db
+        async_db.configure(engine.url, SessionLocal)
+
         # Inicializar cache Redis
         await cache.init_redis()
 
@@ -1290,6 +1360,72 @@ async def startup_event():
         setup_catalog(cfg_get, cfg_set)
         logging.info(f"📤 Sistema de envio automático configurado - VIP: {VIP_CHANNEL_ID}, FREE: {FREE_CHANNEL_ID}")
 
+        # Contagens agregadas de /metrics e /stats, recalculadas em background
+        stats_rollup.start(SessionLocal)
+
+        # Ordem de busca de chains aprendida com os pagamentos já aprovados
+        from chain_planner import chain_planner
+        try:
+            chain_planner.seed_from_db(SessionLocal, Payment)
+        except Exception as e:
+            logging.warning(f"⚠️ Histórico de chains não carregado: {e}")
+
+        # Registro de tokens ERC-20 (decimals/símbolo/estratégia de preço) em memória
+        from token_registry import token_registry
+        try:
+            token_registry.load_from_db(SessionLocal)
+        except Exception as e:
+            logging.warning(f"⚠️ Registro de tokens não carregado: {e}")
+
+        # Snapshot em memória da config_kv (cfg_get sem ida ao banco)
+        from config_snapshot import config_snapshot
+        try:
+            config_snapshot.load(SessionLocal, ConfigKV)
+        except Exception as e:
+            logging.warning(f"⚠️ Snapshot de config não carregado (cfg_get segue no banco): {e}")
+        config_snapshot.start(SessionLocal, ConfigKV)
+
+        # Índice em memória das tx_hash já usadas (filtro de Bloom + conjunto quente)
+        from used_hashes import used_hashes
+        try:
+            used_hashes.install(Payment)
+            asyncio.create_task(used_hashes.load_async(SessionLocal, Payment))
+        except Exception as e:
+            logging.warning(f"⚠️ Índice de hashes usadas não iniciado: {e}")
+
+        # Livro de cotas dos provedores gratuitos (contagens persistidas entre reinícios)
+        from quota_budget import quota_budget
+        try:
+            quota_budget.load_from_db(SessionLocal)
+            quota_budget.start()
+        except Exception as e:
+            logging.warning(f"⚠️ Livro de cotas não carregado: {e}")
+
+        # Oráculo de preços: snapshot em memória atualizado em lote num loop assíncrono
+        from payments import setup_price_oracle
+        from price_oracle import price_oracle
+        setup_price_oracle()
+        price_oracle.start()
+
+        # Watcher da carteira: indexa pagamentos recebidos direto dos blocos (com backfill)
+        from payments import setup_wallet_watcher
+        from wallet_watcher import wallet_watcher
+        setup_wallet_watcher(SessionLocal)
+        wallet_watcher.start()
+
+        # Transações pendentes: reverificação na chain conhecida e aprovação automática
+        from pending_tx import pending_tracker
+        pending_tracker.configure(SessionLocal)
+        pending_tracker.start()
+
+        # Pool de workers das validações (webapp responde 202 e acompanha por SSE)
+        from validation_jobs import validation_jobs
+        validation_jobs.start()
+
+        # Snapshot periódico dos caches persistentes (validações de tx, preços)
+        from cache import persistent_cache_snapshot_loop
+        asyncio.create_task(persistent_cache_snapshot_loop())
+
         # Iniciar sistema keep-alive para manter bot ativo 24/7
         from keep_alive import keep_alive_ping
         SELF_URL = os.getenv("SELF_URL", "")
@@ -1310,6 +1446,37 @@ async def shutdown_event():
     try:
         # Parar sistema de filas
         await queue_manager.stop()
+
+        # Fechar conexões keep-alive dos clientes JSON-RPC
+        from rpc_client import rpc_pool
+        await rpc_pool.aclose_all()
+
+        from price_oracle import price_oracle
+        await price_oracle.stop()
+
+        from wallet_watcher import wallet_watcher
+        await wallet_watcher.stop()
+
+        from pending_tx import pending_tracker
+        await pending_tracker.stop()
+
+        from quota_budget import quota_budget
+        await quota_budget.stop()
+
+        from config_snapshot import config_snapshot
+        await config_snapshot.stop()
+
+        await stats_rollup.stop()
+
+        from validation_jobs import validation_jobs
+        await validation_jobs.stop()
+
+        from async_db import async_db
+        await async_db.dispose()
+
+        # Último snapshot dos caches persistentes antes de sair
+        from cache import save_persistent_caches
+        save_persistent_caches()
         logging.info("✅ Sistemas finalizados com sucesso")
     except Exception as e:
         logging.error(f"❌ Erro na finalização: {e}")
@@ -1395,21 +1562,53 @@ async def health_check():
             status_code=503
         )
 
+from stats_rollup import stats_rollup
+
+def _collect_db_stats(s) -> Dict[str, Any]:
+    """Coletor do stats_rollup: uma consulta agregada por tabela (VIPs, packs, pagamentos)"""
+    from sqlalchemy import and_, case, func
+
+    now = now_utc()
+    vip_total, vip_active, vip_expired = s.query(
+        func.count(VipMembership.id),
+        func.sum(case((and_(VipMembership.active == True, VipMembership.expires_at > now), 1), else_=0)),
+        func.sum(case((VipMembership.expires_at <= now, 1), else_=0)),
+    ).one()
+
+    packs = {"total": 0, "vip": 0, "free": 0, "pending": 0}
+    for tier, sent, count in s.query(Pack.tier, Pack.sent, func.count(Pack.id)).group_by(Pack.tier, Pack.sent):
+        packs["total"] += count
+        if tier in ("vip", "free"):
+            packs[tier] += count
+        if sent == False:
+            packs["pending"] += count
+
+    payments = {"total": 0, "approved": 0, "pending": 0, "rejected": 0}
+    for status, count in s.query(Payment.status, func.count(Payment.id)).group_by(Payment.status):
+        payments["total"] += count
+        if status in payments:
+            payments[status] += count
+
+    return {
+        "vip_members": {"total": vip_total or 0, "active": int(vip_active or 0), "expired": int(vip_expired or 0)},
+        "packs": packs,
+        "payments": payments,
+    }
+
+stats_rollup.register("database", _collect_db_stats)
+
 @app.get("/metrics")
 async def metrics_endpoint():
     """Endpoint de métricas para Prometheus/monitoring"""
     try:
-        with SessionLocal() as s:
-            # Estatísticas do banco
-            total_users = s.query(VipMembership).count()
-            active_vips = s.query(VipMembership).filter(
-                VipMembership.active == True,
-                VipMembership.expires_at > now_utc()
-            ).count()
-            total_packs = s.query(Pack).count()
-            pending_packs = s.query(Pack).filter(Pack.sent == False).count()
-            total_payments = s.query(Payment).count()
-            pending_payments = s.query(Payment).filter(Payment.status == 'pending').count()
+        # Contagens do stats_rollup (sem COUNT por scrape)
+        db_stats = await stats_rollup.get_async("database")
+        total_users = db_stats["vip_members"]["total"]
+        active_vips = db_stats["vip_members"]["active"]
+        total_packs = db_stats["packs"]["total"]
+        pending_packs = db_stats["packs"]["pending"]
+        total_payments = db_stats["payments"]["total"]
+        pending_payments = db_stats["payments"]["pending"]
 
         # Métricas das filas
         queue_stats = queue_manager.get_stats() if queue_manager else {}
@@ -1430,7 +1629,8 @@ async def metrics_endpoint():
                 "total_packs": total_packs,
                 "pending_packs": pending_packs,
                 "total_payments": total_payments,
-                "pending_payments": pending_payments
+                "pending_payments": pending_payments,
+                "age_seconds": stats_rollup.age("database"),
             },
             "queues": queue_stats,
             "connection_pool": pool_stats,
@@ -1501,38 +1701,35 @@ async def readiness_check():
 @app.get("/stats")
 async def stats_endpoint():
     """Endpoint de estatísticas detalhadas"""
+    from wallet_watcher import wallet_watcher
+    from pending_tx import pending_tracker
+    from rpc_client import rpc_scoreboard
+    from quota_budget import quota_budget
+    from validation_jobs import validation_jobs
+    from used_hashes import used_hashes
+    from async_db import async_db
+    from config_snapshot import config_snapshot
     try:
-        with SessionLocal() as s:
-            # Estatísticas mais detalhadas
-            stats = {
-                "vip_members": {
-                    "total": s.query(VipMembership).count(),
-                    "active": s.query(VipMembership).filter(
-                        VipMembership.active == True,
-                        VipMembership.expires_at > now_utc()
-                    ).count(),
-                    "expired": s.query(VipMembership).filter(
-                        VipMembership.expires_at <= now_utc()
-                    ).count(),
-                },
-                "packs": {
-                    "total": s.query(Pack).count(),
-                    "vip": s.query(Pack).filter(Pack.tier == "vip").count(),
-                    "free": s.query(Pack).filter(Pack.tier == "free").count(),
-                    "pending": s.query(Pack).filter(Pack.sent == False).count(),
-                },
-                "payments": {
-                    "total": s.query(Payment).count(),
-                    "approved": s.query(Payment).filter(Payment.status == 'approved').count(),
-                    "pending": s.query(Payment).filter(Payment.status == 'pending').count(),
-                    "rejected": s.query(Payment).filter(Payment.status == 'rejected').count(),
-                },
-                "system": {
-                    "uptime_seconds": time.time() - start_time if 'start_time' in globals() else 0,
-                    "queue_stats": queue_manager.get_stats() if queue_manager else {},
-                    "timestamp": datetime.now().isoformat()
-                }
+        # Contagens do stats_rollup (recalculadas em background)
+        db_stats = await stats_rollup.get_async("database")
+        stats = {
+            **db_stats,
+            "system": {
+                "uptime_seconds": time.time() - start_time if 'start_time' in globals() else 0,
+                "queue_stats": queue_manager.get_stats() if queue_manager else {},
+                "caches": get_bounded_cache_stats(),
+                "wallet_watcher": wallet_watcher.get_stats(),
+                "pending_txs": pending_tracker.get_stats(),
+                "rpc_endpoints": rpc_scoreboard.get_stats(),
+                "quotas": quota_budget.get_stats(),
+                "validation_jobs": validation_jobs.get_stats(),
+                "used_hashes": used_hashes.get_stats(),
+                "async_db": async_db.get_stats(),
+                "config_snapshot": config_snapshot.get_stats(),
+                "stats_rollup": stats_rollup.get_stats(),
+                "timestamp": datetime.now().isoformat()
             }
+        }
 
         return JSONResponse(content=stats, status_code=200)
 
@@ -1639,23 +1836,79 @@ class ConfigKV(Base):
     value = Column(String, nullable=True)
     updated_at = Column(DateTime, default=now_utc, onupdate=now_utc)
 
+def _cfg_get_in(s, key: str, default: Optional[str] = None) -> Optional[str]:
+    row = s.query(ConfigKV).filter(ConfigKV.key == key).first()
+    return row.value if row else default
+
+def _cfg_put(s, key: str, value: Optional[str]):
+    row = s.query(ConfigKV).filter(ConfigKV.key == key).first()
+    if not row:
+        s.add(ConfigKV(key=key, value=value))
+    else:
+        row.value = value
+
+def _cfg_set_in(s, key: str, value: Optional[str]) -> Tuple[str, Optional[str]]:
+    """
+    Grava a chave e troca o carimbo de versão do snapshot (mesma transação).
+    Retorna (carimbo novo, carimbo anterior); a linha do carimbo fica travada
+    até o commit, então o anterior é exatamente a escrita que precedeu esta.
+    """
+    from config_snapshot import VERSION_KEY, new_stamp
+    stamp = new_stamp()
+    _cfg_put(s, key, value)
+    row = s.query(ConfigKV).filter(ConfigKV.key == VERSION_KEY).with_for_update().first()
+    if row is None:
+        s.add(ConfigKV(key=VERSION_KEY, value=stamp))
+        return stamp, None
+    previous, row.value = row.value, stamp
+    return stamp, previous
+
 def cfg_get(key: str, default: Optional[str] = None) -> Optional[str]:
+    # Snapshot em memória (config_snapshot); banco só antes da primeira carga
+    from config_snapshot import MISSING, config_snapshot
+    value = config_snapshot.get(key, default)
+    if value is not MISSING:
+        return value
     with SessionLocal() as s:
-        row = s.query(ConfigKV).filter(ConfigKV.key == key).first()
-        return row.value if row else default
+        return _cfg_get_in(s, key, default)
 
 def cfg_set(key: str, value: Optional[str]):
+    from config_snapshot import config_snapshot
     with SessionLocal() as s:
         try:
-            row = s.query(ConfigKV).filter(ConfigKV.key == key).first()
-            if not row:
-                s.add(ConfigKV(key=key, value=value))
-            else:
-                row.value = value
+            stamp, previous = _cfg_set_in(s, key, value)
             s.commit()
         except Exception:
             s.rollback()
             raise
+    if not config_snapshot.apply(key, value, stamp, previous):
+        try:
+            config_snapshot.reload()
+        except Exception as e:
+            # Versão local segue antiga: a verificação periódica recarrega
+            logging.warning(f"[CONFIG] Falha ao recarregar snapshot após cfg_set: {e}")
+
+async def cfg_get_async(key: str, default: Optional[str] = None) -> Optional[str]:
+    """cfg_get para coroutines: não bloqueia o event loop (ver async_db)"""
+    from async_db import async_db
+    from config_snapshot import MISSING, config_snapshot
+    value = config_snapshot.get(key, default)
+    if value is not MISSING:
+        return value
+    return await async_db.run(_cfg_get_in, key, default)
+
+async def cfg_set_async(key: str, value: Optional[str]):
+    """cfg_set para coroutines: não bloqueia o event loop (ver async_db)"""
+    from async_db import async_db
+    from config_snapshot import config_snapshot
+    stamp, previous = await async_db.run(_cfg_set_in, key, value)
+    if not config_snapshot.apply(key, value, stamp, previous):
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, config_snapshot.reload)
+        except Exception as e:
+            # Versão local segue antiga: a verificação periódica recarrega
+            logging.warning(f"[CONFIG] Falha ao recarregar snapshot após cfg_set: {e}")
+
 class Admin(Base):
     __tablename__ = "admins"
     id = Column(Integer, primary_key=True)
@@ -1861,21 +2114,8 @@ def ensure_schema_once():
         for attempt in range(max_retries):
             try:
                 logging.info(f"[SCHEMA] Inicializando schema (tentativa {attempt + 1}/{max_retries})...")
-                Base.metadata.create_all(bind=engine)
-
-                # Pular verificações de schema que são demoradas em produção
-                # ensure_bigint_columns()
-                # ensure_pack_tier_column()
-                # ensure_pack_scheduled_for_column()
-                # ensure_packfile_src_columns()
-                # ensure_vip_invite_column()
-                # ensure_vip_plan_column()
-                # ensure_payment_fields()
-
-                # MIGRAÇÃO CRÍTICA: Colunas de notificação VIP (necessárias para funcionamento)
-                ensure_vip_notification_columns()
 
-                # Configurações básicas
+                # Migrações pendentes + configurações básicas; banco em dia = um SELECT
                 init_db()
                 _schema_initialized = True
                 logging.info("[SCHEMA] ✅ Schema inicializado com sucesso!")
@@ -3839,218 +4079,189 @@ async def rem_admin_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # COMANDOS DE GERENCIAMENTO DE PAGAMENTOS E VIP
 # =========================
 
+LISTAR_HASHES_PER_PAGE = 10
+LISTAR_VIPS_PER_PAGE = 8
+
+def _listar_nav_markup(newer, older) -> Optional[InlineKeyboardMarkup]:
+    """Botões de navegação com o cursor keyset no callback_data"""
+    buttons = []
+    if newer:
+        buttons.append(InlineKeyboardButton("⬅️ Anteriores", callback_data=newer.encode()))
+    if older:
+        buttons.append(InlineKeyboardButton("Próximos ➡️", callback_data=older.encode()))
+    return InlineKeyboardMarkup([buttons]) if buttons else None
+
+def _listar_page_number(args) -> int:
+    try:
+        return max(1, int(args[0])) if args else 1
+    except (ValueError, TypeError):
+        return 1
+
+def _format_hash_entry(p, vip) -> str:
+    """Bloco de uma hash no /listar_hashes (vip = VIP da hash ou do usuário, se houver)"""
+    import pytz
+
+    status_emoji = {"pending": "⏳", "approved": "✅", "rejected": "❌"}.get(p.status, "❓")
+    # Prioridade: nome > @username > ID
+    if hasattr(p, 'first_name') and p.first_name:
+        username_info = p.first_name
+    elif p.username:
+        username_info = f"@{p.username}"
+    else:
+        username_info = f"ID:{p.user_id}"
+
+    # Converter UTC para horário local brasileiro
+    if p.created_at:
+        # Assumir que created_at está em UTC e converter para BRT (UTC-3)
+        utc_dt = p.created_at.replace(tzinfo=pytz.UTC)
+        brt_dt = utc_dt.astimezone(pytz.timezone('America/Sao_Paulo'))
+        created = brt_dt.strftime("%d/%m/%Y %H:%M BRT")
+    else:
+        created = "N/A"
+
+    vip_info = ""
+    if p.status == "approved":
+        if vip:
+            now = now_utc()
+            expires_at = vip.expires_at
+            # Garantir que ambas as datas tenham timezone
+            if expires_at and expires_at.tzinfo is None:
+                expires_at = expires_at.replace(tzinfo=dt.timezone.utc)
+
+            if vip.active and expires_at and expires_at > now:
+                days_left = (expires_at - now).days
+                hours_left = ((expires_at - now).total_seconds() / 3600) % 24
+                expires_brt = expires_at.astimezone(pytz.timezone('America/Sao_Paulo'))
+
+                # Mostrar tempo mais preciso
+                if days_left > 0:
+                    time_left = f"{days_left} dias restantes"
+                elif hours_left > 0:
+                    time_left = f"{int(hours_left)} horas restantes"
+                else:
+                    time_left = "expira em breve"
+
+                vip_info = f"\n👑 VIP Ativo: {time_left}\n📅 Expira: {expires_brt.strftime('%d/%m/%Y às %H:%M BRT')}"
+
+                # Usar informações do pagamento se disponível
+                if p.vip_days:
+                    vip_info += f"\n🎯 VIP atribuído: {p.vip_days} dias"
+                else:
+                    # Fallback para plano salvo no VIP
+                    plan_names = {
+                        "mensal": "30 dias",
+                        "trimestral": "90 dias",
+                        "semestral": "180 dias",
+                        "anual": "365 dias"
+                    }
+                    plan_desc = plan_names.get(vip.plan, vip.plan or "indefinido")
+                    vip_info += f"\n🎯 Plano: {plan_desc}"
+            elif expires_at:
+                # VIP expirado - mostrar quando expirou
+                expires_brt = expires_at.astimezone(pytz.timezone('America/Sao_Paulo'))
+                vip_info = f"\n👑 VIP Expirado\n📅 Expirou: {expires_brt.strftime('%d/%m/%Y às %H:%M BRT')}"
+            else:
+                vip_info = f"\n👑 VIP Expirado (sem data)"
+        else:
+            # Payment aprovado mas VIP não encontrado
+            vip_info = f"\n⚠️ VIP não encontrado para este usuário"
+
+    # Informações sobre pagamento (usar dados salvos)
+    chain_names = {
+        "0x1": "Ethereum", "0x38": "BSC", "0x89": "Polygon",
+        "ethereum": "Ethereum", "bsc": "BSC", "polygon": "Polygon"
+    }
+    chain_desc = chain_names.get(p.chain, p.chain or "unknown")
+
+    if p.status == "approved" and p.token_symbol and p.usd_value:
+        # Usar informações salvas durante aprovação
+        try:
+            usd_val = float(p.usd_value)
+            if p.amount and p.amount != "N/A":
+                amount_display = p.amount
+            elif p.token_symbol == "BTCB":
+                # Estimar quantidade BTCB baseada no USD salvo
+                btc_price = 110000  # Preço aproximado
+                amount_display = f"{usd_val/btc_price:.6f}"
+            else:
+                amount_display = "~"
+            payment_info = f"\n💰 Pago: {amount_display} {p.token_symbol} (${usd_val:.2f} USD) | {chain_desc}"
+        except (TypeError, ValueError):
+            payment_info = f"\n💰 {p.token_symbol or 'Token'} | {chain_desc}"
+    elif p.amount:
+        payment_info = f"\n💰 Valor: {p.amount} | Rede: {chain_desc}"
+    else:
+        payment_info = f"\n🔗 Rede: {chain_desc}"
+
+    return (
+        f"{status_emoji} <b>Hash #{p.id}</b> | Status: <b>{p.status.upper()}</b>\n"
+        f"👤 {username_info}\n"
+        f"📅 {created}{payment_info}{vip_info}\n"
+        f"💳 <code>{p.tx_hash}</code>"
+    )
+
+def _render_hashes_page(s, number: int = 1, cursor=None):
+    """
+    Uma página do /listar_hashes: (texto, teclado) ou (None, None) sem hashes.
+    Payment + VIP da hash vêm numa só consulta (outer join); VIPs por usuário
+    (sem hash vinculada) numa segunda consulta com os ids da página.
+    """
+    from keyset import fetch_page, nav_cursors
+
+    query = s.query(Payment, VipMembership).outerjoin(VipMembership, VipMembership.tx_hash == Payment.tx_hash)
+    offset = 0 if cursor else (number - 1) * LISTAR_HASHES_PER_PAGE
+    page = fetch_page(query, Payment.created_at, Payment.id, LISTAR_HASHES_PER_PAGE, cursor=cursor, offset=offset)
+    if not page.rows:
+        return None, None
+
+    # Uma linha por pagamento (mais de um VIP com a mesma hash: fica o primeiro)
+    rows, seen = [], set()
+    for p, vip in page.rows:
+        if p.id not in seen:
+            seen.add(p.id)
+            rows.append((p, vip))
+
+    # Se não encontrar por hash, buscar por user_id (VIP pode existir sem hash vinculada)
+    user_ids = {p.user_id for p, vip in rows if vip is None and p.status == "approved" and p.user_id}
+    by_user = {}
+    if user_ids:
+        for vip in s.query(VipMembership).filter(
+            VipMembership.user_id.in_(user_ids),
+            VipMembership.active == True
+        ).order_by(VipMembership.expires_at.desc()):
+            by_user.setdefault(vip.user_id, vip)
+
+    msg_lines = [f"📋 <b>HASHES CADASTRADAS</b> (Página {number})\n"]
+    for p, vip in rows:
+        msg_lines.append(_format_hash_entry(p, vip or by_user.get(p.user_id)))
+
+    newer, older = nav_cursors("lh", page, number, lambda row: (row[0].created_at, row[0].id))
+    return "\n\n".join(msg_lines), _listar_nav_markup(newer, older)
+
 async def listar_hashes_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Lista todas as hashes de pagamento cadastradas"""
+    """Lista as hashes de pagamento cadastradas (paginação keyset, botões de navegação)"""
     if not (update.effective_user and is_admin(update.effective_user.id)):
         return await update.effective_message.reply_text("❌ Apenas admins podem usar este comando.")
-    
+
     with SessionLocal() as s:
         try:
-            payments = s.query(Payment).order_by(Payment.created_at.desc()).all()
-            
-            if not payments:
+            number = _listar_page_number(context.args)
+            msg_text, markup = _render_hashes_page(s, number)
+
+            if msg_text is None:
+                if number > 1:
+                    return await update.effective_message.reply_text(f"📋 Página {number} vazia.")
                 # Resetar sequence do auto-increment quando não houver payments
                 try:
-                    from sqlalchemy import text
                     s.execute(text("ALTER SEQUENCE payments_id_seq RESTART WITH 1;"))
                     s.commit()
                 except Exception:
                     pass  # Ignorar se não conseguir resetar
-                
+
                 return await update.effective_message.reply_text("📋 Nenhuma hash cadastrada.")
-            
-            # Paginar resultados (máximo 10 por página)
-            page = 1
-            if context.args:
-                try:
-                    page = int(context.args[0])
-                    if page < 1: page = 1
-                except:
-                    page = 1
-            
-            per_page = 10
-            start_idx = (page - 1) * per_page
-            end_idx = start_idx + per_page
-            page_payments = payments[start_idx:end_idx]
-            
-            total_pages = (len(payments) + per_page - 1) // per_page
-            
-            msg_lines = [f"📋 <b>HASHES CADASTRADAS</b> (Página {page}/{total_pages})\n"]
-            
-            for p in page_payments:
-                status_emoji = {"pending": "⏳", "approved": "✅", "rejected": "❌"}.get(p.status, "❓")
-                # Prioridade: nome > @username > ID
-                if hasattr(p, 'first_name') and p.first_name:
-                    username_info = p.first_name
-                elif p.username:
-                    username_info = f"@{p.username}"
-                else:
-                    username_info = f"ID:{p.user_id}"
-                
-                # Converter UTC para horário local brasileiro
-                if p.created_at:
-                    # Assumir que created_at está em UTC e converter para BRT (UTC-3)
-                    import pytz
-                    utc_dt = p.created_at.replace(tzinfo=pytz.UTC)
-                    brt_dt = utc_dt.astimezone(pytz.timezone('America/Sao_Paulo'))
-                    created = brt_dt.strftime("%d/%m/%Y %H:%M BRT")
-                else:
-                    created = "N/A"
-                
-                # Buscar VIP associado a esta hash ou usuário
-                vip_info = ""
-                if p.status == "approved":
-                    # Primeiro tentar por hash com tratamento de erro para colunas inexistentes
-                    vip = None
-                    try:
-                        vip = s.query(VipMembership).filter(VipMembership.tx_hash == p.tx_hash).first()
-                    except Exception as e:
-                        # Se erro for sobre colunas inexistentes, usar query básica
-                        if "does not exist" in str(e):
-                            logging.warning("Colunas VIP não encontradas, usando query básica")
-                            # Query raw sem as colunas problemáticas
-                            result = s.execute(text("""
-                                SELECT id, user_id, username, tx_hash, expires_at, active, plan 
-                                FROM vip_memberships 
-                                WHERE tx_hash = :hash
-                                LIMIT 1
-                            """), {"hash": p.tx_hash}).fetchone()
-                            
-                            if result:
-                                # Criar objeto mock com dados básicos
-                                class MockVip:
-                                    def __init__(self, row):
-                                        self.id, self.user_id, self.username, self.tx_hash, self.expires_at, self.active, self.plan = row
-                                vip = MockVip(result)
-                        else:
-                            logging.error(f"Erro inesperado na query VIP: {e}")
-                            raise
-                    
-                    # Se não encontrar por hash, tentar por user_id (VIP pode existir sem hash vinculada)
-                    if not vip and p.user_id:
-                        try:
-                            vip = s.query(VipMembership).filter(
-                                VipMembership.user_id == p.user_id,
-                                VipMembership.active == True
-                            ).order_by(VipMembership.expires_at.desc()).first()
-                        except Exception as e:
-                            if "does not exist" in str(e):
-                                # Query raw para user_id também
-                                result = s.execute(text("""
-                                    SELECT id, user_id, username, tx_hash, expires_at, active, plan 
-                                    FROM vip_memberships 
-                                    WHERE user_id = :user_id AND active = true
-                                    ORDER BY expires_at DESC
-                                    LIMIT 1
-                                """), {"user_id": p.user_id}).fetchone()
-                                
-                                if result:
-                                    class MockVip:
-                                        def __init__(self, row):
-                                            self.id, self.user_id, self.username, self.tx_hash, self.expires_at, self.active, self.plan = row
-                                    vip = MockVip(result)
-                            else:
-                                logging.error(f"Erro inesperado na segunda query VIP: {e}")
-                                raise
-                    
-                    if vip:
-                        now = now_utc()
-                        if vip.expires_at and vip.active:
-                            # Garantir que ambas as datas tenham timezone
-                            expires_at = vip.expires_at
-                            if expires_at.tzinfo is None:
-                                expires_at = expires_at.replace(tzinfo=dt.timezone.utc)
-                            
-                            if expires_at > now:
-                                days_left = (expires_at - now).days
-                                hours_left = ((expires_at - now).total_seconds() / 3600) % 24
-                                expires_brt = expires_at.astimezone(pytz.timezone('America/Sao_Paulo'))
-                            
-                            # Mostrar tempo mais preciso
-                            if days_left > 0:
-                                time_left = f"{days_left} dias restantes"
-                            elif hours_left > 0:
-                                time_left = f"{int(hours_left)} horas restantes"
-                            else:
-                                time_left = "expira em breve"
-                                
-                            vip_info = f"\n👑 VIP Ativo: {time_left}\n📅 Expira: {expires_brt.strftime('%d/%m/%Y às %H:%M BRT')}"
-                            
-                            # Usar informações do pagamento se disponível
-                            if p.vip_days:
-                                vip_info += f"\n🎯 VIP atribuído: {p.vip_days} dias"
-                            else:
-                                # Fallback para plano salvo no VIP
-                                plan_names = {
-                                    "mensal": "30 dias",
-                                    "trimestral": "90 dias",
-                                    "semestral": "180 dias",
-                                    "anual": "365 dias"
-                                }
-                                plan_desc = plan_names.get(vip.plan, vip.plan or "indefinido")
-                                vip_info += f"\n🎯 Plano: {plan_desc}"
-                        else:
-                            # VIP expirado - mostrar quando expirou
-                            if vip.expires_at:
-                                expires_brt = vip.expires_at.replace(tzinfo=pytz.UTC).astimezone(pytz.timezone('America/Sao_Paulo'))
-                                vip_info = f"\n👑 VIP Expirado\n📅 Expirou: {expires_brt.strftime('%d/%m/%Y às %H:%M BRT')}"
-                            else:
-                                vip_info = f"\n👑 VIP Expirado (sem data)"
-                    else:
-                        # Payment aprovado mas VIP não encontrado
-                        vip_info = f"\n⚠️ VIP não encontrado para este usuário"
-                
-                # Informações sobre pagamento (usar dados salvos)
-                payment_info = ""
-                chain_names = {
-                    "0x1": "Ethereum", "0x38": "BSC", "0x89": "Polygon",
-                    "ethereum": "Ethereum", "bsc": "BSC", "polygon": "Polygon"
-                }
-                chain_desc = chain_names.get(p.chain, p.chain or "unknown")
-                
-                if p.status == "approved" and p.token_symbol and p.usd_value:
-                    # Usar informações salvas durante aprovação
-                    try:
-                        usd_val = float(p.usd_value)
-                        # Calcular quantidade baseada no valor USD e símbolo
-                        if p.amount and p.amount != "N/A":
-                            amount_display = p.amount
-                        else:
-                            # Recalcular quantidade aproximada baseada no valor USD
-                            try:
-                                import asyncio
-                                from payments import resolve_payment_usd_autochain
-                                # Para display, usar estimativa baseada no valor salvo
-                                if p.token_symbol == "BTCB":
-                                    # Estimar quantidade BTCB baseada no USD salvo
-                                    btc_price = 110000  # Preço aproximado
-                                    amount_display = f"{usd_val/btc_price:.6f}"
-                                else:
-                                    amount_display = "~"
-                            except:
-                                amount_display = "~"
-                        
-                        payment_info = f"\n💰 Pago: {amount_display} {p.token_symbol} (${usd_val:.2f} USD) | {chain_desc}"
-                    except:
-                        payment_info = f"\n💰 {p.token_symbol or 'Token'} | {chain_desc}"
-                elif p.amount:
-                    payment_info = f"\n💰 Valor: {p.amount} | Rede: {chain_desc}"
-                else:
-                    payment_info = f"\n🔗 Rede: {chain_desc}"
-                
-                msg_lines.append(
-                    f"{status_emoji} <b>Hash #{p.id}</b> | Status: <b>{p.status.upper()}</b>\n"
-                    f"👤 {username_info}\n"
-                    f"📅 {created}{payment_info}{vip_info}\n"
-                    f"💳 <code>{p.tx_hash}</code>"
-                )
-            
-            if total_pages > 1:
-                msg_lines.append(f"\n📄 Use /listar_hashes {page+1} para próxima página")
-            
-            msg_text = "\n\n".join(msg_lines)
-            await update.effective_message.reply_text(msg_text, parse_mode="HTML")
-            
+
+            await update.effective_message.reply_text(msg_text, parse_mode="HTML", reply_markup=markup)
+
         except Exception as e:
             logging.exception("Erro ao listar hashes")
             await update.effective_message.reply_text(f"❌ Erro ao listar hashes: {e}")
@@ -4134,109 +4345,128 @@ async def excluir_hash_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
             logging.exception("Erro ao buscar hash para exclusão")
             await update.effective_message.reply_text(f"❌ Erro ao buscar hash: {e}")
 
+def _format_vip_entry(vip, now) -> Tuple[str, bool]:
+    """Bloco de um VIP no /listar_vips; retorna (texto, ativo)"""
+    import pytz
+
+    # Prioridade: nome > @username > ID
+    if hasattr(vip, 'first_name') and vip.first_name:
+        username_info = vip.first_name
+    elif vip.username:
+        username_info = f"@{vip.username}"
+    else:
+        username_info = f"ID:{vip.user_id}"
+
+    # Converter horários para BRT
+    if vip.expires_at:
+        utc_expires = vip.expires_at.replace(tzinfo=pytz.UTC)
+        brt_expires = utc_expires.astimezone(pytz.timezone('America/Sao_Paulo'))
+        expires_str = brt_expires.strftime("%d/%m/%Y %H:%M BRT")
+    else:
+        expires_str = "N/A"
+
+    if vip.created_at:
+        utc_created = vip.created_at.replace(tzinfo=pytz.UTC)
+        brt_created = utc_created.astimezone(pytz.timezone('America/Sao_Paulo'))
+        created_str = brt_created.strftime("%d/%m/%Y BRT")
+    else:
+        created_str = "N/A"
+
+    # Garantir que ambas as datas tenham timezone
+    expires_at = vip.expires_at
+    if expires_at and expires_at.tzinfo is None:
+        expires_at = expires_at.replace(tzinfo=dt.timezone.utc)
+
+    # Verificar status
+    is_active = bool(vip.active and expires_at and expires_at > now)
+    if is_active:
+        status_emoji = "✅"
+        status_text = "ATIVO"
+        # Calcular dias restantes
+        time_info = f"⏰ {(expires_at - now).days} dias restantes"
+    else:
+        status_emoji = "❌" if expires_at and expires_at <= now else "⏸️"
+        status_text = "EXPIRADO" if expires_at and expires_at <= now else "INATIVO"
+        time_info = "⏰ Expirado"
+
+    return (
+        f"{status_emoji} <b>VIP #{vip.id}</b> | {status_text}\n"
+        f"👤 {username_info}\n"
+        f"📅 Expira: {expires_str}\n"
+        f"🎯 Criado: {created_str}\n"
+        f"⏰ {time_info}"
+    ), is_active
+
+def _render_vips_page(s, number: int = 1, cursor=None):
+    """Uma página do /listar_vips (ordem por expiração): (texto, teclado) ou (None, None)"""
+    from keyset import fetch_page, nav_cursors
+
+    offset = 0 if cursor else (number - 1) * LISTAR_VIPS_PER_PAGE
+    page = fetch_page(
+        s.query(VipMembership), VipMembership.expires_at, VipMembership.id,
+        LISTAR_VIPS_PER_PAGE, cursor=cursor, offset=offset,
+    )
+    if not page.rows:
+        return None, None
+
+    now = now_utc()
+    entries = [_format_vip_entry(vip, now) for vip in page.rows]
+    active_count = sum(1 for _, active in entries if active)
+
+    msg_lines = [
+        f"👑 <b>MEMBROS VIP</b> (Página {number})\n",
+        f"📊 Nesta página: ✅ Ativos: {active_count} | ❌ Expirados: {len(entries) - active_count}\n",
+    ]
+    msg_lines.extend(entry for entry, _ in entries)
+
+    newer, older = nav_cursors("lv", page, number, lambda vip: (vip.expires_at, vip.id))
+    return "\n\n".join(msg_lines), _listar_nav_markup(newer, older)
+
 async def listar_vips_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Lista todos os VIPs cadastrados com detalhes"""
+    """Lista os VIPs cadastrados com detalhes (paginação keyset, botões de navegação)"""
     if not (update.effective_user and is_admin(update.effective_user.id)):
         return await update.effective_message.reply_text("❌ Apenas admins podem usar este comando.")
-    
+
     with SessionLocal() as s:
         try:
-            vips = s.query(VipMembership).order_by(VipMembership.expires_at.desc()).all()
-            
-            if not vips:
+            number = _listar_page_number(context.args)
+            msg_text, markup = _render_vips_page(s, number)
+
+            if msg_text is None:
+                if number > 1:
+                    return await update.effective_message.reply_text(f"👑 Página {number} vazia.")
                 return await update.effective_message.reply_text("👑 Nenhum VIP cadastrado.")
-            
-            # Paginar resultados
-            page = 1
-            if context.args:
-                try:
-                    page = int(context.args[0])
-                    if page < 1: page = 1
-                except:
-                    page = 1
-            
-            per_page = 8
-            start_idx = (page - 1) * per_page
-            end_idx = start_idx + per_page
-            page_vips = vips[start_idx:end_idx]
-            
-            total_pages = (len(vips) + per_page - 1) // per_page
-            
-            msg_lines = [f"👑 <b>MEMBROS VIP</b> (Página {page}/{total_pages})\n"]
-            
-            now = now_utc()
-            active_count = 0
-            expired_count = 0
-            
-            for vip in page_vips:
-                # Prioridade: nome > @username > ID
-                if hasattr(vip, 'first_name') and vip.first_name:
-                    username_info = vip.first_name
-                elif vip.username:
-                    username_info = f"@{vip.username}"
-                else:
-                    username_info = f"ID:{vip.user_id}"
-                
-                # Converter horários para BRT
-                if vip.expires_at:
-                    import pytz
-                    utc_expires = vip.expires_at.replace(tzinfo=pytz.UTC)
-                    brt_expires = utc_expires.astimezone(pytz.timezone('America/Sao_Paulo'))
-                    expires_str = brt_expires.strftime("%d/%m/%Y %H:%M BRT")
-                else:
-                    expires_str = "N/A"
-                    
-                if vip.created_at:
-                    import pytz
-                    utc_created = vip.created_at.replace(tzinfo=pytz.UTC)
-                    brt_created = utc_created.astimezone(pytz.timezone('America/Sao_Paulo'))
-                    created_str = brt_created.strftime("%d/%m/%Y BRT")
-                else:
-                    created_str = "N/A"
-                
-                # Verificar status
-                is_active = vip.active and vip.expires_at and vip.expires_at > now
-                if is_active:
-                    active_count += 1
-                    status_emoji = "✅"
-                    status_text = "ATIVO"
-                else:
-                    expired_count += 1
-                    status_emoji = "❌" if vip.expires_at and vip.expires_at <= now else "⏸️"
-                    status_text = "EXPIRADO" if vip.expires_at and vip.expires_at <= now else "INATIVO"
-                
-                # Calcular dias restantes
-                if is_active:
-                    # Garantir que ambas as datas tenham timezone
-                    expires_at = vip.expires_at
-                    if expires_at.tzinfo is None:
-                        expires_at = expires_at.replace(tzinfo=dt.timezone.utc)
-                    days_left = (expires_at - now).days
-                    time_info = f"⏰ {days_left} dias restantes"
-                else:
-                    time_info = "⏰ Expirado"
-                
-                msg_lines.append(
-                    f"{status_emoji} <b>VIP #{vip.id}</b> | {status_text}\n"
-                    f"👤 {username_info}\n"
-                    f"📅 Expira: {expires_str}\n"
-                    f"🎯 Criado: {created_str}\n"
-                    f"⏰ {time_info}"
-                )
-            
-            # Estatísticas
-            msg_lines.insert(1, f"📊 Total: {len(vips)} | ✅ Ativos: {active_count} | ❌ Expirados: {expired_count}\n")
-            
-            if total_pages > 1:
-                msg_lines.append(f"\n📄 Use /listar_vips {page+1} para próxima página")
-            
-            msg_text = "\n\n".join(msg_lines)
-            await update.effective_message.reply_text(msg_text, parse_mode="HTML")
-            
+
+            await update.effective_message.reply_text(msg_text, parse_mode="HTML", reply_markup=markup)
+
         except Exception as e:
             logging.exception("Erro ao listar VIPs")
             await update.effective_message.reply_text(f"❌ Erro ao listar VIPs: {e}")
 
+async def listar_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Botões ⬅️/➡️ do /listar_hashes e /listar_vips: carrega a página do cursor"""
+    from keyset import decode
+
+    query = update.callback_query
+    if not (query.from_user and is_admin(query.from_user.id)):
+        return await query.answer("❌ Apenas admins.", show_alert=True)
+
+    cursor = decode(query.data or "")
+    if cursor is None:
+        return await query.answer("Página inválida.")
+    await query.answer()
+
+    render = _render_hashes_page if cursor.prefix == "lh" else _render_vips_page
+    try:
+        with SessionLocal() as s:
+            msg_text, markup = render(s, cursor.page, cursor)
+        if msg_text is None:
+            return await query.edit_message_reply_markup(reply_markup=None)
+        await query.edit_message_text(msg_text, parse_mode="HTML", reply_markup=markup)
+    except Exception as e:
+        logging.exception("Erro ao paginar listagem")
+        await query.message.reply_text(f"❌ Erro ao carregar página: {e}")
+
 async def processar_confirmacao_exclusao(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Processa confirmação de exclusão de hash quando usuário responde CONFIRMAR/CANCELAR"""
     if not (update.effective_user and is_admin(update.effective_user.id)):
@@ -4419,124 +4649,88 @@ async def atualizar_comandos_cmd(update: Update, context: ContextTypes.DEFAULT_T
         )
 
 async def reavaliar_pagamentos_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Reavalia pagamentos antigos com preços atuais da blockchain"""
+    """
+    Reavalia pagamentos aprovados com preços atuais da blockchain.
+    Uso: /reavaliar_pagamentos [dias|todos] [novo]
+    Roda em background, agrupado por chain e com checkpoint: um job
+    interrompido é retomado na próxima chamada (use "novo" para recomeçar).
+    """
     if not (update.effective_user and is_admin(update.effective_user.id)):
         return await update.effective_message.reply_text("❌ Apenas admins podem usar este comando.")
-    
+
+    from revalidation import PaymentRow, progress_text, revalidation_engine, summary_text
+
+    if revalidation_engine.running:
+        return await update.effective_message.reply_text(
+            progress_text(revalidation_engine.state) + "\n\n⏳ Já existe uma reavaliação em andamento.",
+            parse_mode="HTML"
+        )
+
     try:
+        args = [a.lower() for a in (context.args or [])]
+        checkpoint = revalidation_engine.load_checkpoint(cfg_get)
+        resume = bool(checkpoint and not checkpoint.get("finished") and "novo" not in args)
+
         with SessionLocal() as s:
-            # Buscar pagamentos aprovados dos últimos 30 dias
-            from datetime import datetime, timedelta
-            import pytz
-            
-            thirty_days_ago = datetime.now(pytz.UTC) - timedelta(days=30)
-            payments = s.query(Payment).filter(
-                Payment.status == "approved",
-                Payment.created_at >= thirty_days_ago
-            ).order_by(Payment.created_at.desc()).all()
-            
-            if not payments:
-                return await update.effective_message.reply_text(
-                    "📋 Nenhum pagamento aprovado encontrado nos últimos 30 dias."
-                )
-            
-            total_payments = len(payments)
-            await update.effective_message.reply_text(
-                f"🔄 <b>REAVALIAÇÃO DE PAGAMENTOS</b>\n\n"
-                f"📊 Encontrados: {total_payments} pagamentos\n"
-                f"⏳ Reavaliando com preços atuais...\n\n"
-                f"💡 Isso pode levar alguns segundos...",
-                parse_mode="HTML"
-            )
-            
-            upgraded_count = 0
-            unchanged_count = 0
-            error_count = 0
-            results = []
-            
-            for payment in payments[:10]:  # Limitar a 10 por vez para não sobrecarregar
+            query = s.query(Payment).filter(Payment.status == "approved")
+            if resume:
+                query = query.filter(Payment.id.in_(checkpoint["ids"]))
+                scope = checkpoint.get("scope", "")
+            elif "todos" in args:
+                scope = "todos"
+            else:
+                days = next((int(a) for a in args if a.isdigit()), 30)
+                query = query.filter(Payment.created_at >= now_utc() - dt.timedelta(days=days))
+                scope = f"{days} dias"
+            payments = query.order_by(Payment.created_at.desc()).all()
+
+            rows = []
+            for payment in payments:
+                # Prioridade: nome > @username > ID
+                if payment.first_name:
+                    user_label = payment.first_name
+                elif payment.username:
+                    user_label = f"@{payment.username}"
+                else:
+                    user_label = f"ID:{payment.user_id}"
                 try:
-                    from payments import resolve_payment_usd_autochain
-                    from utils import choose_plan_from_usd
-                    
-                    # Obter valor atual na blockchain
-                    ok, msg, current_usd, details = await resolve_payment_usd_autochain(
-                        payment.tx_hash, force_refresh=True
-                    )
-                    
-                    if ok and current_usd:
-                        # Calcular VIP atual vs VIP que seria atribuído agora
-                        current_days = payment.vip_days or 0
-                        new_days = choose_plan_from_usd(current_usd)
-                        old_usd = float(payment.usd_value) if payment.usd_value else 0
-                        
-                        short_hash = payment.tx_hash[:12] + "..."
-                        # Prioridade: nome > @username > ID
-                        if hasattr(payment, 'first_name') and payment.first_name:
-                            username_info = payment.first_name
-                        elif payment.username:
-                            username_info = f"@{payment.username}"
-                        else:
-                            username_info = f"ID:{payment.user_id}"
-                        
-                        if new_days and new_days > current_days:
-                            # Upgrade disponível!
-                            upgrade_days = new_days - current_days
-                            results.append({
-                                'type': 'upgrade',
-                                'hash': short_hash,
-                                'user': username_info,
-                                'old_usd': old_usd,
-                                'new_usd': current_usd,
-                                'old_days': current_days,
-                                'new_days': new_days,
-                                'upgrade_days': upgrade_days,
-                                'payment_id': payment.id
-                            })
-                            upgraded_count += 1
-                        else:
-                            # Sem mudança ou preço menor
-                            results.append({
-                                'type': 'unchanged',
-                                'hash': short_hash,
-                                'user': username_info,
-                                'old_usd': old_usd,
-                                'new_usd': current_usd,
-                                'days': current_days
-                            })
-                            unchanged_count += 1
-                    else:
-                        error_count += 1
-                        
-                except Exception as e:
-                    error_count += 1
-                    logging.warning(f"Erro ao reavaliar payment {payment.id}: {e}")
-            
-            # Mostrar resultados
-            msg_lines = [
-                f"📊 <b>RESULTADOS DA REAVALIAÇÃO</b>\n",
-                f"✅ Podem ser upgradados: {upgraded_count}",
-                f"➖ Sem mudança: {unchanged_count}", 
-                f"❌ Erros: {error_count}\n"
-            ]
-            
-            if upgraded_count > 0:
-                msg_lines.append(f"🚀 <b>UPGRADES DISPONÍVEIS:</b>\n")
-                for result in [r for r in results if r['type'] == 'upgrade'][:5]:
-                    msg_lines.append(
-                        f"💰 {result['hash']} ({result['user']})\n"
-                        f"   ${result['old_usd']:.2f} → ${result['new_usd']:.2f} USD\n"
-                        f"   {result['old_days']} → {result['new_days']} dias (+{result['upgrade_days']})\n"
-                    )
-                
-                if upgraded_count > 5:
-                    msg_lines.append(f"... e mais {upgraded_count - 5} upgrades\n")
-                    
-                msg_lines.append(f"💡 Use /aplicar_upgrades para aplicar os upgrades")
-            
-            msg_text = "\n".join(msg_lines)
-            await update.effective_message.reply_text(msg_text, parse_mode="HTML")
-            
+                    old_usd = float(payment.usd_value) if payment.usd_value else 0.0
+                except ValueError:
+                    old_usd = 0.0
+                rows.append(PaymentRow(
+                    id=payment.id,
+                    tx_hash=payment.tx_hash,
+                    chain_id=payment.chain,
+                    user_id=payment.user_id,
+                    user_label=user_label,
+                    usd_value=old_usd,
+                    vip_days=payment.vip_days or 0,
+                ))
+
+        if not rows:
+            return await update.effective_message.reply_text(
+                f"📋 Nenhum pagamento aprovado encontrado ({scope or 'checkpoint'})."
+            )
+
+        state = checkpoint if resume else revalidation_engine.new_state(rows, scope)
+        status_msg = await update.effective_message.reply_text(
+            progress_text(state) + ("\n\n♻️ Retomando do checkpoint..." if resume else f"\n\n⏳ Período: {scope}"),
+            parse_mode="HTML"
+        )
+
+        async def on_progress(current):
+            # Mesma mensagem editada no lugar (sem inundar o chat)
+            await status_msg.edit_text(progress_text(current), parse_mode="HTML")
+
+        async def on_done(final):
+            try:
+                await status_msg.edit_text(progress_text(final) + "\n\n✅ Concluído", parse_mode="HTML")
+            except Exception:
+                pass
+            await update.effective_message.reply_text(summary_text(final), parse_mode="HTML")
+
+        revalidation_engine.start(rows, state, cfg_set, progress=on_progress, on_done=on_done)
+
     except Exception as e:
         logging.exception("Erro ao reavaliar pagamentos")
         await update.effective_message.reply_text(f"❌ Erro ao reavaliar pagamentos: {e}")
@@ -4566,28 +4760,28 @@ async def atualizar_precos_cmd(update: Update, context: ContextTypes.DEFAULT_TYP
     )
     
     try:
-        from payments import _update_fallback_prices, FALLBACK_PRICES
+        from price_oracle import price_oracle
         
         # Capturar preços antes
-        old_btc = FALLBACK_PRICES.get("bitcoin", 0)
-        old_eth = FALLBACK_PRICES.get("ethereum", 0)
-        old_bnb = FALLBACK_PRICES.get("binancecoin", 0)
+        old_btc = price_oracle.get("bitcoin") or 0
+        old_eth = price_oracle.get("ethereum") or 0
+        old_bnb = price_oracle.get("binancecoin") or 0
         
-        # Atualizar
-        _update_fallback_prices()
+        # Atualizar (mesmo ciclo em lote do loop automático)
+        updated = await price_oracle.refresh()
         
         # Verificar mudanças
-        new_btc = FALLBACK_PRICES.get("bitcoin", 0)
-        new_eth = FALLBACK_PRICES.get("ethereum", 0)  
-        new_bnb = FALLBACK_PRICES.get("binancecoin", 0)
+        new_btc = price_oracle.get("bitcoin") or 0
+        new_eth = price_oracle.get("ethereum") or 0
+        new_bnb = price_oracle.get("binancecoin") or 0
         
         result_lines = [
-            "✅ <b>PREÇOS ATUALIZADOS</b>\n",
+            "✅ <b>PREÇOS ATUALIZADOS</b>\n" if updated else "⚠️ <b>NENHUM PREÇO ATUALIZADO</b> (mantido snapshot anterior)\n",
             f"₿ Bitcoin/BTCB: ${old_btc:,.0f} → ${new_btc:,.0f}",
             f"Ξ Ethereum: ${old_eth:,.0f} → ${new_eth:,.0f}",
             f"🔸 BNB: ${old_bnb:,.0f} → ${new_bnb:,.0f}",
             "",
-            "💡 Próxima atualização automática em 30 minutos."
+            f"💡 Próxima atualização automática em {max(1, price_oracle.interval // 60)} minuto(s)."
         ]
         
         await update.effective_message.reply_text(
@@ -5370,6 +5564,8 @@ async def novopack_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # =========================
 # Pagamento / Verificação on-chain (JSON-RPC)
 # =========================
+# Endpoint JSON-RPC da verificação simples (verify_tx_any); vazio = rpc_call recusa
+RPC_URL = os.getenv("RPC_URL", "").strip()
 HEX_0X = "0x"
 TRANSFER_TOPIC = "0x40dDBD27F878d07808339F9965f013F1CBc2F812"  # keccak("Transfer(address,address,uint256)")
 
@@ -5440,6 +5636,10 @@ def plan_from_amount(amount_usd: float) -> Optional[VipPlan]:
     #     return VipPlan.ANUAL       # 365 dias
 
 async def fetch_price_usd() -> Optional[float]:
+    from quota_budget import quota_budget
+    if not quota_budget.allow("coingecko"):
+        logging.info("Cota do CoinGecko sem folga - cotação USD adiada")
+        return None
     try:
         async with httpx.AsyncClient(timeout=15) as client:
             if TOKEN_CONTRACT:
@@ -5468,13 +5668,19 @@ async def fetch_price_usd() -> Optional[float]:
 async def rpc_call(method: str, params: list) -> Any:
     if not RPC_URL:
         raise RuntimeError("RPC_URL ausente")
-    async with httpx.AsyncClient(timeout=15) as client:
-        r = await client.post(RPC_URL, json={"jsonrpc": "2.0", "id": 1, "method": method, "params": params})
-        r.raise_for_status()
-        data = r.json()
-        if "error" in data:
-            raise RuntimeError(f"RPC error: {data['error']}")
-        return data.get("result")
+    from quota_budget import quota_budget
+    from rpc_client import endpoint_host, rpc_scoreboard
+    host = endpoint_host(RPC_URL)
+    if not quota_budget.allow(host):
+        raise RuntimeError(f"Cota do RPC {host} sem folga")
+    with rpc_scoreboard.measure(RPC_URL):
+        async with httpx.AsyncClient(timeout=15) as client:
+            r = await client.post(RPC_URL, json={"jsonrpc": "2.0", "id": 1, "method": method, "params": params})
+            r.raise_for_status()
+            data = r.json()
+            if "error" in data:
+                raise RuntimeError(f"RPC error: {data['error']}")
+            return data.get("result")
 
 async def verify_native_payment(tx_hash: str) -> Dict[str, Any]:
     tx = await rpc_call("eth_getTransactionByHash", [tx_hash])
@@ -5531,14 +5737,16 @@ async def verify_erc20_payment(tx_hash: str) -> Dict[str, Any]:
         return {"ok": False, "reason": f"Confirmações insuficientes ({confirmations}/{MIN_CONFIRMATIONS})"}
     return {"ok": True, "type": "erc20", "to": found["to"], "amount_raw": found["amount_raw"], "confirmations": confirmations}
 
-# Cache simples para evitar validações repetidas
-_HASH_CACHE = {}
+# Cache limitado (LRU + TTL) para evitar validações repetidas
+from cache import BoundedTTLCache
+_HASH_CACHE = BoundedTTLCache("verify_tx_any", max_entries=500, ttl=3600)
 
 async def verify_tx_any(tx_hash: str) -> Dict[str, Any]:
     # Verificar cache primeiro
-    if tx_hash in _HASH_CACHE:
+    cached = _HASH_CACHE.get(tx_hash)
+    if cached is not None:
         logging.info(f"Hash {tx_hash[:10]}... encontrada em cache")
-        return _HASH_CACHE[tx_hash]
+        return cached
     
     if TOKEN_CONTRACT:
         res = await verify_erc20_payment(tx_hash)
@@ -5560,14 +5768,8 @@ async def verify_tx_any(tx_hash: str) -> Dict[str, Any]:
         if plan_days is None:
             res["reason"] = res.get("reason") or "Valor não corresponde a nenhum plano"
     
-    # Cachear resultado
-    _HASH_CACHE[tx_hash] = res
-    # Limitar tamanho do cache
-    if len(_HASH_CACHE) > 100:
-        # Remover metade das entradas mais antigas
-        old_keys = list(_HASH_CACHE.keys())[:50]
-        for key in old_keys:
-            del _HASH_CACHE[key]
+    # Cachear resultado (LRU remove as entradas menos usadas ao atingir o limite)
+    _HASH_CACHE.set(tx_hash, res)
     
     return res
     
@@ -8634,19 +8836,67 @@ async def api_config(uid: str = None, ts: str = None, sig: str = None):
         logging.error(f"Erro em /api/config: {e}")
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
+async def _run_api_validation(uid, username: Optional[str], tx_hash: str, chain: Optional[str]) -> Dict[str, Any]:
+    """Trabalho pesado do /api/validate (roda num worker do validation_jobs)"""
+    import deadline
+    from payments import approve_by_usd_and_invite
+
+    try:
+        logging.info(f"[API-VALIDATE] Processando pagamento para UID: {uid}")
+        # Prazo da validação inteira: RPC, preços e banco limitam seus timeouts a ele
+        with deadline.budget(deadline.VALIDATION_DEADLINE_SECONDS):
+            ok, msg, payload = await approve_by_usd_and_invite(
+                uid, username, tx_hash, notify_user=True, chain_hint=chain
+            )
+        if ok:
+            return {
+                "ok": True,
+                "message": msg,
+                **payload  # Inclui invite, until, usd
+            }
+        pending = bool(payload.get("pending"))
+        # Pendente sem pending_tx (UID temporário): o próprio job reverifica e entrega o convite no SSE
+        recheck = pending and not payload.get("tracked")
+        if recheck:
+            msg = f"⏳ {msg}\nMantenha esta página aberta: o convite aparece aqui assim que a transação confirmar."
+        return {
+            "ok": False,
+            "message": msg,
+            "pending": pending,
+            "recheck": recheck,
+        }
+    except asyncio.TimeoutError:
+        logging.warning(f"[API-VALIDATE] Prazo esgotado ao validar {tx_hash[:12]}...")
+        return {
+            "ok": False,
+            "message": "A validação demorou demais. Tente novamente em alguns instantes.",
+        }
+    except Exception as validation_error:
+        logging.error(f"Erro na validação: {validation_error}")
+        return {
+            "ok": False,
+            "message": f"Erro na validação do pagamento: {str(validation_error)}"
+        }
+
+
 @app.post("/api/validate")
 async def api_validate(request: Request):
-    """Endpoint /api/validate para validar pagamentos"""
+    """
+    Endpoint /api/validate para validar pagamentos.
+    Enfileira a validação e responde 202 com o id do job na hora; o resultado
+    sai em GET /api/validate/{job_id} (SSE ou long-poll).
+    """
     try:
-        from payments import approve_by_usd_and_invite
-        
+        from validation_jobs import validation_jobs
+
         data = await request.json()
         uid = data.get("uid")
         username = data.get("username")
         hash = data.get("hash", "").strip()
+        chain = data.get("chain")  # Rede escolhida no webapp (opcional)
         
         # Log detalhado do que foi recebido
-        logging.info(f"[API-VALIDATE] Recebido - UID: {uid}, Username: {username}, Hash: {hash[:10] if hash else 'None'}...")
+        logging.info(f"[API-VALIDATE] Recebido - UID: {uid}, Username: {username}, Hash: {hash[:10] if hash else 'None'}..., Rede: {chain or 'auto'}")
         
         if not uid or not hash:
             raise HTTPException(status_code=400, detail="uid e hash são obrigatórios")
@@ -8666,30 +8916,19 @@ async def api_validate(request: Request):
         # Validação do hash
         if len(hash) < 40:
             return {"ok": False, "message": "Hash de transação inválido"}
-        
+
         try:
-            # Usar a função completa de aprovação com UID validado
-            logging.info(f"[API-VALIDATE] Processando pagamento para UID: {uid_int}")
-            ok, msg, payload = await approve_by_usd_and_invite(uid_int, username, hash, notify_user=True)
-            
-            if ok:
-                return {
-                    "ok": True,
-                    "message": msg,
-                    **payload  # Inclui invite, until, usd
-                }
-            else:
-                return {
-                    "ok": False,
-                    "message": msg
-                }
-            
-        except Exception as validation_error:
-            logging.error(f"Erro na validação: {validation_error}")
-            return {
-                "ok": False, 
-                "message": f"Erro na validação do pagamento: {str(validation_error)}"
-            }
+            job = validation_jobs.submit(
+                f"validate:{uid_int}:{hash.lower()}",
+                lambda: _run_api_validation(uid_int, username, hash, chain),
+            )
+        except asyncio.QueueFull:
+            raise HTTPException(status_code=503, detail="Muitas validações em andamento, tente novamente em instantes")
+
+        return JSONResponse(
+            status_code=202,
+            content={**job.to_dict(), "events": f"/api/validate/{job.id}"},
+        )
         
     except HTTPException:
         raise
@@ -8698,6 +8937,51 @@ async def api_validate(request: Request):
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
 
 
+@app.get("/api/validate/{job_id}")
+async def api_validate_status(job_id: str, request: Request):
+    """
+    Status de uma validação enfileirada.
+    - Accept: text/event-stream -> SSE com um evento "status" a cada mudança
+    - senão JSON; com ?wait=N (até 30s) segura a resposta até o job mudar (long-poll)
+    Job "pending" (reverificando sozinho) mantém o SSE aberto até terminar.
+    """
+    from validation_jobs import STATUS_PENDING, VALIDATION_PENDING_MAX_AGE, validation_jobs
+
+    job = validation_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Validação não encontrada ou expirada")
+
+    if "text/event-stream" in request.headers.get("accept", ""):
+        async def events():
+            started = time.monotonic()
+            version = -1
+            while time.monotonic() - started < (VALIDATION_PENDING_MAX_AGE if job.status == STATUS_PENDING else 120):
+                if job.version != version:
+                    version = job.version
+                    yield f"event: status\ndata: {json.dumps(job.to_dict(), default=str)}\n\n"
+                    if job.finished:
+                        return
+                if await request.is_disconnected():
+                    return
+                if not await job.wait_change(version, 15):
+                    yield ": ping\n\n"  # mantém a conexão viva atrás do proxy
+
+        return StreamingResponse(
+            events(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    try:
+        wait = min(float(request.query_params.get("wait", 0)), 30.0)
+    except ValueError:
+        wait = 0.0
+    since = request.query_params.get("version")
+    if wait > 0 and not job.finished:
+        await job.wait_change(int(since) if since and since.isdigit() else job.version, wait)
+    return job.to_dict()
+
+
 async def vip_expiration_warn_job(context: ContextTypes.DEFAULT_TYPE):
     """Sistema completo de avisos de expiração com botões de renovação"""
     now = now_utc()
@@ -9461,6 +9745,7 @@ async def on_startup():
         )
         # Callback do botão "Suporte"
         application.add_handler(CallbackQueryHandler(support_start_callback, pattern="^support_start$"), group=1)
+        application.add_handler(CallbackQueryHandler(listar_page_callback, pattern="^l[hv]:"), group=1)
         # Captura texto do usuário (antes de outros handlers de texto)
         application.add_handler(MessageHandler(
             filters.TEXT & ~filters.COMMAND & filters.ChatType.PRIVATE,
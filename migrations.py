@@ -0,0 +1,156 @@
+# migrations.py
+import logging
+import re
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterable, List, Optional, Sequence, Set
+
+LOG = logging.getLogger(__name__)
+
+# Tabela com uma linha por migração aplicada
+SCHEMA_VERSION_TABLE = "schema_version"
+
+_INDEX_NAME = re.compile(r"CREATE\s+INDEX\s+(?:CONCURRENTLY\s+)?(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", re.I)
+
+
+class IncompleteMigration(RuntimeError):
+    """
+    Migração aplicada só em parte (ex.: índice que falhou). Não é registrada
+    em schema_version e roda de novo no próximo boot; as seguintes seguem.
+    """
+
+
+@dataclass(frozen=True)
+class Migration:
+    """Um passo de schema; apply(engine) precisa ser idempotente (reexecutável)"""
+    version: int
+    name: str
+    apply: Callable[[Any], None]
+
+
+def create_indexes(engine: Any, statements: Iterable[str]):
+    """
+    Cria índices no formato "CREATE INDEX IF NOT EXISTS ...". No Postgres usa
+    CREATE INDEX CONCURRENTLY (fora de transação, sem travar escrita nas
+    tabelas); um índice que falhar no meio é removido para não ficar INVALID
+    e ser pulado pelo IF NOT EXISTS na próxima tentativa. Falhas não param
+    os demais índices, mas no fim geram IncompleteMigration (versão não
+    registrada, nova tentativa no próximo boot).
+    """
+    from sqlalchemy import text
+
+    postgres = engine.url.get_backend_name() == "postgresql"
+    failed: List[str] = []
+    for sql in statements:
+        name_match = _INDEX_NAME.search(sql)
+        name = name_match.group(1) if name_match else "?"
+        if postgres:
+            sql = re.sub(r"CREATE\s+INDEX\s+(?!CONCURRENTLY)", "CREATE INDEX CONCURRENTLY ", sql, count=1, flags=re.I)
+        try:
+            if postgres:
+                with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                    conn.execute(text(sql))
+            else:
+                with engine.begin() as conn:
+                    conn.execute(text(sql))
+            LOG.debug(f"[MIGRATE] Índice criado/verificado: {name}")
+        except Exception as e:
+            # Tabela ainda inexistente, coluna diferente etc.: não bloqueia os demais
+            LOG.warning(f"[MIGRATE] Falha ao criar índice {name}: {e}")
+            failed.append(name)
+            if postgres and name_match:
+                try:
+                    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+                except Exception as drop_error:
+                    LOG.debug(f"[MIGRATE] Falha ao remover índice inválido {name}: {drop_error}")
+    if failed:
+        raise IncompleteMigration(f"índices não criados: {', '.join(failed)}")
+
+
+class MigrationRunner:
+    """
+    Aplica migrações em ordem de versão e registra cada uma em schema_version.
+
+    Com o banco em dia o boot custa um único SELECT (as versões
+    registradas); create_all, inspect e ALTERs só rodam quando há migração
+    pendente. Uma migração que termina em IncompleteMigration fica sem
+    registro e é reaplicada no próximo boot, sem bloquear as seguintes;
+    qualquer outro erro interrompe a execução. Migrações são idempotentes:
+    se duas instâncias subirem juntas (deploy com sobreposição) as duas
+    podem aplicar o mesmo passo sem erro, e o registro duplicado da versão
+    é ignorado.
+    """
+
+    def __init__(self, migrations: Sequence[Migration]):
+        self.migrations: List[Migration] = sorted(migrations, key=lambda m: m.version)
+        versions = [m.version for m in self.migrations]
+        if len(set(versions)) != len(versions):
+            raise ValueError("versões de migração repetidas")
+
+    @property
+    def latest(self) -> int:
+        return self.migrations[-1].version if self.migrations else 0
+
+    @staticmethod
+    def applied_versions(engine: Any) -> Optional[Set[int]]:
+        """Versões registradas; None se a tabela schema_version ainda não existir"""
+        from sqlalchemy import text
+
+        try:
+            with engine.connect() as conn:
+                return {row[0] for row in conn.execute(text(f"SELECT version FROM {SCHEMA_VERSION_TABLE}"))}
+        except Exception:
+            return None
+
+    @staticmethod
+    def _ensure_table(engine: Any):
+        from sqlalchemy import text
+
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} ("
+                f"version INTEGER PRIMARY KEY, "
+                f"name VARCHAR(100) NOT NULL, "
+                f"applied_at TIMESTAMP NOT NULL)"
+            ))
+
+    @staticmethod
+    def _record(engine: Any, migration: Migration):
+        from sqlalchemy import text
+
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    text(f"INSERT INTO {SCHEMA_VERSION_TABLE} (version, name, applied_at) VALUES (:v, :n, :t)"),
+                    {"v": migration.version, "n": migration.name, "t": datetime.now(timezone.utc).replace(tzinfo=None)},
+                )
+        except Exception as e:
+            # Outra instância registrou a mesma versão primeiro
+            LOG.debug(f"[MIGRATE] Versão {migration.version} já registrada: {e}")
+
+    def run(self, engine: Any) -> int:
+        """Aplica as migrações pendentes; retorna quantas foram aplicadas por completo"""
+        done = self.applied_versions(engine)
+        pending = [m for m in self.migrations if done is None or m.version not in done]
+        if not pending:
+            LOG.info(f"[MIGRATE] Schema em dia (versão {self.latest})")
+            return 0
+
+        if done is None:
+            self._ensure_table(engine)
+        applied = 0
+        for migration in pending:
+            started = time.monotonic()
+            LOG.info(f"[MIGRATE] Aplicando {migration.version} ({migration.name})...")
+            try:
+                migration.apply(engine)
+            except IncompleteMigration as e:
+                LOG.warning(f"[MIGRATE] ⚠️ {migration.version} ({migration.name}) incompleta, "
+                            f"repete no próximo boot: {e}")
+                continue
+            self._record(engine, migration)
+            applied += 1
+            LOG.info(f"[MIGRATE] ✅ {migration.version} ({migration.name}) em {time.monotonic() - started:.2f}s")
+        return applied
@@ -1,6 +1,6 @@
 from __future__ import annotations
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import String, Integer, BigInteger, Boolean, DateTime, Text, Time
+from sqlalchemy import String, Integer, BigInteger, Boolean, DateTime, Text, Time, UniqueConstraint
 from datetime import datetime, timezone, time as dtime
 
 from typing import Optional
@@ -90,4 +90,79 @@ class FreeGroupMember(Base):
     first_name: Mapped[Optional[str]] = mapped_column(String(120), nullable=True)
     joined_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
-    )
\ No newline at end of file
+    )
+
+class TokenMetadata(Base):
+    """Metadados de tokens ERC-20 vistos em pagamentos (chave chain:endereço)"""
+    __tablename__ = "token_metadata"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    token_key: Mapped[str] = mapped_column(String(120), unique=True, index=True, nullable=False)
+    chain_id: Mapped[str] = mapped_column(String(20), nullable=False)
+    address: Mapped[str] = mapped_column(String(64), nullable=False)
+    decimals: Mapped[int] = mapped_column(Integer, default=18, nullable=False)
+    symbol: Mapped[str] = mapped_column(String(32), default="TOKEN", nullable=False)
+    cg_id: Mapped[Optional[str]] = mapped_column(String(80), nullable=True)
+    strategy: Mapped[str] = mapped_column(String(20), default="contract", nullable=False)  # pegged, native, contract
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
+class IncomingPayment(Base):
+    """Transferências recebidas na carteira, indexadas pelo wallet_watcher"""
+    __tablename__ = "incoming_payments"
+    __table_args__ = (UniqueConstraint("chain_id", "tx_hash", "log_index", name="uq_incoming_chain_tx_log"),)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    chain_id: Mapped[str] = mapped_column(String(20), nullable=False)
+    tx_hash: Mapped[str] = mapped_column(String(80), index=True, nullable=False)
+    log_index: Mapped[int] = mapped_column(Integer, default=-1, nullable=False)  # -1 = transferência nativa
+    kind: Mapped[str] = mapped_column(String(10), nullable=False)  # native, erc20
+    token_address: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    from_address: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    amount_raw: Mapped[str] = mapped_column(String(80), nullable=False)  # uint256 em decimal
+    block_number: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
+
+
+class WatcherCheckpoint(Base):
+    """Último bloco varrido pelo wallet_watcher por chain e fluxo (logs/native)"""
+    __tablename__ = "watcher_checkpoints"
+    __table_args__ = (UniqueConstraint("chain_id", "stream", name="uq_watcher_chain_stream"),)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    chain_id: Mapped[str] = mapped_column(String(20), nullable=False)
+    stream: Mapped[str] = mapped_column(String(10), nullable=False)
+    last_block: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
+class PendingTx(Base):
+    """Transações ainda não encontradas/confirmadas, reverificadas pelo pending_tx com backoff"""
+    __tablename__ = "pending_txs"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    tx_hash: Mapped[str] = mapped_column(String(80), unique=True, index=True, nullable=False)
+    chain_id: Mapped[Optional[str]] = mapped_column(String(20), nullable=True)  # None = chain ainda desconhecida
+    chain_hint: Mapped[Optional[str]] = mapped_column(String(20), nullable=True)
+    tg_id: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)  # UID real ou temporário
+    username: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    status: Mapped[str] = mapped_column(String(20), default="waiting", index=True, nullable=False)  # waiting, approved, failed, expired
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    last_reason: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    next_check_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
+class QuotaUsage(Base):
+    """Requisições gastas por provedor (API/RPC) em cada janela de cota"""
+    __tablename__ = "quota_usage"
+    __table_args__ = (UniqueConstraint("provider", "window_seconds", "window_start", name="uq_quota_window"),)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    provider: Mapped[str] = mapped_column(String(120), nullable=False)
+    window_seconds: Mapped[int] = mapped_column(Integer, nullable=False)
+    window_start: Mapped[int] = mapped_column(BigInteger, index=True, nullable=False)  # epoch (s)
+    count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
@@ -5,11 +5,25 @@ import logging
 import os
 import time
 from contextlib import suppress
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 import httpx
 from web3 import Web3
 
+import deadline
+from rpc_client import ChainRpcClient, rpc_pool
+from chain_planner import chain_planner
+from chain_head import head_tracker
+from token_registry import STRATEGY_PEGGED, TokenInfo, strategy_for, token_registry
+from price_oracle import price_oracle
+from singleflight import SingleFlight
+from cache import BoundedTTLCache
+from wallet_watcher import wallet_watcher
+from pending_tx import ClaimedByOther, pending_tracker
+from quota_budget import quota_budget, retry_after
+from used_hashes import used_hashes
+from async_db import async_db
+
 LOG = logging.getLogger("payments")
 
 # Preços centralizados — altere SOMENTE em config.py
@@ -26,22 +40,25 @@ if WALLET_ADDRESS and not WALLET_ADDRESS.startswith("0x"):
 MIN_CONFIRMATIONS = int(os.getenv("MIN_CONFIRMATIONS", "1"))  # aumente em produção
 DEBUG_PAYMENTS = os.getenv("DEBUG_PAYMENTS", "0") == "1"
 ALLOW_ANY_TO = os.getenv("ALLOW_ANY_TO", "0") == "1"  # aceita destino diferente (somente testes)
+AUTOCHAIN_TIMEOUT = float(os.getenv("AUTOCHAIN_TIMEOUT", "15"))  # prazo da busca em todas as chains
 
-COINGECKO_API_KEY = os.getenv("COINGECKO_API_KEY", "").strip()
-PRICE_TTL_SECONDS = int(os.getenv("PRICE_TTL_SECONDS", "14400"))  # 4 horas (14400s) para escalar sem custos - otimizado para 100+ tx/min
-PRICE_EXTENDED_TTL_SECONDS = int(os.getenv("PRICE_EXTENDED_TTL_SECONDS", "3600"))  # 1h para casos de rate limit severo
-PRICE_MAX_RETRIES = int(os.getenv("PRICE_MAX_RETRIES", "2"))    # Reduzido de 3 para 2
-PRICE_RETRY_BASE_DELAY = float(os.getenv("PRICE_RETRY_BASE_DELAY", "5.0"))  # 5s base delay para rate limiting
-
-# Cache simples em memória: key -> (price, ts)
-_PRICE_CACHE: Dict[str, Tuple[float, float]] = {}
-
-# Cache de transações validadas: hash -> (timestamp, result_tuple)
-# Evita re-validar a mesma transação múltiplas vezes
-_TX_VALIDATION_CACHE: Dict[str, Tuple[float, Tuple[bool, str, Optional[float], Dict[str, Any]]]] = {}
 TX_VALIDATION_TTL = int(os.getenv("TX_VALIDATION_TTL", "3600"))  # 1 hora de cache para transações validadas
-
-# Preços de fallback: atualizados dinamicamente no startup para tokens principais
+TX_VALIDATION_MAX_ENTRIES = int(os.getenv("TX_VALIDATION_MAX_ENTRIES", "5000"))
+# Aprovação reaproveita validação positiva com até esta idade (segundos) em vez de refazer a busca
+APPROVAL_REUSE_SECONDS = float(os.getenv("APPROVAL_REUSE_SECONDS", "300"))
+PRICE_SNAPSHOT_TTL = int(os.getenv("PRICE_SNAPSHOT_TTL", "21600"))  # 6h: preços vivos restaurados após reinício
+# Idade máxima de um preço vivo para aprovar pagamento; acima disso (ou só estático/restaurado) fica pendente
+PRICE_MAX_AGE_SECONDS = float(os.getenv("PRICE_MAX_AGE_SECONDS", "900"))
+
+# Cache de transações validadas: hash -> [ok, msg, usd, details]
+# Evita re-validar a mesma transação múltiplas vezes (limitado + snapshot em disco)
+_TX_VALIDATION_CACHE = BoundedTTLCache(
+    "tx_validation", max_entries=TX_VALIDATION_MAX_ENTRIES, ttl=TX_VALIDATION_TTL, persist=True
+)
+# Últimos preços vivos do oráculo, restaurados no startup antes do primeiro ciclo
+_PRICE_CACHE = BoundedTTLCache("prices", max_entries=2000, ttl=PRICE_SNAPSHOT_TTL, persist=True)
+
+# Preços de fallback: semente do price_oracle (usados até a primeira atualização)
 FALLBACK_PRICES = {
     # Tokens nativos principais - atualizados automaticamente com preços de mercado atuais (Janeiro 2025)
     "ethereum": 4378.48,
@@ -85,166 +102,8 @@ FALLBACK_PRICE_META: Dict[str, Dict[str, Any]] = {
 }
 
 
-def _update_fallback_prices() -> None:
-    """Atualiza preços de fallback principais a partir do CoinGecko."""
-    
-    # Lista de tokens para atualizar automaticamente
-    price_updates = [
-        {
-            "cg_id": "bitcoin", 
-            "keys": ["bitcoin", "0x38:0x7130d2a12b9bcbfae4f2634d864a1ee1ce3ead9c"],  # BTC/BTCB
-            "name": "Bitcoin/BTCB"
-        },
-        {
-            "cg_id": "ethereum",
-            "keys": ["ethereum"],
-            "name": "Ethereum"
-        },
-        {
-            "cg_id": "binancecoin", 
-            "keys": ["binancecoin"],
-            "name": "BNB"
-        },
-        {
-            "cg_id": "polygon-pos",
-            "keys": ["polygon-pos"],
-            "name": "Polygon"
-        },
-        {
-            "cg_id": "avalanche-2",
-            "keys": ["avalanche-2"],
-            "name": "Avalanche"
-        },
-        {
-            "cg_id": "fantom",
-            "keys": ["fantom"],
-            "name": "Fantom"
-        },
-        {
-            "cg_id": "crypto-com-chain",
-            "keys": ["crypto-com-chain"],
-            "name": "Cronos"
-        },
-        {
-            "cg_id": "celo",
-            "keys": ["celo"],
-            "name": "Celo"
-        },
-        {
-            "cg_id": "moonbeam",
-            "keys": ["moonbeam"],
-            "name": "Moonbeam"
-        },
-        {
-            "cg_id": "moonriver",
-            "keys": ["moonriver"],
-            "name": "Moonriver"
-        },
-        {
-            "cg_id": "mantle",
-            "keys": ["mantle"],
-            "name": "Mantle"
-        },
-        {
-            "cg_id": "apecoin",
-            "keys": ["apecoin"],
-            "name": "ApeCoin"
-        }
-    ]
-    
-    # Construir URL com múltiplas moedas
-    coin_ids = [item["cg_id"] for item in price_updates]
-    url = f"https://api.coingecko.com/api/v3/simple/price?ids={','.join(coin_ids)}&vs_currencies=usd"
-    
-    try:
-        r = httpx.get(url, timeout=15)
-        if r.status_code == 200:
-            data = r.json()
-            updated_count = 0
-            
-            for item in price_updates:
-                cg_id = item["cg_id"]
-                if cg_id in data and "usd" in data[cg_id]:
-                    px = float(data[cg_id]["usd"])
-                    
-                    # Atualizar todas as chaves para este token
-                    for key in item["keys"]:
-                        old_price = FALLBACK_PRICES.get(key, 0)
-                        FALLBACK_PRICES[key] = px
-                        FALLBACK_PRICE_META[key] = {"source": "coingecko_auto", "ts": time.time()}
-                        updated_count += 1
-                        
-                        LOG.info(
-                            "[AUTO-UPDATE] %s: $%.2f -> $%.2f (key: %s)",
-                            item["name"], old_price, px, key
-                        )
-            
-            LOG.info(
-                "[AUTO-UPDATE] Atualizados %d preços de fallback em %s",
-                updated_count,
-                time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
-            )
-        elif r.status_code == 429:
-            LOG.warning("[AUTO-UPDATE] Rate limit (429) - tentando novamente mais tarde")
-        else:
-            LOG.warning("[AUTO-UPDATE] CoinGecko erro %d", r.status_code)
-            
-    except Exception as exc:
-        LOG.warning("[AUTO-UPDATE] Falha ao atualizar preços de fallback: %s", exc)
-
-
-# Atualizar preços de fallback no startup
-_update_fallback_prices()
-
-
-# =========================
-# Atualização Periódica de Preços de Fallback
-# =========================
-import threading
-
-def _periodic_price_update():
-    """Atualiza preços de fallback a cada 2 horas (reduzido para evitar rate limit)"""
-    while True:
-        try:
-            time.sleep(7200)  # 2 horas (reduzido de 30min para evitar 429)
-            LOG.info("[PERIODIC] Iniciando atualização automática de preços...")
-            _update_fallback_prices()
-        except Exception as e:
-            LOG.error("[PERIODIC] Erro na atualização automática: %s", e)
-
-# Iniciar thread em background para atualizações periódicas
-_update_thread = threading.Thread(target=_periodic_price_update, daemon=True)
-_update_thread.start()
-LOG.info("[PERIODIC] Thread de atualização automática de preços iniciada")
-
-
-def _price_cache_get(key: str, force_refresh: bool = False, allow_extended: bool = False) -> Optional[float]:
-    """Obter preço do cache com TTL configurável"""
-    if force_refresh and not allow_extended:
-        return None
-    item = _PRICE_CACHE.get(key)
-    if not item:
-        return None
-    price, ts = item
-    age = time.time() - ts
-    
-    # TTL normal (30 min)
-    if age <= PRICE_TTL_SECONDS:
-        LOG.info(f"[CACHE-HIT] {key}: ${price:.2f} (idade: {int(age/60)}min)")
-        return price
-    
-    # TTL extendido para casos de rate limit (1 hora)
-    if allow_extended and age <= PRICE_EXTENDED_TTL_SECONDS:
-        LOG.info(f"[CACHE-EXTENDED] {key}: ${price:.2f} (idade: {int(age/60)}min)")
-        return price
-    
-    return None
-
-def _price_cache_put(key: str, price: float, from_backup: bool = False) -> None:
-    """Armazenar preço no cache com timestamp"""
-    _PRICE_CACHE[key] = (price, time.time())
-    source = "backup-api" if from_backup else "coingecko"
-    LOG.info(f"[CACHE-PUT] {key}: ${price:.2f} (fonte: {source})")
+# Snapshot inicial do oráculo: preços estáticos até o primeiro ciclo de atualização
+price_oracle.seed(FALLBACK_PRICES)
 
 
 # =========================
@@ -392,51 +251,96 @@ KNOWN_TOKEN_SYMBOLS = {
     "0xc2132d05d31c914a87c6611c10748aeb04b58e8f": "USDT",     # USDT na Polygon
 }
 
+# Decimals dos tokens conhecidos (evita eth_call de decimals())
+KNOWN_TOKEN_DECIMALS = {
+    "0x38:0x7130d2a12b9bcbfae4f2634d864a1ee1ce3ead9c": 18,    # BTCB na BSC
+    "0x1:0xdac17f958d2ee523a2206206994597c13d831ec7": 6,      # USDT na Ethereum
+    "0x38:0x55d398326f99059ff775485246999027b3197955": 18,    # USDT na BSC
+    "0x89:0xc2132d05d31c914a87c6611c10748aeb04b58e8f": 6,     # USDT na Polygon
+    "0x1:0xa0b86991c6e31cc170c8b9e71b51e1a53af4e9b8c9e": 6,   # USDC na Ethereum
+    "0x38:0x8ac76a51cc950d9822d68b83fe1ad97b32cd580d": 18,    # USDC na BSC
+    "0x89:0x2791bca1f2de4661ed88a30c99a7a9449aa84174": 6,     # USDC na Polygon
+    "0xa4b1:0xaf88d065e77c8cc2239327c5edb3a432268e5831": 6,   # USDC na Arbitrum
+    "0xa:0x0b2c639c533813f4aa9d7837caf62653d097ff85": 6,      # USDC na Optimism
+    "0x2105:0x833589fcd6edb6e08f4c7c32d4f71b54bda02913": 6,   # USDC na Base
+}
+
+# Semente do registro de tokens (o banco complementa/atualiza no startup)
+token_registry.seed(
+    TokenInfo(
+        chain_id=key.split(":", 1)[0],
+        address=key.split(":", 1)[1],
+        decimals=KNOWN_TOKEN_DECIMALS.get(key, 18),
+        symbol=KNOWN_TOKEN_SYMBOLS.get(key.split(":", 1)[1], "TOKEN"),
+        cg_id=cg_id,
+        strategy=strategy_for(cg_id),
+    )
+    for key, cg_id in KNOWN_TOKEN_TO_CGID.items()
+)
+
 
 # =========================
-# Utilitários Web3
+# Utilitários JSON-RPC
 # =========================
-def _w3(rpc: str) -> Web3:
-    """Cria instância Web3 com timeout configurado"""
-    from web3.middleware import geth_poa_middleware
-    
-    # HTTPProvider com timeout menor para RPCs lentos
-    provider = Web3.HTTPProvider(rpc, request_kwargs={'timeout': 12})
-    w3 = Web3(provider)
-    
-    # Middleware para chains PoA (BSC, Polygon, etc)
-    if any(chain in rpc.lower() for chain in ['bsc', 'polygon', 'bnb', 'binance']):
-        w3.middleware_onion.inject(geth_poa_middleware, layer=0)
-    
-    return w3
-
-async def _try_get_transaction_with_backup(chain_id: str, tx_hash: str) -> Optional[Any]:
-    """Tenta buscar transação no RPC principal e backups"""
+def _chain_endpoints(chain_id: str) -> List[str]:
+    """RPC principal seguido dos backups da chain"""
     meta = CHAINS[chain_id]
-    rpcs_to_try = [meta['rpc']] + meta.get('backup_rpcs', [])
-    chain_name = human_chain(chain_id)
+    return [meta['rpc']] + meta.get('backup_rpcs', [])
 
-    for i, rpc in enumerate(rpcs_to_try):
-        try:
-            rpc_type = "principal" if i == 0 else f"backup-{i}"
-            LOG.info(f"[{chain_name}] Tentando RPC {rpc_type}: {rpc[:50]}...")
 
-            w3 = _w3(rpc)
-            tx = await asyncio.wait_for(
-                asyncio.to_thread(w3.eth.get_transaction, tx_hash),
-                timeout=2.0  # Reduzido para 2s para validação rápida
-            )
+def _rpc(chain_id: str) -> ChainRpcClient:
+    """Cliente JSON-RPC assíncrono (pool keep-alive) da chain"""
+    return rpc_pool.get(chain_id, _chain_endpoints(chain_id))
 
-            if tx and hasattr(tx, 'hash') and tx.hash:
-                LOG.info(f"[{chain_name}] ✅ Transação encontrada via RPC {rpc_type}!")
-                return tx, w3
 
-        except asyncio.TimeoutError:
-            LOG.warning(f"[{chain_name}] Timeout RPC {rpc_type} (>2s)")
-        except Exception as e:
-            error_str = str(e).lower()
-            if "transaction not found" not in error_str and "not found" not in error_str:
-                LOG.warning(f"[{chain_name}] Erro RPC {rpc_type}: {str(e)[:80]}")
+def _to_int(value: Any) -> int:
+    """Converte quantidade JSON-RPC ("0x..." ou int) para int"""
+    if value is None:
+        return 0
+    if isinstance(value, int):
+        return value
+    value = str(value)
+    return int(value, 16) if value.startswith(("0x", "0X")) else int(value)
+
+
+async def _try_get_transaction_with_backup(
+    chain_id: str, tx_hash: str
+) -> Optional[Tuple[Dict[str, Any], ChainRpcClient, Dict[str, Any]]]:
+    """
+    Tenta buscar transação no RPC principal e backups.
+
+    Tx, receipt e bloco atual vão num único batch JSON-RPC: se a tx existir,
+    _resolve_on_chain já recebe tudo o que precisa sem novos round-trips.
+    O bloco atual é omitido quando o head_tracker já tem um valor recente.
+    """
+    chain_name = human_chain(chain_id)
+    rpc = _rpc(chain_id)
+
+    # Bloco atual só entra no batch se o head_tracker não tiver um recente
+    latest = head_tracker.peek(chain_id)
+    calls = [
+        ("eth_getTransactionByHash", [tx_hash]),
+        ("eth_getTransactionReceipt", [tx_hash]),
+    ]
+    if latest is None:
+        calls.append(("eth_blockNumber", []))
+
+    try:
+        results = await rpc.batch(calls, require_first=True)
+    except Exception as e:
+        LOG.warning(f"[{chain_name}] Erro RPC: {str(e)[:80]}")
+        return None
+
+    if not results:
+        return None
+    tx, receipt = results[0], results[1]
+    if latest is None and len(results) > 2 and results[2] is not None:
+        latest = _to_int(results[2])
+        head_tracker.observe(chain_id, latest)
+    if tx and tx.get("hash"):
+        LOG.info(f"[{chain_name}] ✅ Transação encontrada!")
+        prefetched = {"receipt": receipt, "latest_block": latest}
+        return tx, rpc, prefetched
 
     return None
 
@@ -448,10 +352,14 @@ def _topic_addr(topic_hex: str) -> str:
     return Web3.to_checksum_address("0x" + topic_hex[-40:])
 
 
-async def _get_confirmations(w3: Web3, block_number: Optional[int]) -> int:
+async def _get_confirmations(rpc: ChainRpcClient, block_number: Optional[int], latest: Optional[int] = None) -> int:
     if block_number is None:
         return 0
-    latest = w3.eth.block_number
+    if latest is None:
+        latest = await head_tracker.latest(rpc)
+    # A tx minerada prova que o head é pelo menos o bloco dela
+    head_tracker.observe(rpc.chain_id, block_number)
+    latest = max(latest, block_number)
     return max(0, latest - block_number)
 
 
@@ -489,160 +397,80 @@ BACKUP_PRICE_APIS = {
 }
 
 async def _try_backup_apis(asset: str) -> Optional[float]:
-    """Tenta obter preço via APIs GRATUITAS (Binance, Kraken)"""
-
-    # 1) Tentar Binance primeiro (rápida e confiável)
-    if asset in BACKUP_PRICE_APIS["binance"]["pairs"]:
-        pair = BACKUP_PRICE_APIS["binance"]["pairs"][asset]
-        url = BACKUP_PRICE_APIS["binance"]["url_template"].format(pair=pair)
-        try:
-            LOG.info(f"[BINANCE] Consultando Binance para {asset} ({pair})...")
-            async with httpx.AsyncClient(timeout=5) as cli:
-                r = await cli.get(url)
-                if r.status_code == 200:
-                    data = r.json()
-                    price = BACKUP_PRICE_APIS["binance"]["parser"](data)
-                    if price and price > 0:
-                        price = float(price)
-                        LOG.info(f"[BINANCE] ✅ {asset} = ${price:.2f}")
-                        return price
-                else:
-                    LOG.warning(f"[BINANCE] HTTP {r.status_code}")
-        except Exception as e:
-            LOG.warning(f"[BINANCE] Erro: {str(e)[:60]}")
-
-    # 2) Tentar Kraken como backup
-    if asset in BACKUP_PRICE_APIS["kraken"]["pairs"]:
-        pair = BACKUP_PRICE_APIS["kraken"]["pairs"][asset]
-        url = BACKUP_PRICE_APIS["kraken"]["url_template"].format(pair=pair)
+    """
+    Tenta obter preço via APIs GRATUITAS (Binance, Kraken).
+    A ordem respeita o livro de cotas: provedor sem folga (ou que acabou de
+    responder 429) é pulado em vez de arriscar um bloqueio. Dentro de uma
+    validação, o próximo provedor só é tentado se ainda couber no prazo.
+    """
+    for provider in quota_budget.order(["binance", "kraken"]):
+        api = BACKUP_PRICE_APIS[provider]
+        tag = provider.upper()
+        if asset not in api["pairs"]:
+            continue
+        if not deadline.can_afford():
+            LOG.info(f"[{tag}] Sem prazo para consultar {asset} - desistindo")
+            break
+        if not quota_budget.allow(provider):
+            LOG.info(f"[{tag}] Cota sem folga - pulando {asset}")
+            continue
+        pair = api["pairs"][asset]
+        url = api["url_template"].format(pair=pair)
         try:
-            LOG.info(f"[KRAKEN] Consultando Kraken para {asset} ({pair})...")
-            async with httpx.AsyncClient(timeout=5) as cli:
+            LOG.info(f"[{tag}] Consultando {provider.capitalize()} para {asset} ({pair})...")
+            async with httpx.AsyncClient(timeout=deadline.clamp(5.0)) as cli:
                 r = await cli.get(url)
                 if r.status_code == 200:
                     data = r.json()
-                    price = BACKUP_PRICE_APIS["kraken"]["parser"](data)
+                    price = api["parser"](data)
                     if price and price > 0:
                         price = float(price)
-                        LOG.info(f"[KRAKEN] ✅ {asset} = ${price:.2f}")
+                        LOG.info(f"[{tag}] ✅ {asset} = ${price:.2f}")
                         return price
+                elif r.status_code in (418, 429):
+                    quota_budget.note_rate_limited(provider, retry_after(r.headers))
                 else:
-                    LOG.warning(f"[KRAKEN] HTTP {r.status_code}")
+                    LOG.warning(f"[{tag}] HTTP {r.status_code}")
         except Exception as e:
-            LOG.warning(f"[KRAKEN] Erro: {str(e)[:60]}")
+            LOG.warning(f"[{tag}] Erro: {str(e)[:60]}")
 
     LOG.warning(f"[BACKUP] Todas as APIs gratuitas falharam para {asset}")
     return None
 
-async def _cg_get(url: str) -> Optional[dict]:
-    headers = {}
-    if COINGECKO_API_KEY:
-        headers["x-cg-pro-api-key"] = COINGECKO_API_KEY
-
-    delay = PRICE_RETRY_BASE_DELAY
-    last_err = None
-    
-    # Delay inicial inteligente baseado na situação da API
-    if not COINGECKO_API_KEY:  # Free tier - muito conservativo
-        await asyncio.sleep(10.0)  # 10s inicial
-    else:
-        await asyncio.sleep(3.0)  # API key ainda conservativo
-    
-    for attempt in range(1, PRICE_MAX_RETRIES + 1):
-        try:
-            async with httpx.AsyncClient(timeout=12) as cli:
-                r = await cli.get(url, headers=headers)
-            if r.status_code == 200:
-                return r.json()
-            if r.status_code == 429:
-                LOG.warning("Coingecko 429 (rate-limit). attempt=%d url=%s", attempt, url)
-                # Para rate limiting severo, desistir mais rápido e usar fallbacks
-                if attempt >= 2:  # Após 2 tentativas, desistir
-                    LOG.warning(f"[RATE-LIMIT] Desistindo do CoinGecko após {attempt} tentativas (429), usando fallbacks")
-                    break
-                
-                rate_limit_delay = 20 if COINGECKO_API_KEY else 30  # Delay fixo menor
-                LOG.warning(f"[RATE-LIMIT] Rate limited! Aguardando {rate_limit_delay}s (attempt {attempt}/{PRICE_MAX_RETRIES})")
-                await asyncio.sleep(rate_limit_delay)
-                continue
-            last_err = f"{r.status_code} {r.text[:100]}"
-            await asyncio.sleep(min(delay, 30))  # Cap de 30s
-            delay *= 2
-        except Exception as e:
-            last_err = str(e)[:100]
-            await asyncio.sleep(min(delay, 20))  # Cap menor para outros erros
-            delay *= 2
-
-    LOG.warning("Coingecko GET falhou após retries: %s", last_err)
-    return None
+def _oracle_price(key: str) -> Optional[float]:
+    """
+    Preço do snapshot do oráculo (sem HTTP). None se não houver preço vivo
+    com até PRICE_MAX_AGE_SECONDS: estático, restaurado do disco ou antigo
+    não servem para aprovar pagamento.
+    """
+    px = price_oracle.get(key)
+    if px is None:
+        return None
+    age = price_oracle.age(key)
+    if age > PRICE_MAX_AGE_SECONDS:
+        if price_oracle.source(key) == "manual":
+            meta = FALLBACK_PRICE_META.get(key, {})
+            ts = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(meta.get("ts", 0)))
+            LOG.warning(f"[STATIC-FALLBACK] Oráculo sem preço vivo p/ {key} (estático ${px:.2f}, ts={ts}) - ignorando")
+        else:
+            LOG.warning(f"[PRICE] Preço de {key} desatualizado ({age:.0f}s, fonte {price_oracle.source(key)}) - ignorando")
+        return None
+    return float(px)
 
 
 async def _usd_native(chain_id: str, amount_native: float, force_refresh: bool = False) -> Optional[Tuple[float, float]]:
+    """
+    Preço do ativo nativo a partir do snapshot do price_oracle.
+    force_refresh é mantido por compatibilidade: o snapshot já é atualizado
+    em lote a cada PRICE_REFRESH_SECONDS, então a validação nunca espera HTTP.
+    """
     cg_id = CHAINS[chain_id]["cg_native"]
-    cache_key = f"native:{cg_id}"
-    
-    # SEMPRE tentar cache primeiro para evitar rate limits
-    cached = _price_cache_get(cache_key, force_refresh=False, allow_extended=True)
-    if cached is not None:
-        px = float(cached)
-        usd_value = amount_native * px
-        return px, usd_value
-    
-    # Para BNB, tentar APIs de backup PRIMEIRO (mais rápidas que CoinGecko)
-    if cg_id == "binancecoin":
-        LOG.info(f"[BACKUP-FIRST] Tentando APIs de backup para {cg_id} antes do CoinGecko...")
-        backup_price = await _try_backup_apis(cg_id)
-        if backup_price:
-            px = backup_price
-            usd_value = amount_native * px
-            LOG.info(f"[BACKUP-SUCCESS] ✅ {cg_id}: ${px:.2f} | {amount_native} unidades = ${usd_value:.2f}")
-            _price_cache_put(cache_key, px, from_backup=True)
-            return px, usd_value
-    
-    LOG.info(f"[LIVE-PRICE] Buscando preço atual da internet para {cg_id}...")
-    data = await _cg_get(f"https://api.coingecko.com/api/v3/simple/price?ids={cg_id}&vs_currencies=usd")
-    
-    # Se CoinGecko falhou, tentar APIs de backup
-    if not data or cg_id not in data or "usd" not in data[cg_id]:
-        LOG.warning(f"[BACKUP] CoinGecko falhou para {cg_id}, tentando APIs de backup...")
-        backup_price = await _try_backup_apis(cg_id)
-        if backup_price:
-            px = backup_price
-            usd_value = amount_native * px
-            LOG.info(f"[BACKUP-SUCCESS] ✅ {cg_id}: ${px:.2f} | {amount_native} unidades = ${usd_value:.2f}")
-            _price_cache_put(cache_key, px, from_backup=True)  # Cache o preço de backup
-            return px, usd_value
-    
-    if not data or cg_id not in data or "usd" not in data[cg_id]:
-        # Tentar cache expirado primeiro
-        stale = _PRICE_CACHE.get(cache_key)
-        if stale:
-            px = float(stale[0])
-            LOG.info("[price-fallback] usando cache expirado p/ %s: %f", cache_key, px)
-            return px, amount_native * px
-        
-        # Usar preço de fallback quando API indisponível (rate limiting, etc)
-        fallback_price = FALLBACK_PRICES.get(cg_id)
-        if fallback_price:
-            px = float(fallback_price)
-            usd_value = amount_native * px
-            meta = FALLBACK_PRICE_META.get(cg_id, {})
-            ts = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(meta.get("ts", 0)))
-            src = meta.get("source", "manual")
-            LOG.warning(
-                "[STATIC-FALLBACK] CoinGecko + backup APIs indisponíveis, usando preço estático p/ %s: $%.2f | %s unidades = $%.2f (source=%s ts=%s)",
-                cg_id, px, amount_native, usd_value, src, ts
-            )
-            _price_cache_put(cache_key, px, from_backup=True)  # Cache por mais tempo
-            return px, usd_value
-        
-        LOG.error("[price-fail] Falha ao obter preço para %s - configure COINGECKO_API_KEY", cg_id)
+    px = _oracle_price(cg_id)
+    if px is None:
+        LOG.error("[price-fail] Sem preço para %s no oráculo", cg_id)
         return None
-
-    px = float(data[cg_id]["usd"])
     usd_value = amount_native * px
-    LOG.info(f"[LIVE-PRICE] ✅ {cg_id}: ${px:.2f} | {amount_native} unidades = ${usd_value:.2f}")
-    _price_cache_put(cache_key, px)
+    LOG.info(f"[PRICE] {cg_id}: ${px:.2f} | {amount_native} unidades = ${usd_value:.2f}")
     return px, usd_value
 
 
@@ -655,107 +483,96 @@ async def _usd_token(
 ) -> Optional[Tuple[float, float]]:
     token_addr_lc = token_addr.lower()
     amount = float(amount_raw) / float(10 ** decimals)
+    token = token_registry.get(chain_id, token_addr_lc)
+
+    # 0) stablecoin pareada ao dólar: sem consulta de preço
+    if token and token.strategy == STRATEGY_PEGGED:
+        LOG.info(f"[PEGGED] {token.symbol} em {chain_id}: $1.00 | {amount} unidades = ${amount:.2f}")
+        return 1.0, amount
 
-    # 1) tenta mapeamento "nativo" (ex.: BTCB -> bitcoin)
-    alt_cgid = KNOWN_TOKEN_TO_CGID.get(f"{chain_id}:{token_addr_lc}")
+    # 1) mapeamento "nativo" (ex.: BTCB -> bitcoin)
+    alt_cgid = token.cg_id if token else None
     if alt_cgid:
-        cache_key = f"native:{alt_cgid}"
-        # SEMPRE forçar busca de preços atuais na internet
-        LOG.info(f"[LIVE-PRICE] Buscando preço atual de token mapeado {alt_cgid}...")
-        data = await _cg_get(f"https://api.coingecko.com/api/v3/simple/price?ids={alt_cgid}&vs_currencies=usd")
-        if data and alt_cgid in data and "usd" in data[alt_cgid]:
-            px = float(data[alt_cgid]["usd"])
+        px = _oracle_price(alt_cgid)
+        if px is not None:
             usd_value = amount * px
-            LOG.info(f"[LIVE-PRICE] ✅ Token {alt_cgid}: ${px:.2f} | {amount} unidades = ${usd_value:.2f}")
-            _price_cache_put(cache_key, px)
-            return px, usd_value
-        
-        # Fallback para rate limiting ou API indisponível
-        fallback_price = FALLBACK_PRICES.get(alt_cgid)
-        if fallback_price:
-            px = float(fallback_price)
-            usd_value = amount * px
-            meta = FALLBACK_PRICE_META.get(alt_cgid, {})
-            ts = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(meta.get("ts", 0)))
-            src = meta.get("source", "manual")
-            LOG.warning(
-                f"[RATE-LIMIT-FALLBACK] Token fallback p/ alt_cgid {alt_cgid}: ${px:.2f} | {amount} unidades = ${usd_value:.2f} (source={src} ts={ts})"
-            )
-            _price_cache_put(cache_key, px)
+            LOG.info(f"[PRICE] Token {alt_cgid}: ${px:.2f} | {amount} unidades = ${usd_value:.2f}")
             return px, usd_value
-            
-        LOG.info("[price] falhou alt_cgid=%s p/ token %s; tentando plataforma CG...", alt_cgid, token_addr_lc)
+        LOG.info("[price] sem preço p/ alt_cgid=%s do token %s; tentando por contrato...", alt_cgid, token_addr_lc)
 
-    # 2) fluxo padrão por plataforma/contrato
-    platform = CHAINS[chain_id]["cg_platform"]
-    cache_key = f"token:{platform}:{token_addr_lc}"
-    
-    # SEMPRE forçar busca de preços atuais na internet
-    LOG.info(f"[LIVE-PRICE] Buscando preço atual de token {token_addr_lc} na plataforma {platform}...")
-    data = await _cg_get(
-        f"https://api.coingecko.com/api/v3/simple/token_price/{platform}"
-        f"?contract_addresses={token_addr_lc}&vs_currencies=usd"
-    )
-    if data:
-        for k, v in data.items():
-            if k.lower() == token_addr_lc and "usd" in v:
-                px = float(v["usd"])
-                usd_value = amount * px
-                LOG.info(f"[LIVE-PRICE] ✅ Token {token_addr_lc}: ${px:.2f} | {amount} unidades = ${usd_value:.2f}")
-                _price_cache_put(cache_key, px)
-                return px, usd_value
-
-    # 3) fallback com cache expirado, se existir
-    stale = _PRICE_CACHE.get(cache_key)
-    if stale:
-        px = float(stale[0])
-        LOG.info("[price-fallback] usando cache expirado p/ %s: %f", cache_key, px)
-        return px, amount * px
-
-    # 4) Fallback para rate limiting ou API indisponível
+    # 2) preço por contrato (snapshot do oráculo)
     token_key = f"{chain_id}:{token_addr_lc}"
-    fallback_price = FALLBACK_PRICES.get(token_key)
-    if fallback_price:
-        px = float(fallback_price)
-        usd_value = amount * px
-        meta = FALLBACK_PRICE_META.get(token_key, {})
-        ts = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(meta.get("ts", 0)))
-        src = meta.get("source", "manual")
-        LOG.warning(
-            f"[RATE-LIMIT-FALLBACK] Token fallback p/ {token_key}: ${px:.2f} | {amount} unidades = ${usd_value:.2f} (source={src} ts={ts})"
-        )
-        _price_cache_put(cache_key, px)
-        return px, usd_value
+    px = _oracle_price(token_key)
+
+    # 3) token ainda fora do snapshot: busca única e passa a ser acompanhado pelo loop
+    if px is None:
+        platform = CHAINS[chain_id]["cg_platform"]
+        LOG.info(f"[PRICE] Token {token_addr_lc} novo no oráculo, buscando em {platform}...")
+        px = await price_oracle.refresh_token(chain_id, platform, token_addr_lc)
+
+    if px is None:
+        LOG.error("[price-fail] Falha ao obter preço para token %s:%s - configure COINGECKO_API_KEY", chain_id, token_addr_lc)
+        return None
+
+    usd_value = amount * px
+    LOG.info(f"[PRICE] Token {token_addr_lc}: ${px:.2f} | {amount} unidades = ${usd_value:.2f}")
+    return px, usd_value
+
+
+def setup_price_oracle():
+    """Registra no oráculo os ativos das CHAINS e do registro de tokens"""
+    for meta in CHAINS.values():
+        price_oracle.track_asset(meta.get("cg_native"))
+    for info in list(token_registry.tokens.values()):
+        if info.strategy == STRATEGY_PEGGED:
+            continue
+        if info.cg_id:
+            price_oracle.track_asset(info.cg_id)
+        elif info.chain_id in CHAINS:
+            price_oracle.track_token(info.chain_id, CHAINS[info.chain_id]["cg_platform"], info.address)
+    price_oracle.backup_fetcher = _try_backup_apis
+    price_oracle.store = _PRICE_CACHE
+    price_oracle.seed(dict(_PRICE_CACHE.items()), source="snapshot")
 
-    LOG.error("[price-fail] Falha ao obter preço para token %s:%s - configure COINGECKO_API_KEY", chain_id, token_addr_lc)
-    return None
+
+def setup_wallet_watcher(session_factory):
+    """Configura o wallet_watcher com a carteira, os clientes RPC e as chains suportadas"""
+    wallet_watcher.configure(WALLET_ADDRESS, _rpc, session_factory, CHAINS.keys())
 
 
 # =========================
 # ERC-20 helpers
 # =========================
-def _erc20_static_call(w3: Web3, token: str, sig4: str) -> Optional[bytes]:
+ERC20_DECIMALS_SIG = "0x313ce567"  # decimals()
+ERC20_SYMBOL_SIG = "0x95d89b41"    # symbol()
+
+
+def _hex_to_bytes(result: Any) -> Optional[bytes]:
+    if not result or not isinstance(result, str):
+        return None
     try:
-        return w3.eth.call({"to": token, "data": sig4})
+        return bytes.fromhex(result[2:] if result.startswith("0x") else result)
+    except ValueError:
+        return None
+
+
+async def _erc20_static_call(rpc: ChainRpcClient, token: str, sig4: str) -> Optional[bytes]:
+    try:
+        result = await rpc.call("eth_call", [{"to": token, "data": sig4}, "latest"])
     except Exception:
         return None
+    return _hex_to_bytes(result)
 
 
-def _erc20_decimals(w3: Web3, token: str) -> int:
-    raw = _erc20_static_call(w3, token, "0x313ce567")  # decimals()
+def _decode_decimals(raw: Optional[bytes]) -> Optional[int]:
+    """decimals() decodificado; None se a chamada falhou ou a resposta não é um uint8 válido"""
     if not raw or len(raw) < 32:
-        return 18
-    return int.from_bytes(raw[-32:], "big")
+        return None
+    decimals = int.from_bytes(raw[-32:], "big")
+    return decimals if decimals <= 77 else None
 
 
-def _erc20_symbol(w3: Web3, token: str) -> str:
-    # Primeiro, tentar mapeamento conhecido
-    known_symbol = KNOWN_TOKEN_SYMBOLS.get(token.lower())
-    if known_symbol:
-        LOG.info(f"Usando símbolo conhecido para {token}: {known_symbol}")
-        return known_symbol
-        
-    raw = _erc20_static_call(w3, token, "0x95d89b41")  # symbol()
+def _decode_symbol(raw: Optional[bytes], token: str) -> str:
     if not raw:
         return "TOKEN"
     try:
@@ -783,6 +600,68 @@ def _erc20_symbol(w3: Web3, token: str) -> str:
         return "TOKEN"
 
 
+async def _erc20_decimals(rpc: ChainRpcClient, token: str) -> Optional[int]:
+    return _decode_decimals(await _erc20_static_call(rpc, token, ERC20_DECIMALS_SIG))
+
+
+async def _erc20_symbol(rpc: ChainRpcClient, token: str) -> str:
+    # Primeiro, tentar mapeamento conhecido
+    known_symbol = KNOWN_TOKEN_SYMBOLS.get(token.lower())
+    if known_symbol:
+        LOG.info(f"Usando símbolo conhecido para {token}: {known_symbol}")
+        return known_symbol
+
+    return _decode_symbol(await _erc20_static_call(rpc, token, ERC20_SYMBOL_SIG), token)
+
+
+async def _erc20_metadata(rpc: ChainRpcClient, token: str) -> Optional[Tuple[int, str]]:
+    """
+    decimals() e symbol() do token em um único batch JSON-RPC. None se a
+    leitura falhar: decimals nunca é chutado (18 num USDC = valor 10^12 menor).
+    """
+    known_symbol = KNOWN_TOKEN_SYMBOLS.get(token.lower())
+    if known_symbol:
+        decimals = await _erc20_decimals(rpc, token)
+        return (decimals, known_symbol) if decimals is not None else None
+
+    try:
+        results = await rpc.batch([
+            ("eth_call", [{"to": token, "data": ERC20_DECIMALS_SIG}, "latest"]),
+            ("eth_call", [{"to": token, "data": ERC20_SYMBOL_SIG}, "latest"]),
+        ])
+    except Exception:
+        results = None
+    if not results:
+        return None
+    raw_decimals, raw_symbol = results
+    decimals = _decode_decimals(_hex_to_bytes(raw_decimals))
+    if decimals is None:
+        return None
+    return decimals, _decode_symbol(_hex_to_bytes(raw_symbol), token)
+
+
+async def _token_info(rpc: ChainRpcClient, chain_id: str, token: str) -> Optional[TokenInfo]:
+    """
+    Metadados do token pelo registro; só vai on-chain na primeira vez que o
+    token aparece. Só registra (e persiste) o que foi lido de fato; falha de
+    RPC devolve None e a validação fica pendente para nova tentativa.
+    """
+    info = token_registry.get(chain_id, token)
+    if info is not None:
+        return info
+    metadata = await _erc20_metadata(rpc, token)
+    if metadata is None:
+        LOG.warning(f"[TOKENS] decimals() de {token} em {chain_id} indisponível - não registrado")
+        return None
+    decimals, symbol = metadata
+    return token_registry.register(chain_id, token, decimals, symbol or "TOKEN")
+
+
+TOKEN_METADATA_UNAVAILABLE = "Metadados do token indisponíveis (RPC). Tentaremos novamente."
+HASH_CLAIMED = "Esta transação já foi enviada por outro usuário."
+PRICE_UNAVAILABLE = "Preço USD indisponível ({}). Tentaremos novamente."
+
+
 def _parse_log_value_data(data_field: Any) -> Optional[int]:
     """
     data_field pode vir como str "0x..." OU bytes.
@@ -806,39 +685,52 @@ def _parse_log_value_data(data_field: Any) -> Optional[int]:
 # Resolver pagamento
 # =========================
 async def _resolve_on_chain(
-    w3: Web3, chain_id: str, tx_hash: str, force_refresh: bool = False
+    rpc: ChainRpcClient,
+    chain_id: str,
+    tx_hash: str,
+    force_refresh: bool = False,
+    tx: Optional[Dict[str, Any]] = None,
+    prefetched: Optional[Dict[str, Any]] = None,
 ) -> Tuple[bool, str, Optional[float], Dict[str, Any]]:
-    # 1) get_transaction
-    try:
-        tx = w3.eth.get_transaction(tx_hash)
-    except Exception:
-        return False, "Transação não encontrada.", None, {}
+    # 1) get_transaction (reaproveita tx/receipt/bloco já obtidos no batch da busca por chain)
+    prefetched = prefetched or {}
+    if tx is None:
+        try:
+            tx = await rpc.call("eth_getTransactionByHash", [tx_hash], require_result=True)
+        except Exception:
+            tx = None
+        if not tx:
+            return False, "Transação não encontrada.", None, {"chain_id": chain_id, "pending": True}
 
     # 2) confirmações e status
-    receipt = None
-    if tx.get("blockHash"):
+    receipt = prefetched.get("receipt")
+    block_number = _to_int(tx["blockNumber"]) if tx.get("blockNumber") else None
+    if receipt is None and tx.get("blockHash"):
         with suppress(Exception):
-            receipt = w3.eth.get_transaction_receipt(tx_hash)
+            receipt = await rpc.call("eth_getTransactionReceipt", [tx_hash])
 
-    confirmations = await _get_confirmations(w3, tx.get("blockNumber"))
+    confirmations = await _get_confirmations(rpc, block_number, prefetched.get("latest_block"))
     if confirmations < MIN_CONFIRMATIONS:
-        return False, f"Aguardando confirmações: {confirmations}/{MIN_CONFIRMATIONS}", None, {"confirmations": confirmations}
+        return False, f"Aguardando confirmações: {confirmations}/{MIN_CONFIRMATIONS}", None, {
+            "chain_id": chain_id, "confirmations": confirmations, "pending": True
+        }
 
-    if receipt and receipt.get("status") != 1:
+    if receipt and _to_int(receipt.get("status")) != 1:
         return False, "Transação revertida.", None, {"confirmations": confirmations}
 
     details: Dict[str, Any] = {"chain_id": chain_id, "confirmations": confirmations}
 
     # 3) Nativo?
     tx_to = (tx.get("to") or "").lower()
-    LOG.info("[resolve] chain=%s to_tx=%s value=%s", chain_id, tx_to, int(tx.get("value", 0)))
+    tx_value = _to_int(tx.get("value"))
+    LOG.info("[resolve] chain=%s to_tx=%s value=%s", chain_id, tx_to, tx_value)
 
-    if WALLET_ADDRESS and tx_to == WALLET_ADDRESS.lower() and int(tx.get("value", 0)) > 0:
-        value_wei = int(tx["value"])
+    if WALLET_ADDRESS and tx_to == WALLET_ADDRESS.lower() and tx_value > 0:
+        value_wei = tx_value
         amount_native = float(value_wei) / float(10 ** 18)
         px = await _usd_native(chain_id, amount_native, force_refresh=force_refresh)
         if not px:
-            return False, "Preço USD indisponível (nativo).", None, details
+            return False, PRICE_UNAVAILABLE.format("nativo"), None, {**details, "pending": True}
         price_usd, paid_usd = px
         sym = CHAINS[chain_id]["sym"]
         details.update({"type": "native", "token_symbol": sym, "amount_human": amount_native, "price_usd": price_usd, "paid_usd": paid_usd})
@@ -867,14 +759,16 @@ async def _resolve_on_chain(
                     continue
 
                 token_addr = Web3.to_checksum_address(addr)
-                decimals = _erc20_decimals(w3, token_addr)
-                symbol = _erc20_symbol(w3, token_addr) or "TOKEN"
+                token = await _token_info(rpc, chain_id, token_addr)
+                if token is None:
+                    return False, TOKEN_METADATA_UNAVAILABLE, None, {**details, "pending": True}
+                decimals, symbol = token.decimals, token.symbol
 
                 px = await _usd_token(
                     chain_id, token_addr, value_raw, decimals, force_refresh=force_refresh
                 )
                 if not px:
-                    return False, "Preço USD indisponível (token).", None, details
+                    return False, PRICE_UNAVAILABLE.format("token"), None, {**details, "pending": True}
                 price_usd, paid_usd = px
                 amount_human = float(value_raw) / float(10 ** decimals)
 
@@ -912,13 +806,15 @@ async def _resolve_on_chain(
                 if toA.lower() == WALLET_ADDRESS.lower() and value_raw > 0:
                     token_addr = Web3.to_checksum_address(tx_to) if tx_to else None
                     if token_addr:
-                        decimals = _erc20_decimals(w3, token_addr)
-                        symbol = _erc20_symbol(w3, token_addr) or "TOKEN"
+                        token = await _token_info(rpc, chain_id, token_addr)
+                        if token is None:
+                            return False, TOKEN_METADATA_UNAVAILABLE, None, {**details, "pending": True}
+                        decimals, symbol = token.decimals, token.symbol
                         px = await _usd_token(
                             chain_id, token_addr, value_raw, decimals, force_refresh=force_refresh
                         )
                         if not px:
-                            return False, "Preço USD indisponível (token).", None, details
+                            return False, PRICE_UNAVAILABLE.format("token"), None, {**details, "pending": True}
                         price_usd, paid_usd = px
                         amount_human = float(value_raw) / float(10 ** decimals)
                         details.update({
@@ -935,7 +831,7 @@ async def _resolve_on_chain(
 
     # 6) Caso destino não combine
     reason = (
-        "Destino não confere para esta transação (nativo)" if int(tx.get("value", 0)) > 0
+        "Destino não confere para esta transação (nativo)" if tx_value > 0
         else "Nenhuma transferência válida p/ a carteira destino."
     )
 
@@ -983,29 +879,94 @@ def human_chain(chain_id: str) -> str:
     return chain_names.get(chain_id, chain_id)
 
 
+# Nomes de rede aceitos como dica de chain (webapp, /tx, /api/validate)
+CHAIN_ALIASES = {
+    "eth": "0x1", "ethereum": "0x1", "erc20": "0x1", "erc-20": "0x1",
+    "bsc": "0x38", "bnb": "0x38", "bep20": "0x38", "bep-20": "0x38",
+    "polygon": "0x89", "matic": "0x89", "pol": "0x89",
+    "arbitrum": "0xa4b1", "arb": "0xa4b1",
+    "optimism": "0xa", "op": "0xa",
+    "base": "0x2105",
+    "avalanche": "0xa86a", "avax": "0xa86a",
+}
+
+
+def resolve_chain_hint(hint: Any) -> Optional[str]:
+    """
+    Converte a dica de rede ("BSC", "56", "0x38", "Polygon"...) em chain_id.
+    Retorna None se a dica for vazia ou desconhecida (busca autochain normal).
+    """
+    if hint is None:
+        return None
+    value = str(hint).strip().lower()
+    if not value or value in ("auto", "automatico", "automático"):
+        return None
+    if value in CHAIN_ALIASES:
+        return CHAIN_ALIASES[value]
+    if value.isdigit():
+        value = hex(int(value))
+    if value in CHAINS:
+        return value
+    for chain_id in CHAINS:
+        if human_chain(chain_id).lower() == value:
+            return chain_id
+    LOG.info(f"[CHAIN-HINT] Rede desconhecida ignorada: {hint}")
+    return None
+
+
+# Validações concorrentes do mesmo hash compartilham uma única busca
+_TX_FLIGHT = SingleFlight("tx")
+
+
 async def resolve_payment_usd_autochain(
-    tx_hash: str, force_refresh: bool = False
+    tx_hash: str,
+    force_refresh: bool = False,
+    user_id: Optional[int] = None,
+    chain_hint: Optional[str] = None,
+) -> Tuple[bool, str, Optional[float], Dict[str, Any]]:
+    """
+    Valida o pagamento (ver _resolve_payment_usd_autochain) com single-flight
+    pelo hash normalizado: duplo clique no webapp ou webhook + /tx simultâneos
+    aguardam a mesma busca em vez de repetir todas as chamadas RPC. A chave
+    inclui force_refresh e a rede indicada: um pedido com cache ignorado ou
+    com outra dica de chain nunca recebe o resultado de uma busca diferente.
+    """
+    clean_hash = tx_hash.lower().replace('0x', '')
+    if len(clean_hash) != 64:
+        return await _resolve_payment_usd_autochain(tx_hash, force_refresh, user_id, chain_hint)
+    hint = resolve_chain_hint(chain_hint) if chain_hint else None
+    return await _TX_FLIGHT.do(
+        f"0x{clean_hash}:{hint or '*'}:{'fresh' if force_refresh else 'cached'}",
+        lambda: _resolve_payment_usd_autochain(tx_hash, force_refresh, user_id, chain_hint),
+    )
+
+
+async def _resolve_payment_usd_autochain(
+    tx_hash: str,
+    force_refresh: bool = False,
+    user_id: Optional[int] = None,
+    chain_hint: Optional[str] = None,
 ) -> Tuple[bool, str, Optional[float], Dict[str, Any]]:
     """
     Procura a transação em TODAS as chains em PARALELO (muito mais rápido).
     Ao achar a tx em alguma delas, resolve e retorna.
-    OTIMIZADO: Timeout total de 15 segundos para validação rápida.
+    As chains são sondadas em ondas, na ordem do chain_planner (histórico
+    de onde os pagamentos foram encontrados, global e do user_id).
+    Com chain_hint (rede informada pelo webapp ou /tx), a chain indicada é
+    sondada sozinha primeiro; as demais só se a dica errar.
+    OTIMIZADO: Timeout total de AUTOCHAIN_TIMEOUT segundos (ou menos, se o
+    chamador abriu um deadline.budget mais curto); cada RPC/preço lá dentro
+    limita o próprio timeout ao que resta.
     """
     # Verificar cache de transações validadas (otimização para escala)
     if not force_refresh:
         normalized_hash = tx_hash.lower().replace('0x', '')
         if len(normalized_hash) == 64:
             normalized_hash = '0x' + normalized_hash
-            if normalized_hash in _TX_VALIDATION_CACHE:
-                cached_ts, cached_result = _TX_VALIDATION_CACHE[normalized_hash]
-                age = time.time() - cached_ts
-                if age < TX_VALIDATION_TTL:
-                    LOG.info(f"[TX-CACHE] ✅ Usando resultado cacheado para {tx_hash} (idade: {age:.0f}s)")
-                    return cached_result
-                else:
-                    # Cache expirado, remover
-                    del _TX_VALIDATION_CACHE[normalized_hash]
-                    LOG.info(f"[TX-CACHE] Cache expirado para {tx_hash} (idade: {age:.0f}s)")
+            cached_result = _TX_VALIDATION_CACHE.get(normalized_hash)
+            if cached_result is not None:
+                LOG.info(f"[TX-CACHE] ✅ Usando resultado cacheado para {tx_hash}")
+                return tuple(cached_result)
 
     LOG.info(f"[AUTOCHAIN] Procurando transação {tx_hash} em {len(CHAINS)} chains em PARALELO...")
 
@@ -1017,14 +978,24 @@ async def resolve_payment_usd_autochain(
 
     normalized_hash = '0x' + clean_hash
 
-    # OTIMIZAÇÃO: Priorizar apenas as 3 chains mais usadas (ETH, BSC, Polygon)
-    priority_chains = ["0x1", "0x38", "0x89"]  # ETH, BSC, Polygon
-    other_chains = [cid for cid in CHAINS.keys() if cid not in priority_chains]
-    ordered_chains = priority_chains + other_chains
+    # Ordem de busca aprendida: chains com mais acertos (globais e do usuário) primeiro
+    waves = chain_planner.plan(CHAINS.keys(), user_id=user_id)
+    hinted_chain = resolve_chain_hint(chain_hint)
+    # Índice do wallet_watcher: tx já vista chegando na carteira tem a chain conhecida
+    indexed = await wallet_watcher.lookup(normalized_hash)
+    indexed_chain = next((t.chain_id for t in indexed if t.chain_id in CHAINS), None)
+    if indexed_chain:
+        LOG.info(f"[AUTOCHAIN] Transação indexada pelo watcher em {human_chain(indexed_chain)}")
+        hinted_chain = indexed_chain
+    elif hinted_chain:
+        LOG.info(f"[AUTOCHAIN] Dica de rede: {human_chain(hinted_chain)}")
+    if hinted_chain:
+        others = [[cid for cid in wave if cid != hinted_chain] for wave in waves]
+        waves = [[hinted_chain]] + [wave for wave in others if wave]
+    ordered_chains = [cid for wave in waves for cid in wave]
 
     # Função auxiliar para buscar em uma chain
     async def try_chain(chain_id: str):
-        chain_name = human_chain(chain_id)
         try:
             result = await _try_get_transaction_with_backup(chain_id, normalized_hash)
             if result:
@@ -1033,73 +1004,59 @@ async def resolve_payment_usd_autochain(
         except Exception as e:
             return chain_id, None, str(e)[:80]
 
-    # OTIMIZAÇÃO: Adicionar timeout total de 15 segundos
-    async def search_with_timeout():
-        # Buscar em PARALELO - primeiro nas prioritárias, depois nas outras
-        LOG.info(f"[AUTOCHAIN] Buscando em chains prioritárias: {[human_chain(c) for c in priority_chains]}")
-
-        # Fase 1: Testar chains prioritárias em paralelo
-        priority_tasks = [try_chain(cid) for cid in priority_chains if cid in CHAINS]
-        priority_results = await asyncio.gather(*priority_tasks, return_exceptions=True)
-
-        return priority_results, other_chains
-
-    try:
-        # Timeout total de 15 segundos
-        priority_results, other_chains = await asyncio.wait_for(search_with_timeout(), timeout=15.0)
-
-        # Verificar se encontrou nas prioritárias
-        for chain_id, result, error in priority_results:
-            if isinstance((chain_id, result, error), Exception):
-                continue
-            if result:
-                tx, w3 = result
-                chain_name = human_chain(chain_id)
-                LOG.info(f"[AUTOCHAIN] ✅ Transação encontrada em {chain_name}!")
-                ok, msg, usd, details = await _resolve_on_chain(
-                    w3, chain_id, normalized_hash, force_refresh=force_refresh
-                )
-                details['found_on_chain'] = chain_name
-                details['search_time'] = 'fast'
-                LOG.info(f"[RESULT {chain_name}] ok={ok} msg={msg} usd=${usd}")
-
-                # Salvar no cache de transações
-                result = (ok, msg, usd, details)
-                _TX_VALIDATION_CACHE[normalized_hash] = (time.time(), result)
-                LOG.info(f"[TX-CACHE] Resultado salvo no cache: {normalized_hash}")
-
-                return ok, msg, usd, details
-
-        # Fase 2: Se não encontrou nas prioritárias, buscar nas outras chains
-        LOG.info(f"[AUTOCHAIN] Não encontrado nas prioritárias. Buscando em {len(other_chains)} chains restantes...")
-        if other_chains:
-            other_tasks = [try_chain(cid) for cid in other_chains]
-            other_results = await asyncio.gather(*other_tasks, return_exceptions=True)
-
-            for chain_id, result, error in other_results:
-                if isinstance((chain_id, result, error), Exception):
+    # Busca em ondas: cada onda em PARALELO, a próxima só se a anterior não achar
+    async def search_waves():
+        for wave_idx, wave in enumerate(waves):
+            if deadline.expired():
+                raise deadline.DeadlineExceeded(f"prazo esgotado antes da onda {wave_idx + 1}")
+            LOG.info(f"[AUTOCHAIN] Onda {wave_idx + 1}/{len(waves)}: {[human_chain(c) for c in wave]}")
+            wave_results = await asyncio.gather(*[try_chain(cid) for cid in wave], return_exceptions=True)
+            for item in wave_results:
+                if isinstance(item, Exception):
                     continue
+                chain_id, result, error = item
                 if result:
-                    tx, w3 = result
-                    chain_name = human_chain(chain_id)
-                    LOG.info(f"[AUTOCHAIN] ✅ Transação encontrada em {chain_name}!")
-                    ok, msg, usd, details = await _resolve_on_chain(
-                        w3, chain_id, normalized_hash, force_refresh=force_refresh
-                    )
-                    details['found_on_chain'] = chain_name
-                    details['search_time'] = 'extended'
-                    LOG.info(f"[RESULT {chain_name}] ok={ok} msg={msg} usd=${usd}")
-
-                    # Salvar no cache de transações
-                    result = (ok, msg, usd, details)
-                    _TX_VALIDATION_CACHE[normalized_hash] = (time.time(), result)
-                    LOG.info(f"[TX-CACHE] Resultado salvo no cache: {normalized_hash}")
-
-                    return ok, msg, usd, details
+                    return wave_idx, chain_id, result
+        return None
 
-    except asyncio.TimeoutError:
-        LOG.error(f"[AUTOCHAIN] Timeout de 15s atingido ao buscar transação {tx_hash}")
-        return False, "Validação expirou (timeout de 15s). Tente novamente.", None, {}
+    found = None
+    with deadline.budget(AUTOCHAIN_TIMEOUT):
+        try:
+            found = await deadline.wait(search_waves())
+            if found:
+                wave_idx, chain_id, (tx, rpc, prefetched) = found
+                chain_name = human_chain(chain_id)
+                LOG.info(f"[AUTOCHAIN] ✅ Transação encontrada em {chain_name}!")
+                chain_planner.record_hit(chain_id, user_id)
+                ok, msg, usd, details = await deadline.wait(_resolve_on_chain(
+                    rpc, chain_id, normalized_hash, force_refresh=force_refresh,
+                    tx=tx, prefetched=prefetched
+                ))
+        except asyncio.TimeoutError:
+            LOG.error(f"[AUTOCHAIN] Prazo esgotado ao buscar transação {tx_hash}")
+            # Sem resposta a tempo não quer dizer inválida: o pending_tx reverifica com calma
+            return False, "Validação expirou (tempo limite atingido). Tente novamente.", None, {
+                'tx_hash': normalized_hash,
+                'chain_id': found[1] if found else None,
+                'pending': True,
+                'timed_out': True,
+            }
+
+    if found:
+        details['found_on_chain'] = chain_name
+        details['validated_at'] = time.time()
+        details['search_time'] = 'fast' if wave_idx == 0 else 'extended'
+        if indexed_chain == chain_id:
+            details['search_time'] = 'indexed'
+        LOG.info(f"[RESULT {chain_name}] ok={ok} msg={msg} usd=${usd}")
+
+        # Salvar no cache de transações (pendentes ficam com o pending_tx, não no cache)
+        result = (ok, msg, usd, details)
+        if not details.get('pending'):
+            _TX_VALIDATION_CACHE.set(normalized_hash, list(result))
+            LOG.info(f"[TX-CACHE] Resultado salvo no cache: {normalized_hash}")
+
+        return ok, msg, usd, details
 
     # Não encontrado em nenhuma chain
     chains_tried = ', '.join([human_chain(cid) for cid in ordered_chains[:10]])
@@ -1108,16 +1065,44 @@ async def resolve_payment_usd_autochain(
 
     LOG.error(f"[AUTOCHAIN] Transação {tx_hash} não encontrada em {len(CHAINS)} chains")
 
-    # Salvar resultado negativo no cache (evita re-buscar transações inválidas)
-    result = (False, f"Transação não encontrada em {len(CHAINS)} blockchains suportadas ({chains_tried}).", None, {
+    # Sem cache negativo: a tx pode só não ter sido propagada ainda. O pending_tx
+    # reverifica com backoff em vez de guardar o "não encontrada" por uma hora.
+    return False, f"Transação não encontrada em {len(CHAINS)} blockchains suportadas ({chains_tried}).", None, {
         'searched_chains': list(CHAINS.keys()),
         'tx_hash': normalized_hash,
-        'total_chains': len(CHAINS)
-    })
-    _TX_VALIDATION_CACHE[normalized_hash] = (time.time(), result)
-    LOG.info(f"[TX-CACHE] Resultado negativo salvo no cache: {normalized_hash}")
+        'total_chains': len(CHAINS),
+        'pending': True,
+    }
+
+
+async def resolve_payment_on_known_chain(
+    tx_hash: str,
+    chain_id: Optional[str] = None,
+    chain_hint: Optional[str] = None,
+) -> Tuple[bool, str, Optional[float], Dict[str, Any]]:
+    """
+    Validação barata de uma transação cuja chain já se conhece (reverificação
+    do pending_tx, reavaliação em massa de pagamentos).
 
-    return result
+    Com a chain conhecida (ou descoberta pelo índice do wallet_watcher), só
+    ela é consultada; sem chain, cai na busca autochain completa.
+    """
+    if not chain_id:
+        indexed = await wallet_watcher.lookup(tx_hash)
+        chain_id = next((t.chain_id for t in indexed if t.chain_id in CHAINS), None)
+    if not chain_id or chain_id not in CHAINS:
+        return await resolve_payment_usd_autochain(tx_hash, chain_hint=chain_hint)
+
+    found = await _try_get_transaction_with_backup(chain_id, tx_hash)
+    if not found:
+        return False, "Transação não encontrada.", None, {"chain_id": chain_id, "pending": True}
+    tx, rpc, prefetched = found
+    ok, msg, usd, details = await _resolve_on_chain(rpc, chain_id, tx_hash, tx=tx, prefetched=prefetched)
+    if ok:
+        # Aprovação logo em seguida (pending_tx) reaproveita este resultado
+        details['validated_at'] = time.time()
+        _TX_VALIDATION_CACHE.set('0x' + tx_hash.lower().replace('0x', ''), [ok, msg, usd, details])
+    return ok, msg, usd, details
 
 
 # =========================
@@ -1241,143 +1226,185 @@ async def pagar_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         except Exception:
             await msg.reply_text(instrucoes, parse_mode="HTML")
 
+def _tx_existing_status(s, tx_hash: str) -> Optional[str]:
+    """Status do Payment já registrado com esta hash (None se não houver)"""
+    from main import Payment
+
+    existing = s.query(Payment.status).filter(Payment.tx_hash == tx_hash).first()
+    return existing[0] if existing else None
+
+
+async def _tx_resolve(user, tx_hash: str, chain_hint: Optional[str]) -> Tuple[str, Optional[str]]:
+    """
+    Trabalho pesado do /tx (roda num worker do validation_jobs): busca
+    autochain, registro do pagamento, VIP e convite. Retorna (texto, parse_mode)
+    para editar a mensagem de status.
+    """
+    # Verificar se já existe (hash fora do índice de hashes usadas dispensa o banco)
+    status = None
+    if used_hashes.might_contain(tx_hash) is not False:
+        status = await deadline.wait(async_db.run(_tx_existing_status, tx_hash))
+    if status == "approved":
+        return (
+            f"✅ Seu pagamento já estava aprovado!\n"
+            f"Se ainda não recebeu o convite VIP, entre em contato."
+        ), None
+    if status is not None:
+        return (
+            f"⏳ Pagamento já registrado e está sendo analisado.\n"
+            f"Status atual: {status}"
+        ), None
+
+    # Verificar transação on-chain SEMPRE com preços atuais
+    # SEMPRE usar force_refresh=True para garantir preços atualizados
+    ok, msg_result, usd_paid, details = await resolve_payment_usd_autochain(
+        tx_hash, force_refresh=True, user_id=user.id, chain_hint=chain_hint
+    )
+
+    LOG.info(f"[PRICE-CHECK] Verificação com preços atuais - Hash: {tx_hash[:12]}... USD: ${float(usd_paid):.4f}" if usd_paid else f"[PRICE-CHECK] Falha na verificação - Hash: {tx_hash[:12]}...")
+
+    if ok and usd_paid:
+        # Import necessário para funções do main
+        from utils import choose_plan_from_usd
+
+        # Determinar plano baseado no valor real pago (sem preços estáticos)
+        plan_days = choose_plan_from_usd(usd_paid)
+        if not plan_days:
+            return f"❌ Valor pago (${float(usd_paid):.2f}) insuficiente para qualquer plano VIP.", None
+
+        # Registrar pagamento + criar/estender VIP (uma transação), convite em paralelo
+        import datetime as dt
+        from main import Payment, SessionLocal, application, GROUP_VIP_ID
+        from sqlalchemy.exc import IntegrityError
+
+        p = Payment(
+            user_id=user.id,
+            username=user.username,
+            tx_hash=tx_hash,
+            chain=details.get("chain_id", "unknown"),
+            amount=str(details.get("amount", "N/A")),
+            token_symbol=details.get("token_symbol", "Unknown"),
+            usd_value=str(usd_paid),
+            vip_days=plan_days,
+            status="approved",
+            created_at=dt.datetime.now()
+        )
+        try:
+            vip_until, invite_link = await _activate_vip(
+                SessionLocal, p, user.id, user.username, plan_days, user.first_name,
+                bot=application.bot if application else None, chat_id=GROUP_VIP_ID,
+            )
+        except IntegrityError:
+            # Mesma hash aprovada pelo webapp/pending_tx no meio tempo
+            return "✅ Seu pagamento já estava aprovado!\nSe ainda não recebeu o convite VIP, entre em contato.", None
+
+        plan_names = {30: "Mensal", 90: "Trimestral", 180: "Semestral", 365: "Anual"}
+        plan_name = plan_names.get(plan_days, f"{plan_days} dias")
+
+        if invite_link:
+            # Mensagem com convite
+            welcome_msg = (
+                f"🎉 <b>PAGAMENTO CONFIRMADO!</b>\n\n"
+                f"✅ Valor recebido: <b>${float(usd_paid):.2f} USD</b>\n"
+                f"👑 Plano ativado: <b>{plan_name} ({plan_days} dias)</b>\n"
+                f"📅 Válido até: <b>{vip_until.strftime('%d/%m/%Y')}</b>\n\n"
+                f"🔗 <b>Clique no link abaixo para entrar no grupo VIP:</b>\n"
+                f"{invite_link}\n\n"
+                f"⚠️ <b>IMPORTANTE:</b> Este link expira em 2 horas e tem apenas 1 uso.\n\n"
+                f"🎁 <b>Seja bem-vindo(a) ao VIP!</b>\n"
+                f"💎 Aproveite todo o conteúdo exclusivo!\n"
+                f"📬 Você receberá atualizações diárias de novos arquivos!\n\n"
+                f"Obrigado pela confiança! 🙏"
+            )
+        else:
+            # Mensagem sem convite
+            welcome_msg = (
+                f"🎉 <b>PAGAMENTO CONFIRMADO!</b>\n\n"
+                f"✅ Valor recebido: <b>${float(usd_paid):.2f} USD</b>\n"
+                f"👑 Plano ativado: <b>{plan_name} ({plan_days} dias)</b>\n"
+                f"📅 Válido até: <b>{vip_until.strftime('%d/%m/%Y')}</b>\n\n"
+                f"📬 Entre em contato para receber o convite do grupo VIP.\n\n"
+                f"Obrigado pela preferência! 🙏"
+            )
+
+        return welcome_msg, "HTML"
+
+    if details.get("pending"):
+        tracked = await pending_tracker.track(
+            tx_hash, details.get("chain_id"), tg_id=user.id, username=user.username,
+            reason=msg_result, chain_hint=resolve_chain_hint(chain_hint),
+            missing_confirmations=MIN_CONFIRMATIONS - int(details.get("confirmations", 0) or 0),
+        )
+        if tracked:
+            return (
+                f"⏳ {msg_result}\n"
+                f"Vamos reverificar automaticamente e você recebe o convite VIP aqui assim que confirmar."
+            ), None
+
+    return f"❌ {msg_result}", None
+
+
 async def tx_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Comando /tx - verificar transação"""
+    """
+    Comando /tx - verificar transação
+
+    Responde "validando…" na hora e enfileira a resolução no validation_jobs;
+    o worker edita a mesma mensagem com o resultado. O handler não fica
+    preso durante a busca em todas as chains.
+    """
     msg = update.effective_message
     user = update.effective_user
     
     if not context.args:
-        return await msg.reply_text("Uso: /tx <hash_da_transacao> (ex.: 0x… com 66 caracteres)")
+        return await msg.reply_text(
+            "Uso: /tx <hash_da_transacao> [rede] (ex.: 0x… com 66 caracteres; rede opcional: ETH, BSC, POLYGON...)"
+        )
     
     tx_raw = context.args[0]
+    chain_hint = context.args[1] if len(context.args) > 1 else None
     tx_hash = normalize_tx_hash(tx_raw)
     if not tx_hash:
         return await msg.reply_text(
             "Hash inválida. Use formato: 0x... (66 caracteres) ou sem 0x (64 caracteres)."
         )
     
-    # Import Payment from main
     try:
-        from main import Payment, SessionLocal
+        from main import SessionLocal  # noqa: F401
     except ImportError:
         return await msg.reply_text("Erro: Banco de dados não configurado.")
-    
-    # Verificar se já existe
-    with SessionLocal() as s:
-        existing = s.query(Payment).filter(Payment.tx_hash == tx_hash).first()
-        if existing:
-            if existing.status == "approved":
-                return await msg.reply_text(
-                    f"✅ Seu pagamento já estava aprovado!\n"
-                    f"Se ainda não recebeu o convite VIP, entre em contato."
-                )
-            else:
-                return await msg.reply_text(
-                    f"⏳ Pagamento já registrado e está sendo analisado.\n"
-                    f"Status atual: {existing.status}"
-                )
-    
-    # Verificar transação on-chain SEMPRE com preços atuais
-    try:
-        # SEMPRE usar force_refresh=True para garantir preços atualizados
-        ok, msg_result, usd_paid, details = await resolve_payment_usd_autochain(
-            tx_hash, force_refresh=True
-        )
-        
-        LOG.info(f"[PRICE-CHECK] Verificação com preços atuais - Hash: {tx_hash[:12]}... USD: ${float(usd_paid):.4f}" if usd_paid else f"[PRICE-CHECK] Falha na verificação - Hash: {tx_hash[:12]}...")
-        
-        if ok and usd_paid:
-            # Import necessário para funções do main
-            from utils import choose_plan_from_usd
-            
-            # Determinar plano baseado no valor real pago (sem preços estáticos)
-            plan_days = choose_plan_from_usd(usd_paid)
-            
-            if plan_days:
-                # Registrar pagamento
-                with SessionLocal() as s:
-                    # Extrair informações do token
-                    token_symbol = details.get("token_symbol", "Unknown")
-                    token_amount = details.get("amount", "N/A")
-                    
-                    p = Payment(
-                        user_id=user.id,
-                        username=user.username,
-                        tx_hash=tx_hash,
-                        chain=details.get("chain_id", "unknown"),
-                        amount=str(token_amount),
-                        token_symbol=token_symbol,
-                        usd_value=str(usd_paid),
-                        vip_days=plan_days,
-                        status="approved",
-                        created_at=dt.datetime.now()
-                    )
-                    s.add(p)
-                    s.commit()
-                
-                # Criar/estender VIP
-                from utils import vip_upsert_and_get_until, create_one_time_invite
-                vip_until = await vip_upsert_and_get_until(user.id, user.username, plan_days, user.first_name)
 
-                # Tentar criar convite automático
-                plan_names = {30: "Mensal", 90: "Trimestral", 180: "Semestral", 365: "Anual"}
-                plan_name = plan_names.get(plan_days, f"{plan_days} dias")
+    from validation_jobs import validation_jobs
 
-                try:
-                    from main import application, GROUP_VIP_ID
-                    from utils import create_invite_link_flexible
-                    invite_link = await create_invite_link_flexible(
-                        application.bot, GROUP_VIP_ID, retries=3
-                    )
+    key = f"tx:{user.id}:{tx_hash}"
+    if validation_jobs.is_active(key):
+        return await msg.reply_text("⏳ Essa transação já está sendo validada, aguarde o resultado acima.")
 
-                    if invite_link:
-                        # Mensagem com convite
-                        welcome_msg = (
-                            f"🎉 <b>PAGAMENTO CONFIRMADO!</b>\n\n"
-                            f"✅ Valor recebido: <b>${float(usd_paid):.2f} USD</b>\n"
-                            f"👑 Plano ativado: <b>{plan_name} ({plan_days} dias)</b>\n"
-                            f"📅 Válido até: <b>{vip_until.strftime('%d/%m/%Y')}</b>\n\n"
-                            f"🔗 <b>Clique no link abaixo para entrar no grupo VIP:</b>\n"
-                            f"{invite_link}\n\n"
-                            f"⚠️ <b>IMPORTANTE:</b> Este link expira em 2 horas e tem apenas 1 uso.\n\n"
-                            f"🎁 <b>Seja bem-vindo(a) ao VIP!</b>\n"
-                            f"💎 Aproveite todo o conteúdo exclusivo!\n"
-                            f"📬 Você receberá atualizações diárias de novos arquivos!\n\n"
-                            f"Obrigado pela confiança! 🙏"
-                        )
-                    else:
-                        # Mensagem sem convite
-                        welcome_msg = (
-                            f"🎉 <b>PAGAMENTO CONFIRMADO!</b>\n\n"
-                            f"✅ Valor recebido: <b>${float(usd_paid):.2f} USD</b>\n"
-                            f"👑 Plano ativado: <b>{plan_name} ({plan_days} dias)</b>\n"
-                            f"📅 Válido até: <b>{vip_until.strftime('%d/%m/%Y')}</b>\n\n"
-                            f"📬 Entre em contato para receber o convite do grupo VIP.\n\n"
-                            f"Obrigado pela preferência! 🙏"
-                        )
-                except Exception as e:
-                    LOG.warning(f"Falha ao gerar convite no comando /tx: {e}")
-                    # Mensagem de fallback
-                    welcome_msg = (
-                        f"🎉 <b>PAGAMENTO CONFIRMADO!</b>\n\n"
-                        f"✅ Valor recebido: <b>${float(usd_paid):.2f} USD</b>\n"
-                        f"👑 Plano ativado: <b>{plan_name} ({plan_days} dias)</b>\n"
-                        f"📅 Válido até: <b>{vip_until.strftime('%d/%m/%Y')}</b>\n\n"
-                        f"📬 Aguarde o convite do grupo VIP em breve!\n\n"
-                        f"Obrigado! 🙏"
-                    )
+    status_msg = await msg.reply_text("🔎 Validando transação… isso pode levar alguns segundos.")
+
+    async def run():
+        try:
+            # Prazo da validação inteira: RPC, preços e banco limitam seus timeouts a ele
+            with deadline.budget(deadline.VALIDATION_DEADLINE_SECONDS):
+                text, parse_mode = await _tx_resolve(user, tx_hash, chain_hint)
+        except asyncio.TimeoutError:
+            LOG.warning(f"[TX] Prazo esgotado ao validar {tx_hash[:12]}...")
+            text, parse_mode = "⏳ A validação demorou demais. Tente novamente em alguns instantes.", None
+        except Exception as e:
+            LOG.error(f"Erro ao verificar transação {tx_hash}: {e}")
+            text, parse_mode = "❌ Erro interno ao verificar transação.", None
+        try:
+            await status_msg.edit_text(text, parse_mode=parse_mode)
+        except Exception as e:
+            # Mensagem apagada/antiga demais para editar: manda uma nova
+            LOG.debug(f"[TX] Falha ao editar status de {tx_hash[:12]}...: {e}")
+            await msg.reply_text(text, parse_mode=parse_mode)
+        return text
+
+    try:
+        validation_jobs.submit(key, run)
+    except asyncio.QueueFull:
+        await status_msg.edit_text("⚠️ Muitas validações em andamento. Tente novamente em alguns instantes.")
 
-                return await msg.reply_text(welcome_msg, parse_mode="HTML")
-            else:
-                return await msg.reply_text(
-                    f"❌ Valor pago (${float(usd_paid):.2f}) insuficiente para qualquer plano VIP."
-                )
-        else:
-            return await msg.reply_text(f"❌ {msg_result}")
-            
-    except Exception as e:
-        LOG.error(f"Erro ao verificar transação {tx_hash}: {e}")
-        return await msg.reply_text("❌ Erro interno ao verificar transação.")
 
 async def listar_pendentes_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Comando admin para listar pagamentos pendentes"""
@@ -1515,8 +1542,148 @@ async def rejeitar_tx_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # =========================
 # Função principal de aprovação
 # =========================
-async def approve_by_usd_and_invite(tg_id, username: Optional[str], tx_hash: str, notify_user: bool = True):
-    """Valida transação e gera convite VIP - aceita UIDs temporários"""
+# Notificações pós-aprovação rodam em background: referência forte até terminarem
+_BACKGROUND_TASKS: set = set()
+
+
+def _spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _BACKGROUND_TASKS.add(task)
+    task.add_done_callback(_BACKGROUND_TASKS.discard)
+    return task
+
+
+def _fresh_validation(tx_hash: str) -> Optional[Tuple[bool, str, Optional[float], Dict[str, Any]]]:
+    """
+    Resultado positivo recente do cache de validação (pending_tx, webapp ou
+    /tx acabaram de validar): a aprovação não repete a busca on-chain.
+    """
+    clean_hash = tx_hash.lower().replace('0x', '')
+    cached = _TX_VALIDATION_CACHE.get('0x' + clean_hash)
+    if not cached or not cached[0] or not cached[2]:
+        return None
+    validated_at = (cached[3] or {}).get('validated_at')
+    if not validated_at or time.time() - validated_at > APPROVAL_REUSE_SECONDS:
+        return None
+    return tuple(cached)
+
+
+def _commit_approval(session_factory, payment, vip_user_id: Optional[int], username: Optional[str],
+                     days: int, first_name: Optional[str] = None):
+    """Payment + VipMembership numa única transação; retorna a validade do VIP (None sem ID real)"""
+    with session_factory() as s:
+        until = _write_approval(s, payment, vip_user_id, username, days, first_name)
+        s.commit()
+        return until
+
+
+def _write_approval(s, payment, vip_user_id: Optional[int], username: Optional[str],
+                    days: int, first_name: Optional[str] = None):
+    """Corpo de _commit_approval sem o commit (reaproveitado pelo async_db.run)"""
+    from utils import vip_upsert_in_session
+
+    s.add(payment)
+    return vip_upsert_in_session(s, vip_user_id, username, days, first_name) if vip_user_id else None
+
+
+def _is_main_session_factory(session_factory) -> bool:
+    """async_db espelha o banco do main; sessões de outra origem (db.py) seguem no executor"""
+    try:
+        from main import SessionLocal
+    except Exception:
+        return False
+    return session_factory is SessionLocal
+
+
+async def _discard_invite(invite_task: asyncio.Task):
+    """Revoga o convite criado em paralelo com um commit que falhou"""
+    try:
+        link = await invite_task
+    except Exception:
+        return
+    if link:
+        from main import revoke_invite_link
+        await revoke_invite_link(link)
+
+
+async def _activate_vip(session_factory, payment, vip_user_id: Optional[int], username: Optional[str],
+                        days: int, first_name: Optional[str] = None, bot=None, chat_id: Optional[int] = None):
+    """
+    Fase 2 da aprovação: grava Payment + VIP (uma transação, no executor)
+    enquanto o convite é criado no Telegram ao mesmo tempo. Se o commit falhar
+    (ex.: hash aprovada por outro caminho no meio tempo), o convite é revogado
+    e a exceção sobe. Retorna (validade do VIP, link ou None).
+    """
+    invite_task = None
+    if bot is not None:
+        from utils import create_invite_link_flexible
+        invite_task = asyncio.create_task(create_invite_link_flexible(bot, chat_id, retries=3))
+
+    try:
+        if _is_main_session_factory(session_factory):
+            until = await async_db.run(_write_approval, payment, vip_user_id, username, days, first_name)
+        else:
+            until = await asyncio.get_running_loop().run_in_executor(
+                None, _commit_approval, session_factory, payment, vip_user_id, username, days, first_name
+            )
+    except BaseException:
+        if invite_task is not None:
+            _spawn(_discard_invite(invite_task))
+        raise
+
+    link = None
+    if invite_task is not None:
+        try:
+            link = await invite_task
+        except Exception as e:
+            LOG.warning(f"[INVITE-DEBUG] Falha ao gerar convite: {e}")
+    return until, link
+
+
+async def _notify_approval(bot, actual_tg_id: int, username: Optional[str], comprovante: str, log_msg: str):
+    """Comprovante no privado + log no grupo de logs, fora do caminho crítico"""
+    async def send_receipt():
+        try:
+            await bot.send_message(chat_id=actual_tg_id, text=comprovante, parse_mode="HTML")
+            LOG.info(f"[NOTIFY] ✅ Comprovante enviado no privado para {actual_tg_id}")
+        except Exception as e:
+            LOG.error(f"[NOTIFY] Erro ao enviar comprovante: {e}")
+
+    async def send_log():
+        try:
+            from main import LOGS_GROUP_ID
+            await bot.send_message(chat_id=LOGS_GROUP_ID, text=log_msg, parse_mode="HTML")
+            LOG.info(f"[NOTIFY] ✅ Log enviado para grupo de logs")
+        except Exception as log_error:
+            LOG.warning(f"[NOTIFY] Erro ao enviar log: {log_error}")
+
+    await asyncio.gather(send_receipt(), send_log())
+
+
+def is_real_tg_id(tg_id: Any) -> bool:
+    """UID real do Telegram (veio via deep link com assinatura): numérico, < 15 dígitos, >= 100000000"""
+    return bool(tg_id) and str(tg_id).isdigit() and len(str(tg_id)) < 15 and int(tg_id) >= 100000000
+
+
+async def approve_by_usd_and_invite(
+    tg_id,
+    username: Optional[str],
+    tx_hash: str,
+    notify_user: bool = True,
+    chain_hint: Optional[str] = None,
+    track_pending: bool = True,
+):
+    """
+    Valida transação e gera convite VIP - aceita UIDs temporários.
+    Transações ainda não encontradas/confirmadas de UIDs reais vão para o
+    pending_tx, que aprova sozinho quando amadurecerem e avisa no privado
+    (track_pending=False é o próprio pending_tx). Hash pendente de outro UID
+    é recusada: fica com quem enviou primeiro.
+
+    Duas fases: (1) validação, reaproveitando um resultado positivo de até
+    APPROVAL_REUSE_SECONDS do cache; (2) Payment + VIP numa transação, com o
+    convite criado em paralelo. Comprovante e log saem em background.
+    """
     try:
         from main import SessionLocal, Payment, GROUP_VIP_ID, application
         bot_available = True
@@ -1536,127 +1703,151 @@ async def approve_by_usd_and_invite(tg_id, username: Optional[str], tx_hash: str
             LOG.error(f"Falha ao importar dependências básicas: {e2}")
             return False, f"Erro de configuração: {e2}", {"error": "config_error"}
     
-    from utils import create_one_time_invite, vip_upsert_and_get_until, choose_plan_from_usd
+    from utils import choose_plan_from_usd
+    from sqlalchemy.exc import IntegrityError
     import datetime as dt
-    
-    # Verificar se hash já existe
-    with SessionLocal() as s:
-        existing = s.query(Payment).filter(Payment.tx_hash == tx_hash).first()
-        if existing:
-            return False, "Hash já usada", {"error": "hash_used"}
 
-    # Resolver pagamento SEMPRE com preços atuais para aprovação justa
-    ok, info, usd, details = await resolve_payment_usd_autochain(
-        tx_hash, force_refresh=True
-    )
+    # Verificar se hash já existe (limitado ao prazo da validação)
+    def hash_used(s) -> bool:
+        return s.query(Payment.id).filter(Payment.tx_hash == tx_hash).first() is not None
+
+    def hash_used_blocking() -> bool:
+        with SessionLocal() as s:
+            return hash_used(s)
+
+    # Hash nova (caso comum) é descartada pelo índice em memória sem ir ao banco
+    used = used_hashes.might_contain(tx_hash)
+    if used is None:
+        if _is_main_session_factory(SessionLocal):
+            used = await deadline.wait(async_db.run(hash_used))
+        else:
+            used = await deadline.wait(asyncio.get_running_loop().run_in_executor(None, hash_used_blocking))
+        if used:
+            used_hashes.remember(tx_hash)
+    if used:
+        return False, "Hash já usada", {"error": "hash_used"}
+
+    # ----- Fase 1: validação -----
+    # Resultado positivo recente é reaproveitado; senão, resolve com preços atuais
+    uid_hint = int(tg_id) if tg_id and str(tg_id).isdigit() else None
+    fresh = _fresh_validation(tx_hash)
+    if fresh is not None:
+        ok, info, usd, details = fresh
+        LOG.info(f"[MANUAL-APPROVAL] Reaproveitando validação recente de {tx_hash[:12]}... (sem nova busca on-chain)")
+    else:
+        ok, info, usd, details = await resolve_payment_usd_autochain(
+            tx_hash, force_refresh=True, user_id=uid_hint, chain_hint=chain_hint
+        )
     
     LOG.info(f"[MANUAL-APPROVAL] Aprovação com preços atuais - Hash: {tx_hash[:12]}... USD: ${float(usd):.4f}" if usd else f"[MANUAL-APPROVAL] Falha na aprovação - Hash: {tx_hash[:12]}...")
     if not ok:
+        if details.get("pending"):
+            # Sem UID real o convite não teria destino: não vai para o pending_tx
+            tracked = False
+            if track_pending and is_real_tg_id(tg_id):
+                try:
+                    tracked = await pending_tracker.track(
+                        tx_hash, details.get("chain_id"), tg_id=tg_id, username=username, reason=info,
+                        chain_hint=resolve_chain_hint(chain_hint),
+                        missing_confirmations=MIN_CONFIRMATIONS - int(details.get("confirmations", 0) or 0),
+                    )
+                except ClaimedByOther:
+                    return False, HASH_CLAIMED, {"error": "hash_claimed", "details": details}
+            if tracked:
+                info = f"⏳ {info}\nVamos reverificar automaticamente e liberar o VIP assim que a transação confirmar."
+            return False, info, {"details": details, "pending": True, "tracked": tracked}
         return False, info, {"details": details}
 
+    # Hash pendente registrada por outro UID: quem enviou primeiro fica com o VIP
+    if track_pending:
+        owner = await pending_tracker.owner(tx_hash)
+        if owner is not None and owner != str(tg_id):
+            LOG.warning(f"[MANUAL-APPROVAL] {tx_hash[:12]}... pendente para {owner}; {tg_id} recusado")
+            return False, HASH_CLAIMED, {"error": "hash_claimed", "details": details}
+
     # Verificar se valor cobre algum plano baseado no valor real (sem preços estáticos)
     days = choose_plan_from_usd(usd or 0.0)
     if not days:
         return False, f"Valor insuficiente (${float(usd):.2f})", {"details": details, "usd": usd}
 
     # Verificar se o UID é válido (veio via deep link com assinatura)
-    # UIDs válidos: numéricos, < 15 dígitos, >= 100000000
-    is_valid_uid = False
-    if tg_id and str(tg_id).isdigit() and len(str(tg_id)) < 15 and int(tg_id) >= 100000000:
-        is_valid_uid = True
+    is_valid_uid = is_real_tg_id(tg_id)
+    if is_valid_uid:
         LOG.info(f"[INVITE-DEBUG] UID válido detectado: {tg_id} - ID real capturado via deep link")
     else:
         LOG.info(f"[INVITE-DEBUG] UID inválido ou ausente: '{tg_id}' - será tratado como temporário")
 
     is_temp_uid = not is_valid_uid
     actual_tg_id = int(tg_id) if is_valid_uid else None
-    until = None
-    link = None
-
-    # Salvar pagamento com ID real (se disponível) ou temporário (user_id=0)
-    with SessionLocal() as s:
-        # Extrair informações do payment para salvar
-        token_symbol = details.get("token_symbol", "Unknown")
-        token_amount = details.get("amount_human", details.get("amount", "N/A"))
 
-        # Usar ID real se disponível, senão usar 0 (temporário)
-        user_id_to_save = actual_tg_id if actual_tg_id else 0
+    # ----- Fase 2: Payment + VIP numa transação, convite em paralelo -----
+    # Extrair informações do payment para salvar
+    token_symbol = details.get("token_symbol", "Unknown")
+    token_amount = details.get("amount_human", details.get("amount", "N/A"))
 
-        if actual_tg_id:
-            LOG.info(f"[PAYMENT-SAVE] Salvando pagamento com user_id={actual_tg_id} (ID real capturado via deep link)")
-        else:
-            LOG.info(f"[PAYMENT-SAVE] Salvando pagamento com user_id=0 (ID será capturado ao entrar no grupo)")
+    # Usar ID real se disponível, senão usar 0 (temporário)
+    user_id_to_save = actual_tg_id if actual_tg_id else 0
 
-        p = Payment(
-            tx_hash=tx_hash,
-            user_id=user_id_to_save,
-            username=username,
-            chain=details.get("chain_id", "unknown"),
-            amount=str(token_amount),
-            token_symbol=token_symbol,
-            usd_value=str(usd),
-            vip_days=days,
-            status="approved",
-            created_at=dt.datetime.now(dt.timezone.utc)
+    if actual_tg_id:
+        LOG.info(f"[PAYMENT-SAVE] Salvando pagamento com user_id={actual_tg_id} (ID real capturado via deep link)")
+    else:
+        # NÃO criar VipMembership aqui - será criado quando usuário entrar no grupo
+        # Isso evita violação de constraint UNIQUE em user_id quando há múltiplos pagamentos pendentes
+        LOG.info(f"[PAYMENT-SAVE] Salvando pagamento com user_id=0 (ID será capturado ao entrar no grupo)")
+
+    p = Payment(
+        tx_hash=tx_hash,
+        user_id=user_id_to_save,
+        username=username,
+        chain=details.get("chain_id", "unknown"),
+        amount=str(token_amount),
+        token_symbol=token_symbol,
+        usd_value=str(usd),
+        vip_days=days,
+        status="approved",
+        created_at=dt.datetime.now(dt.timezone.utc)
+    )
+    bot = application.bot if bot_available and application and application.bot else None
+    try:
+        until, link = await _activate_vip(
+            SessionLocal, p, actual_tg_id, username, days, bot=bot, chat_id=GROUP_VIP_ID
         )
-        s.add(p)
-        s.commit()
-
-        # Se temos ID real, criar ou atualizar VipMembership usando vip_upsert_and_get_until
-        # que já tem lógica de substituição correta
-        if actual_tg_id:
-            from utils import vip_upsert_and_get_until
-
-            # vip_upsert_and_get_until é async, precisa ser chamado fora da sessão
-            pass  # Será executado depois da sessão fechar
-        else:
-            # NÃO criar VipMembership aqui - será criado quando usuário entrar no grupo
-            # Isso evita violação de constraint UNIQUE em user_id quando há múltiplos pagamentos pendentes
-            LOG.info(f"[PAYMENT-SAVE] VIP será criado quando usuário entrar no grupo")
+    except IntegrityError:
+        # Mesma hash aprovada por outro caminho (webapp + /tx + pending_tx) no meio tempo
+        LOG.info(f"[PAYMENT-SAVE] Hash {tx_hash[:12]}... já registrada por outra aprovação")
+        return False, "Hash já usada", {"error": "hash_used"}
 
-    # Criar/atualizar VIP membership se temos ID real (fora da sessão de Payment)
     if actual_tg_id:
-        from utils import vip_upsert_and_get_until
-        until = await vip_upsert_and_get_until(actual_tg_id, username, days)
         LOG.info(f"[VIP-UPSERT] VIP criado/atualizado para {actual_tg_id}: válido até {until.strftime('%d/%m/%Y %H:%M')}")
     else:
         # Para IDs temporários, calcular data estimada
-        import datetime as dt
+        LOG.info(f"[PAYMENT-SAVE] VIP será criado quando usuário entrar no grupo")
         until = dt.datetime.now(dt.timezone.utc) + dt.timedelta(days=days)
 
-    LOG.info(f"[INVITE-DEBUG] Finalizando: is_temp_uid={is_temp_uid}, link={link is not None if link else False}")
+    LOG.info(f"[INVITE-DEBUG] Finalizando: is_temp_uid={is_temp_uid}, link={link is not None}")
 
-    # Calcular data de expiração do VIP para mensagens (sempre usar 'until' se disponível)
-    import datetime as dt
-    vip_until = until if until else (dt.datetime.now(dt.timezone.utc) + dt.timedelta(days=days))
-    vip_until_str = vip_until.strftime('%d/%m/%Y')
+    # Calcular data de expiração do VIP para mensagens
+    vip_until_str = until.strftime('%d/%m/%Y')
 
     # Criar mensagem de boas-vindas personalizada
     plan_names = {30: "Mensal", 90: "Trimestral", 180: "Semestral", 365: "Anual"}
     plan_name = plan_names.get(days, f"{days} dias")
 
     if is_temp_uid:
-        # Para UIDs temporários, ainda gerar convite automático
+        # Para UIDs temporários, o convite também é automático
         # O ID será capturado quando o usuário entrar no grupo
-        if bot_available and application and application.bot:
-            try:
-                from utils import create_invite_link_flexible
-                link = await create_invite_link_flexible(application.bot, GROUP_VIP_ID, retries=3)
-                LOG.info(f"[INVITE-DEBUG] Convite temporário gerado: {link is not None}")
-                if link:
-                    msg = (
-                        f"🎉 <b>PAGAMENTO CONFIRMADO!</b>\n\n"
-                        f"✅ Valor recebido: <b>${float(usd):.2f} USD</b>\n"
-                        f"👑 Plano ativado: <b>{plan_name} ({days} dias)</b>\n"
-                        f"📅 Válido até: <b>{vip_until_str}</b>\n\n"
-                        f"🔗 <b>Clique no link abaixo para entrar no grupo VIP:</b>\n"
-                        f"{link}\n\n"
-                        f"⚠️ <b>IMPORTANTE:</b> Este link expira em 2 horas e tem apenas 1 uso.\n\n"
-                        f"🎁 Seja bem-vindo(a) ao VIP! Aproveite o conteúdo exclusivo!"
-                    )
-                    return True, msg, {"invite": link, "usd": usd, "days": days, "temp_uid": True}
-            except Exception as e:
-                LOG.warning(f"[INVITE-DEBUG] Falha ao gerar convite temporário: {e}")
+        if link:
+            msg = (
+                f"🎉 <b>PAGAMENTO CONFIRMADO!</b>\n\n"
+                f"✅ Valor recebido: <b>${float(usd):.2f} USD</b>\n"
+                f"👑 Plano ativado: <b>{plan_name} ({days} dias)</b>\n"
+                f"📅 Válido até: <b>{vip_until_str}</b>\n\n"
+                f"🔗 <b>Clique no link abaixo para entrar no grupo VIP:</b>\n"
+                f"{link}\n\n"
+                f"⚠️ <b>IMPORTANTE:</b> Este link expira em 2 horas e tem apenas 1 uso.\n\n"
+                f"🎁 Seja bem-vindo(a) ao VIP! Aproveite o conteúdo exclusivo!"
+            )
+            return True, msg, {"invite": link, "usd": usd, "days": days, "temp_uid": True}
 
         # Fallback se não conseguir gerar convite
         msg = (
@@ -1668,150 +1859,144 @@ async def approve_by_usd_and_invite(tg_id, username: Optional[str], tx_hash: str
             f"Obrigado pela preferência! 🙏"
         )
         return True, msg, {"usd": usd, "days": days, "temp_uid": True}
-    else:
-        # ID real capturado via deep link - enviar tudo no privado
-        if bot_available and application and application.bot:
-            try:
-                from utils import create_invite_link_flexible
-                link = await create_invite_link_flexible(application.bot, GROUP_VIP_ID, retries=3)
-                LOG.info(f"[INVITE-REAL-ID] Convite gerado para ID real {actual_tg_id}: {link is not None}")
-
-                # Salvar mapeamento link -> user_id para validação posterior
-                if link:
-                    import hashlib
-                    link_hash = hashlib.md5(link.encode()).hexdigest()[:12]
-                    from main import cfg_set
-                    # Salvar (será limpo manualmente depois ou permanecerá como histórico)
-                    cfg_set(f"invite_link_{link_hash}", str(actual_tg_id))
-                    LOG.info(f"[LINK-PROTECTION] Link protegido para user {actual_tg_id}: {link_hash}")
-
-                # Criar comprovante completo
-                from main import now_utc
-                comprovante = (
-                    f"📜 <b>COMPROVANTE DE PAGAMENTO VIP</b> 📜\n"
-                    f"{'='*35}\n\n"
-
-                    f"📅 <b>Data:</b> {now_utc().strftime('%d/%m/%Y às %H:%M')}\n"
-                    f"👤 <b>Usuário:</b> {username or 'N/A'}\n"
-                    f"🆔 <b>ID Telegram:</b> <code>{actual_tg_id}</code>\n\n"
-
-                    f"💰 <b>DETALHES DO PAGAMENTO</b>\n"
-                    f"• <b>Valor Pago:</b> ${float(usd):.2f} USD\n"
-                    f"• <b>Criptomoeda:</b> {token_symbol}\n"
-                    f"• <b>Quantidade:</b> {token_amount}\n"
-                    f"• <b>Hash:</b> <code>{tx_hash[:16]}...{tx_hash[-8:]}</code>\n\n"
-
-                    f"👑 <b>VIP ATIVADO</b>\n"
-                    f"• <b>Plano:</b> {plan_name}\n"
-                    f"• <b>Duração:</b> {days} dias\n"
-                    f"• <b>Válido até:</b> {until.strftime('%d/%m/%Y às %H:%M')}\n"
-                    f"• <b>Status:</b> ✅ Ativo\n\n"
-                )
 
-                if link:
-                    comprovante += (
-                        f"🔗 <b>CONVITE DO GRUPO VIP</b>\n"
-                        f"{link}\n\n"
-                        f"⚠️ <b>IMPORTANTE:</b> Este link expira em 2 horas e tem apenas 1 uso.\n\n"
-                        f"📁 <b>REGRAS DO GRUPO VIP</b>\n"
-                        f"• Respeite todos os membros\n"
-                        f"• Proibido spam ou conteúdo inapropriado\n"
-                        f"• Não compartilhe links de convite\n"
-                        f"• Mantenha conversa relevante ao tema\n"
-                        f"• Proibido revenda de conteúdo\n\n"
-                        f"🎉 <b>Bem-vindo ao grupo VIP!</b>\n"
-                        f"Aproveite o conteúdo exclusivo!"
-                    )
-                else:
-                    comprovante += (
-                        f"⚠️ Não foi possível gerar o link de convite automaticamente.\n"
-                        f"Entre em contato com o suporte para receber o convite.\n\n"
-                        f"🎁 Seu VIP está ativo e válido!"
-                    )
+    # ID real capturado via deep link - enviar tudo no privado
+    if bot is not None:
+        try:
+            LOG.info(f"[INVITE-REAL-ID] Convite gerado para ID real {actual_tg_id}: {link is not None}")
+
+            # Salvar mapeamento link -> user_id para validação posterior (antes de entregar o link)
+            if link:
+                import hashlib
+                link_hash = hashlib.md5(link.encode()).hexdigest()[:12]
+                from main import cfg_set_async
+                # Salvar (será limpo manualmente depois ou permanecerá como histórico)
+                await cfg_set_async(f"invite_link_{link_hash}", str(actual_tg_id))
+                LOG.info(f"[LINK-PROTECTION] Link protegido para user {actual_tg_id}: {link_hash}")
+
+            # Criar comprovante completo
+            from main import now_utc
+            comprovante = (
+                f"📜 <b>COMPROVANTE DE PAGAMENTO VIP</b> 📜\n"
+                f"{'='*35}\n\n"
+
+                f"📅 <b>Data:</b> {now_utc().strftime('%d/%m/%Y às %H:%M')}\n"
+                f"👤 <b>Usuário:</b> {username or 'N/A'}\n"
+                f"🆔 <b>ID Telegram:</b> <code>{actual_tg_id}</code>\n\n"
+
+                f"💰 <b>DETALHES DO PAGAMENTO</b>\n"
+                f"• <b>Valor Pago:</b> ${float(usd):.2f} USD\n"
+                f"• <b>Criptomoeda:</b> {token_symbol}\n"
+                f"• <b>Quantidade:</b> {token_amount}\n"
+                f"• <b>Hash:</b> <code>{tx_hash[:16]}...{tx_hash[-8:]}</code>\n\n"
+
+                f"👑 <b>VIP ATIVADO</b>\n"
+                f"• <b>Plano:</b> {plan_name}\n"
+                f"• <b>Duração:</b> {days} dias\n"
+                f"• <b>Válido até:</b> {until.strftime('%d/%m/%Y às %H:%M')}\n"
+                f"• <b>Status:</b> ✅ Ativo\n\n"
+            )
 
-                # Enviar comprovante no privado
-                await application.bot.send_message(
-                    chat_id=actual_tg_id,
-                    text=comprovante,
-                    parse_mode="HTML"
+            if link:
+                comprovante += (
+                    f"🔗 <b>CONVITE DO GRUPO VIP</b>\n"
+                    f"{link}\n\n"
+                    f"⚠️ <b>IMPORTANTE:</b> Este link expira em 2 horas e tem apenas 1 uso.\n\n"
+                    f"📁 <b>REGRAS DO GRUPO VIP</b>\n"
+                    f"• Respeite todos os membros\n"
+                    f"• Proibido spam ou conteúdo inapropriado\n"
+                    f"• Não compartilhe links de convite\n"
+                    f"• Mantenha conversa relevante ao tema\n"
+                    f"• Proibido revenda de conteúdo\n\n"
+                    f"🎉 <b>Bem-vindo ao grupo VIP!</b>\n"
+                    f"Aproveite o conteúdo exclusivo!"
+                )
+            else:
+                comprovante += (
+                    f"⚠️ Não foi possível gerar o link de convite automaticamente.\n"
+                    f"Entre em contato com o suporte para receber o convite.\n\n"
+                    f"🎁 Seu VIP está ativo e válido!"
                 )
-                LOG.info(f"[NOTIFY] ✅ Comprovante enviado no privado para {actual_tg_id}")
 
-                # Enviar log para grupo de logs
-                try:
-                    from main import LOGS_GROUP_ID
-                    log_msg = (
-                        f"✅ <b>PAGAMENTO CONFIRMADO VIA DEEP LINK</b>\n"
-                        f"👤 User: <code>{actual_tg_id}</code> (@{username or 'sem_username'})\n"
-                        f"💰 Valor: ${float(usd):.2f} USD\n"
-                        f"📅 Plano: {plan_name} ({days} dias)\n"
-                        f"⏰ VIP até: {until.strftime('%d/%m/%Y %H:%M')}\n"
-                        f"🔗 Link enviado: {'Sim' if link else 'Não'}\n"
-                        f"📨 Comprovante enviado no privado"
-                    )
-                    await application.bot.send_message(
-                        chat_id=LOGS_GROUP_ID,
-                        text=log_msg,
-                        parse_mode="HTML"
-                    )
-                    LOG.info(f"[NOTIFY] ✅ Log enviado para grupo de logs")
-                except Exception as log_error:
-                    LOG.warning(f"[NOTIFY] Erro ao enviar log: {log_error}")
+            log_msg = (
+                f"✅ <b>PAGAMENTO CONFIRMADO VIA DEEP LINK</b>\n"
+                f"👤 User: <code>{actual_tg_id}</code> (@{username or 'sem_username'})\n"
+                f"💰 Valor: ${float(usd):.2f} USD\n"
+                f"📅 Plano: {plan_name} ({days} dias)\n"
+                f"⏰ VIP até: {until.strftime('%d/%m/%Y %H:%M')}\n"
+                f"🔗 Link enviado: {'Sim' if link else 'Não'}\n"
+                f"📨 Comprovante enviado no privado"
+            )
+            # Comprovante no privado + log: em background, a resposta não espera por eles
+            _spawn(_notify_approval(bot, actual_tg_id, username, comprovante, log_msg))
 
-            except Exception as e:
-                LOG.error(f"[NOTIFY] Erro ao enviar comprovante: {e}")
+        except Exception as e:
+            LOG.error(f"[NOTIFY] Erro ao preparar comprovante: {e}")
 
-        # Mensagem de retorno para a página web (com redirecionamento se houver link)
-        if link:
-            msg = (
-                f"🎉 <b>PAGAMENTO CONFIRMADO!</b>\n\n"
-                f"✅ Valor recebido: <b>${float(usd):.2f} USD</b>\n"
-                f"👑 Plano ativado: <b>{plan_name} ({days} dias)</b>\n"
-                f"📅 Válido até: <b>{vip_until_str}</b>\n\n"
-                f"📬 <b>Redirecionando para o grupo VIP...</b>\n"
-                f"Verifique também suas mensagens no Telegram!\n\n"
-                f"🎁 Aproveite o conteúdo exclusivo!"
-            )
-            # Incluir link no payload para redirecionar automaticamente
-            return True, msg, {"invite": link, "usd": usd, "days": days, "private_sent": True}
-        else:
-            msg = (
-                f"🎉 <b>PAGAMENTO CONFIRMADO!</b>\n\n"
-                f"✅ Valor recebido: <b>${float(usd):.2f} USD</b>\n"
-                f"👑 Plano ativado: <b>{plan_name} ({days} dias)</b>\n"
-                f"📅 Válido até: <b>{vip_until_str}</b>\n\n"
-                f"📬 <b>Verifique suas mensagens no Telegram!</b>\n"
-                f"Enviamos o comprovante no seu privado.\n\n"
-                f"🎁 Entre em contato para receber o convite do grupo!"
-            )
-            return True, msg, {"usd": usd, "days": days, "private_sent": True}
+    # Mensagem de retorno para a página web (com redirecionamento se houver link)
+    if link:
+        msg = (
+            f"🎉 <b>PAGAMENTO CONFIRMADO!</b>\n\n"
+            f"✅ Valor recebido: <b>${float(usd):.2f} USD</b>\n"
+            f"👑 Plano ativado: <b>{plan_name} ({days} dias)</b>\n"
+            f"📅 Válido até: <b>{vip_until_str}</b>\n\n"
+            f"📬 <b>Redirecionando para o grupo VIP...</b>\n"
+            f"Verifique também suas mensagens no Telegram!\n\n"
+            f"🎁 Aproveite o conteúdo exclusivo!"
+        )
+        # Incluir link no payload para redirecionar automaticamente
+        return True, msg, {"invite": link, "usd": usd, "days": days, "private_sent": True}
+    else:
+        msg = (
+            f"🎉 <b>PAGAMENTO CONFIRMADO!</b>\n\n"
+            f"✅ Valor recebido: <b>${float(usd):.2f} USD</b>\n"
+            f"👑 Plano ativado: <b>{plan_name} ({days} dias)</b>\n"
+            f"📅 Válido até: <b>{vip_until_str}</b>\n\n"
+            f"📬 <b>Verifique suas mensagens no Telegram!</b>\n"
+            f"Enviamos o comprovante no seu privado.\n\n"
+            f"🎁 Entre em contato para receber o convite do grupo!"
+        )
+        return True, msg, {"usd": usd, "days": days, "private_sent": True}
 
 # =========================
 # Função para verificar se hash já foi usada
 # =========================
 async def hash_exists(tx_hash: str) -> bool:
-    """Verifica se hash já foi usada"""
-    from main import SessionLocal, Payment
-    with SessionLocal() as s:
-        return bool(s.query(Payment).filter(Payment.tx_hash == tx_hash).first())
+    """
+    Verifica se hash já foi usada. O índice em memória (used_hashes) responde
+    as hashes novas e as recém-usadas; só as "talvez" consultam o banco.
+    """
+    known = used_hashes.might_contain(tx_hash)
+    if known is not None:
+        return known
+
+    from main import Payment
+
+    def query(s) -> bool:
+        return s.query(Payment.id).filter(Payment.tx_hash == tx_hash).first() is not None
+
+    exists = await async_db.run(query)
+    if exists:
+        used_hashes.remember(tx_hash)
+    return exists
 
 # =========================
 # Função para salvar hash de pagamento
 # =========================
 async def store_payment_hash(tx_hash: str, tg_id: int):
     """Salva hash de pagamento no banco"""
-    from main import SessionLocal, Payment
+    from main import Payment
     import datetime as dt
-    
-    with SessionLocal() as s:
-        p = Payment(
+
+    def insert(s):
+        s.add(Payment(
             tx_hash=tx_hash,
             user_id=tg_id,
             status="approved",
             created_at=dt.datetime.now(dt.timezone.utc)
-        )
-        s.add(p)
-        s.commit()
+        ))
+
+    await async_db.run(insert)
 
 # =========================
 # Função para obter preços do banco
@@ -0,0 +1,320 @@
+# pending_tx.py
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from chain_head import BLOCK_TIMES, DEFAULT_BLOCK_TIME
+
+LOG = logging.getLogger(__name__)
+
+# Intervalo do laço que procura reverificações vencidas
+PENDING_TICK_SECONDS = float(os.getenv("PENDING_TICK_SECONDS", "5"))
+# Limites do backoff (segundos)
+PENDING_MIN_DELAY = float(os.getenv("PENDING_MIN_DELAY", "5"))
+PENDING_MAX_DELAY = float(os.getenv("PENDING_MAX_DELAY", "1800"))
+# Base do backoff quando a chain ainda é desconhecida (cada tentativa é uma busca completa)
+PENDING_UNKNOWN_CHAIN_DELAY = float(os.getenv("PENDING_UNKNOWN_CHAIN_DELAY", "30"))
+# Após este tempo a transação deixa de ser acompanhada
+PENDING_TX_MAX_AGE = int(os.getenv("PENDING_TX_MAX_AGE", str(24 * 3600)))
+PENDING_BATCH = int(os.getenv("PENDING_BATCH", "20"))
+PENDING_CONCURRENCY = int(os.getenv("PENDING_CONCURRENCY", "5"))
+
+STATUS_WAITING = "waiting"
+STATUS_APPROVED = "approved"
+STATUS_FAILED = "failed"
+STATUS_EXPIRED = "expired"
+
+
+class ClaimedByOther(Exception):
+    """Hash pendente já registrada por outro usuário (quem enviou primeiro fica com ela)"""
+
+
+def _aware(value: Optional[datetime]) -> Optional[datetime]:
+    # SQLite devolve datetimes sem fuso; tudo aqui é gravado em UTC
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def backoff_delay(chain_id: Optional[str], attempts: int, missing_confirmations: int = 1) -> float:
+    """
+    Próxima reverificação: tempo dos blocos que faltam na chain, dobrando a
+    cada tentativa sem sucesso (limitado a PENDING_MIN_DELAY..PENDING_MAX_DELAY).
+    """
+    if chain_id:
+        base = BLOCK_TIMES.get(chain_id, DEFAULT_BLOCK_TIME) * max(1, missing_confirmations)
+    else:
+        base = PENDING_UNKNOWN_CHAIN_DELAY
+    delay = base * (2 ** min(attempts, 16))
+    return min(PENDING_MAX_DELAY, max(PENDING_MIN_DELAY, delay))
+
+
+@dataclass
+class PendingEntry:
+    tx_hash: str
+    chain_id: Optional[str]
+    chain_hint: Optional[str]
+    tg_id: Optional[str]
+    username: Optional[str]
+    attempts: int
+    created_at: datetime
+
+
+class PendingTxTracker:
+    """
+    Acompanha transações que ainda não puderam ser aprovadas (não encontradas
+    ou com confirmações insuficientes), em vez de guardar o resultado negativo
+    em cache e depender do usuário reenviar.
+
+    Cada transação fica na tabela pending_txs com a próxima verificação
+    agendada. Com a chain conhecida, a reverificação consulta só aquela
+    chain; o intervalo acompanha o tempo de bloco e dobra a cada tentativa.
+    Quando o pagamento amadurece, approve_by_usd_and_invite é chamado e o
+    usuário recebe o convite sem precisar fazer nada. Por isso só entram
+    transações com UID real do Telegram (sem ele o convite não tem destino),
+    e o dono é sempre o primeiro UID que enviou a hash.
+    """
+
+    def __init__(self):
+        self._session_factory: Optional[Callable] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: set = set()
+        self.stats = {"tracked": 0, "checks": 0, "approved": 0, "failed": 0, "expired": 0}
+
+    def configure(self, session_factory: Callable):
+        self._session_factory = session_factory
+
+    async def _run_db(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    # ----- registro -----
+    def _upsert(self, tx_hash: str, chain_id: Optional[str], chain_hint: Optional[str],
+                tg_id: Optional[str], username: Optional[str], reason: str, delay: float) -> bool:
+        from models import PendingTx
+
+        now = datetime.now(timezone.utc)
+        with self._session_factory() as s:
+            row = s.query(PendingTx).filter(PendingTx.tx_hash == tx_hash).first()
+            created = row is None
+            if row is None:
+                row = PendingTx(tx_hash=tx_hash, attempts=0, next_check_at=now + timedelta(seconds=delay))
+                s.add(row)
+            elif row.status != STATUS_WAITING:
+                # Reenvio de uma transação que já tinha expirado/falhado: volta a acompanhar
+                row.status = STATUS_WAITING
+                row.attempts = 0
+                row.next_check_at = now + timedelta(seconds=delay)
+            elif tg_id and row.tg_id and row.tg_id != tg_id:
+                raise ClaimedByOther(row.tg_id)
+            row.chain_id = chain_id or row.chain_id
+            row.chain_hint = chain_hint or row.chain_hint
+            row.tg_id = row.tg_id or tg_id
+            row.username = row.username or username
+            row.last_reason = reason
+            row.updated_at = now
+            s.commit()
+        return created
+
+    async def track(self,
+                    tx_hash: str,
+                    chain_id: Optional[str] = None,
+                    tg_id: Any = None,
+                    username: Optional[str] = None,
+                    reason: str = "",
+                    chain_hint: Optional[str] = None,
+                    missing_confirmations: int = 1) -> bool:
+        """
+        Agenda a transação para reverificação automática; retorna False se
+        indisponível. ClaimedByOther se outro tg_id já acompanha a mesma hash.
+        """
+        if self._session_factory is None:
+            return False
+        tx_hash = tx_hash.lower()
+        delay = backoff_delay(chain_id, 0, missing_confirmations)
+        try:
+            created = await self._run_db(
+                self._upsert, tx_hash, chain_id, chain_hint,
+                str(tg_id) if tg_id is not None else None, username, reason, delay,
+            )
+        except ClaimedByOther as e:
+            LOG.warning(f"[PENDING] {tx_hash[:12]}... já acompanhada para {e}; {tg_id} recusado")
+            raise
+        except Exception as e:
+            LOG.warning(f"[PENDING] Falha ao registrar {tx_hash[:12]}...: {e}")
+            return False
+        if created:
+            self.stats["tracked"] += 1
+            LOG.info(f"[PENDING] {tx_hash[:12]}... acompanhada (chain={chain_id or '?'}, próxima em {delay:.0f}s)")
+        return True
+
+    def _owner(self, tx_hash: str) -> Optional[str]:
+        from models import PendingTx
+
+        with self._session_factory() as s:
+            row = s.query(PendingTx.tg_id).filter(PendingTx.tx_hash == tx_hash).first()
+            return row[0] if row else None
+
+    async def owner(self, tx_hash: str) -> Optional[str]:
+        """tg_id de quem registrou a hash como pendente (None se ninguém ou indisponível)"""
+        if self._session_factory is None:
+            return None
+        try:
+            return await self._run_db(self._owner, tx_hash.lower())
+        except Exception as e:
+            LOG.warning(f"[PENDING] Falha ao consultar dono de {tx_hash[:12]}...: {e}")
+            return None
+
+    # ----- agendamento -----
+    def _due(self) -> List[PendingEntry]:
+        from models import PendingTx
+
+        now = datetime.now(timezone.utc)
+        with self._session_factory() as s:
+            rows = (
+                s.query(PendingTx)
+                .filter(PendingTx.status == STATUS_WAITING, PendingTx.next_check_at <= now)
+                .order_by(PendingTx.next_check_at)
+                .limit(PENDING_BATCH)
+                .all()
+            )
+            return [
+                PendingEntry(
+                    tx_hash=row.tx_hash,
+                    chain_id=row.chain_id,
+                    chain_hint=row.chain_hint,
+                    tg_id=row.tg_id,
+                    username=row.username,
+                    attempts=row.attempts,
+                    created_at=_aware(row.created_at),
+                )
+                for row in rows
+                if row.tx_hash not in self._inflight
+            ]
+
+    def _update(self, tx_hash: str, status: str, reason: str,
+                chain_id: Optional[str] = None, delay: Optional[float] = None):
+        from models import PendingTx
+
+        now = datetime.now(timezone.utc)
+        with self._session_factory() as s:
+            row = s.query(PendingTx).filter(PendingTx.tx_hash == tx_hash).first()
+            if row is None:
+                return
+            row.status = status
+            row.last_reason = reason
+            row.chain_id = chain_id or row.chain_id
+            row.updated_at = now
+            if delay is not None:
+                row.attempts = row.attempts + 1
+                row.next_check_at = now + timedelta(seconds=delay)
+            s.commit()
+
+    async def _check(self, entry: PendingEntry, sem: asyncio.Semaphore):
+        from payments import (
+            MIN_CONFIRMATIONS, approve_by_usd_and_invite, is_real_tg_id, resolve_payment_on_known_chain,
+        )
+
+        async with sem:
+            self.stats["checks"] += 1
+            age = (datetime.now(timezone.utc) - entry.created_at).total_seconds()
+            if age > PENDING_TX_MAX_AGE:
+                self.stats["expired"] += 1
+                LOG.info(f"[PENDING] {entry.tx_hash[:12]}... expirou após {entry.attempts} tentativas")
+                await self._run_db(self._update, entry.tx_hash, STATUS_EXPIRED, "Expirada sem confirmação")
+                return
+
+            if not is_real_tg_id(entry.tg_id):
+                # Registro antigo com UID temporário: aprovar geraria um convite sem destinatário
+                self.stats["failed"] += 1
+                LOG.info(f"[PENDING] {entry.tx_hash[:12]}... sem UID real ({entry.tg_id}) - deixando de acompanhar")
+                await self._run_db(self._update, entry.tx_hash, STATUS_FAILED, "Sem UID do Telegram para o convite")
+                return
+
+            ok, reason, _usd, details = await resolve_payment_on_known_chain(entry.tx_hash, entry.chain_id, entry.chain_hint)
+            chain_id = details.get("chain_id") or entry.chain_id
+
+            if details.get("pending"):
+                missing = MIN_CONFIRMATIONS - int(details.get("confirmations", 0) or 0)
+                delay = backoff_delay(chain_id, entry.attempts + 1, missing)
+                await self._run_db(self._update, entry.tx_hash, STATUS_WAITING, reason, chain_id, delay)
+                return
+
+            if not ok:
+                self.stats["failed"] += 1
+                LOG.info(f"[PENDING] {entry.tx_hash[:12]}... falhou: {reason}")
+                await self._run_db(self._update, entry.tx_hash, STATUS_FAILED, reason, chain_id)
+                return
+
+            # Pagamento maduro: aprovação completa (registro, VIP, convite e notificações)
+            approved, msg, payload = await approve_by_usd_and_invite(
+                entry.tg_id, entry.username, entry.tx_hash,
+                notify_user=True, chain_hint=chain_id, track_pending=False,
+            )
+            if approved or payload.get("error") == "hash_used":
+                self.stats["approved"] += 1
+                LOG.info(f"[PENDING] ✅ {entry.tx_hash[:12]}... aprovada automaticamente")
+                await self._run_db(self._update, entry.tx_hash, STATUS_APPROVED, "Aprovada", chain_id)
+            elif (payload.get("details") or {}).get("pending"):
+                delay = backoff_delay(chain_id, entry.attempts + 1)
+                await self._run_db(self._update, entry.tx_hash, STATUS_WAITING, msg, chain_id, delay)
+            else:
+                self.stats["failed"] += 1
+                await self._run_db(self._update, entry.tx_hash, STATUS_FAILED, msg, chain_id)
+
+    async def _run_check(self, entry: PendingEntry, sem: asyncio.Semaphore):
+        from rpc_client import background
+
+        self._inflight.add(entry.tx_hash)
+        try:
+            # Reverificação não tem pressa: sem hedges gastando cota de outros endpoints
+            with background():
+                await self._check(entry, sem)
+        except Exception as e:
+            LOG.warning(f"[PENDING] Erro ao reverificar {entry.tx_hash[:12]}...: {e}")
+            delay = backoff_delay(entry.chain_id, entry.attempts + 1)
+            try:
+                await self._run_db(self._update, entry.tx_hash, STATUS_WAITING, str(e)[:200], None, delay)
+            except Exception:
+                pass
+        finally:
+            self._inflight.discard(entry.tx_hash)
+
+    async def _loop(self):
+        sem = asyncio.Semaphore(PENDING_CONCURRENCY)
+        while True:
+            try:
+                for entry in await self._run_db(self._due):
+                    asyncio.create_task(self._run_check(entry, sem))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                LOG.error(f"[PENDING] Erro no laço de reverificação: {e}")
+            await asyncio.sleep(PENDING_TICK_SECONDS)
+
+    def start(self):
+        """Inicia o laço de reverificação (precisa do event loop ativo)"""
+        if self._session_factory is None:
+            LOG.info("[PENDING] Não configurado - reverificação automática desativada")
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+            LOG.info("[PENDING] Reverificação automática de transações pendentes iniciada")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "in_flight": len(self._inflight)}
+
+
+# Instância global do tracker
+pending_tracker = PendingTxTracker()
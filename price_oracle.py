@@ -0,0 +1,266 @@
+# price_oracle.py
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Awaitable, Callable, Dict, Mapping, Optional, Set
+
+import httpx
+
+import deadline
+from quota_budget import quota_budget, retry_after
+from singleflight import SingleFlight
+
+LOG = logging.getLogger(__name__)
+
+COINGECKO_API_KEY = os.getenv("COINGECKO_API_KEY", "").strip()
+COINGECKO_BASE_URL = "https://api.coingecko.com/api/v3"
+# Intervalo entre atualizações em lote (1 chamada simple/price por ciclo)
+PRICE_REFRESH_SECONDS = int(os.getenv("PRICE_REFRESH_SECONDS", "120"))
+PRICE_HTTP_TIMEOUT = float(os.getenv("PRICE_HTTP_TIMEOUT", "12"))
+
+
+@dataclass(frozen=True)
+class PriceSnapshot:
+    """Foto imutável dos preços (USD) em um instante"""
+    prices: Mapping[str, float]
+    sources: Mapping[str, str]
+    updated_at: float
+    # Quando cada preço veio de fonte viva (ausente: estático/snapshot em disco)
+    fetched_at: Mapping[str, float]
+
+    def get(self, key: str) -> Optional[float]:
+        return self.prices.get(key)
+
+
+class PriceOracle:
+    """
+    Serviço central de preços.
+
+    Um loop assíncrono atualiza, em um único simple/price em lote, todos os
+    ativos registrados (nativos das chains e tokens mapeados), mais um
+    simple/token_price por plataforma para tokens precificados por contrato.
+    Cada ciclo publica um novo PriceSnapshot imutável; as leituras só pegam a
+    referência atual, sem lock e sem esperar HTTP.
+
+    Chaves: cg_id (ex.: "ethereum") e "chain_id:endereço" para contratos.
+    """
+
+    def __init__(self, interval: int = PRICE_REFRESH_SECONDS):
+        self.interval = interval
+        self._snapshot = PriceSnapshot(MappingProxyType({}), MappingProxyType({}), 0.0, MappingProxyType({}))
+        self._assets: Set[str] = set()
+        self._tokens: Dict[str, Dict[str, str]] = {}  # plataforma -> {endereço: chain_id}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+        # Fonte alternativa por cg_id (ex.: Binance/Kraken) quando o CoinGecko falha
+        self.backup_fetcher: Optional[Callable[[str], Awaitable[Optional[float]]]] = None
+        # Onde gravar os preços vivos (ex.: BoundedTTLCache persistente) para sobreviver a reinícios
+        self.store = None
+        self.stats = {"refreshes": 0, "failures": 0}
+        # Atualizações concorrentes (loop, /atualizar_precos, tokens novos) viram uma só
+        self._flight = SingleFlight("price")
+
+    # ----- leitura (lock-free) -----
+    @property
+    def snapshot(self) -> PriceSnapshot:
+        return self._snapshot
+
+    def get(self, key: str) -> Optional[float]:
+        return self._snapshot.prices.get(key)
+
+    def source(self, key: str) -> Optional[str]:
+        return self._snapshot.sources.get(key)
+
+    def age(self, key: Optional[str] = None) -> float:
+        """
+        Segundos desde a última atualização bem-sucedida; com `key`, desde
+        que aquele preço veio de fonte viva (inf se nunca veio).
+        """
+        at = self._snapshot.updated_at if key is None else self._snapshot.fetched_at.get(key)
+        if not at:
+            return float("inf")
+        return time.time() - at
+
+    # ----- registro de ativos -----
+    def seed(self, prices: Dict[str, float], source: str = "manual"):
+        """Preços iniciais (fallback estático ou snapshot); só substitui preços estáticos"""
+        merged = dict(self._snapshot.prices)
+        sources = dict(self._snapshot.sources)
+        for key, px in prices.items():
+            if sources.get(key, "manual") == "manual":
+                merged[key] = float(px)
+                sources[key] = source
+        self._publish(merged, sources, self._snapshot.updated_at, dict(self._snapshot.fetched_at))
+
+    def track_asset(self, cg_id: str):
+        if cg_id:
+            self._assets.add(cg_id)
+
+    def track_token(self, chain_id: str, platform: str, address: str):
+        if platform and address:
+            self._tokens.setdefault(platform, {})[address.lower()] = chain_id
+
+    # ----- atualização -----
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            headers = {"x-cg-pro-api-key": COINGECKO_API_KEY} if COINGECKO_API_KEY else {}
+            self._client = httpx.AsyncClient(timeout=PRICE_HTTP_TIMEOUT, headers=headers)
+        return self._client
+
+    async def _cg_get(self, path: str, params: Dict[str, str]) -> Optional[dict]:
+        """
+        GET no CoinGecko sem espera/retry: o próximo ciclo é o retry.
+        Sem folga na cota, nem tenta (nativos seguem pelo backup_fetcher).
+        Chamado dentro de uma validação, respeita o prazo dela (deadline).
+        """
+        if not deadline.can_afford():
+            LOG.info(f"[ORACLE] Sem prazo para consultar {path} - pulando")
+            return None
+        if not quota_budget.allow("coingecko"):
+            LOG.info(f"[ORACLE] Cota do CoinGecko sem folga - pulando {path}")
+            return None
+        try:
+            r = await self.client.get(
+                f"{COINGECKO_BASE_URL}{path}", params=params, timeout=deadline.clamp(PRICE_HTTP_TIMEOUT)
+            )
+        except Exception as e:
+            LOG.warning(f"[ORACLE] Erro CoinGecko {path}: {str(e)[:80]}")
+            return None
+        if r.status_code == 429:
+            LOG.warning(f"[ORACLE] Rate limit (429) em {path} - mantendo snapshot atual")
+            quota_budget.note_rate_limited("coingecko", retry_after(r.headers))
+            return None
+        if r.status_code != 200:
+            LOG.warning(f"[ORACLE] CoinGecko {path} HTTP {r.status_code}")
+            return None
+        return r.json()
+
+    def _publish(self, prices: Dict[str, float], sources: Dict[str, str], updated_at: float,
+                 fetched_at: Dict[str, float]):
+        # Troca de referência atômica: leitores veem o snapshot antigo ou o novo inteiro
+        self._snapshot = PriceSnapshot(
+            MappingProxyType(prices), MappingProxyType(sources), updated_at, MappingProxyType(fetched_at)
+        )
+
+    async def refresh(self) -> int:
+        """Atualiza todos os ativos registrados; retorna quantos preços vieram de fonte viva"""
+        return await self._flight.do("refresh", self._refresh)
+
+    async def _refresh(self) -> int:
+        prices: Dict[str, float] = {}
+        sources: Dict[str, str] = {}
+        updated = 0
+
+        ids = sorted(self._assets)
+        if ids:
+            data = await self._cg_get("/simple/price", {"ids": ",".join(ids), "vs_currencies": "usd"}) or {}
+            for cg_id in ids:
+                usd = (data.get(cg_id) or {}).get("usd")
+                if usd:
+                    prices[cg_id] = float(usd)
+                    sources[cg_id] = "coingecko"
+                    updated += 1
+                elif self.backup_fetcher is not None:
+                    px = await self.backup_fetcher(cg_id)
+                    if px:
+                        prices[cg_id] = float(px)
+                        sources[cg_id] = "backup-api"
+                        updated += 1
+
+        for platform, tokens in list(self._tokens.items()):
+            addresses = sorted(tokens)
+            data = await self._cg_get(
+                f"/simple/token_price/{platform}",
+                {"contract_addresses": ",".join(addresses), "vs_currencies": "usd"},
+            ) or {}
+            for addr, value in data.items():
+                chain_id = tokens.get(addr.lower())
+                usd = (value or {}).get("usd")
+                if chain_id and usd:
+                    key = f"{chain_id}:{addr.lower()}"
+                    prices[key] = float(usd)
+                    sources[key] = "coingecko"
+                    updated += 1
+
+        if updated:
+            self.stats["refreshes"] += 1
+            # Mescla sobre o snapshot atual (pode ter ganho tokens durante o ciclo)
+            merged = dict(self._snapshot.prices)
+            merged.update(prices)
+            merged_sources = dict(self._snapshot.sources)
+            merged_sources.update(sources)
+            now = time.time()
+            fetched_at = dict(self._snapshot.fetched_at)
+            fetched_at.update((key, now) for key in prices)
+            self._publish(merged, merged_sources, now, fetched_at)
+            if self.store is not None:
+                for key, px in prices.items():
+                    self.store.set(key, px)
+            LOG.info(f"[ORACLE] {updated} preços atualizados ({len(merged)} no snapshot)")
+        else:
+            self.stats["failures"] += 1
+            LOG.warning("[ORACLE] Nenhum preço atualizado neste ciclo - mantendo snapshot anterior")
+        return updated
+
+    async def refresh_token(self, chain_id: str, platform: str, address: str) -> Optional[float]:
+        """Busca imediata de um token ainda fora do snapshot (primeira vez que aparece)"""
+        self.track_token(chain_id, platform, address)
+        addr = address.lower()
+        return await self._flight.do(
+            f"token:{chain_id}:{addr}", lambda: self._fetch_token(chain_id, platform, addr)
+        )
+
+    async def _fetch_token(self, chain_id: str, platform: str, addr: str) -> Optional[float]:
+        data = await self._cg_get(
+            f"/simple/token_price/{platform}",
+            {"contract_addresses": addr, "vs_currencies": "usd"},
+        ) or {}
+        for k, value in data.items():
+            usd = (value or {}).get("usd")
+            if k.lower() == addr and usd:
+                key = f"{chain_id}:{addr}"
+                prices = dict(self._snapshot.prices)
+                sources = dict(self._snapshot.sources)
+                fetched_at = dict(self._snapshot.fetched_at)
+                prices[key] = float(usd)
+                sources[key] = "coingecko"
+                fetched_at[key] = time.time()
+                self._publish(prices, sources, self._snapshot.updated_at, fetched_at)
+                return float(usd)
+        return None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                LOG.error(f"[ORACLE] Erro no ciclo de atualização: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Inicia o loop de atualização (precisa do event loop ativo)"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+            LOG.info(f"[ORACLE] Loop de preços iniciado ({len(self._assets)} ativos, a cada {self.interval}s)")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+# Instância global do oráculo
+price_oracle = PriceOracle()
@@ -231,13 +231,9 @@ async def payment_validation_handler(data: Dict[str, Any]):
     user_id = data['user_id']
     username = data.get('username')
 
-    LOG.info(f"Validando pagamento em background: {tx_hash}")
+    LOG.info(f"Validando pagamento em background: {tx_hash} (user {user_id} @{username or '-'})")
 
-    result = await resolve_payment_usd_autochain(
-        tx_hash=tx_hash,
-        tg_uid=user_id,
-        username=username
-    )
+    result = await resolve_payment_usd_autochain(tx_hash, user_id=user_id)
 
     LOG.info(f"Pagamento validado: {tx_hash} - Resultado: {result}")
     return result
@@ -0,0 +1,226 @@
+# quota_budget.py
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+LOG = logging.getLogger(__name__)
+
+# Cotas padrão dos provedores gratuitos: {provedor: {janela_em_segundos: máximo}}
+# (CoinGecko Demo: 30/min e 10k/mês; Binance: peso 6000/min, ticker = 2; Kraken: ~1 req/s)
+DEFAULT_QUOTAS: Dict[str, Dict[int, int]] = {
+    "coingecko": {60: 25, 30 * 86400: 10000},
+    "binance": {60: 1000},
+    "kraken": {60: 50},
+}
+# Cota aplicada a cada host de RPC público sem entrada própria
+DEFAULT_RPC_QUOTA: Dict[int, int] = {1: 20, 86400: 200000}
+# Provedor é considerado sem folga ao atingir esta fração da cota (antes do 429)
+QUOTA_SOFT_RATIO = float(os.getenv("QUOTA_SOFT_RATIO", "0.9"))
+# Pausa padrão após um 429 sem Retry-After (segundos)
+QUOTA_BACKOFF_SECONDS = float(os.getenv("QUOTA_BACKOFF_SECONDS", "60"))
+QUOTA_FLUSH_SECONDS = float(os.getenv("QUOTA_FLUSH_SECONDS", "30"))
+
+
+def retry_after(headers) -> Optional[float]:
+    """Segundos do header Retry-After (None se ausente ou em formato de data)"""
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _load_quotas() -> Dict[str, Dict[int, int]]:
+    """Cotas padrão + QUOTA_LIMITS (JSON, ex.: {"coingecko": {"60": 30}, "rpc.ankr.com": {"1": 30}})"""
+    quotas = {name: dict(limits) for name, limits in DEFAULT_QUOTAS.items()}
+    raw = os.getenv("QUOTA_LIMITS", "").strip()
+    if raw:
+        try:
+            for name, limits in json.loads(raw).items():
+                quotas[name] = {int(window): int(limit) for window, limit in limits.items()}
+        except Exception as e:
+            LOG.warning(f"[QUOTA] QUOTA_LIMITS inválido, usando padrões: {e}")
+    return quotas
+
+
+class QuotaBudget:
+    """
+    Livro-caixa de cotas por provedor (CoinGecko, Binance, Kraken e cada host
+    de RPC) em janelas fixas (por segundo, minuto, dia, mês).
+
+    Cada requisição é contada com spend(); has_headroom() diz se o provedor
+    ainda está abaixo de QUOTA_SOFT_RATIO de todas as suas janelas e não
+    recebeu 429 recentemente. Quem escolhe provedor (oráculo de preços, APIs
+    de backup, roteamento de RPC) usa isso para desviar o tráfego antes de
+    tomar bloqueio. As contagens vão para a tabela quota_usage, então cotas
+    diárias/mensais sobrevivem a reinícios.
+    """
+
+    def __init__(self):
+        self.quotas = _load_quotas()
+        # (provedor, janela, início) -> contagem
+        self._counts: Dict[Tuple[str, int, int], int] = defaultdict(int)
+        self._dirty: Dict[Tuple[str, int, int], int] = defaultdict(int)
+        self._blocked_until: Dict[str, float] = {}
+        self._session_factory: Optional[Callable] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"spent": 0, "denied": 0, "rate_limited": 0}
+
+    def limits(self, provider: str) -> Dict[int, int]:
+        limits = self.quotas.get(provider)
+        if limits is None and "." in provider:
+            return DEFAULT_RPC_QUOTA
+        return limits or {}
+
+    @staticmethod
+    def _window_start(window: int, now: float) -> int:
+        return int(now // window) * window
+
+    def used(self, provider: str, window: int, now: Optional[float] = None) -> int:
+        now = now or time.time()
+        return self._counts.get((provider, window, self._window_start(window, now)), 0)
+
+    def headroom(self, provider: str) -> float:
+        """Fração livre da janela mais apertada (0.0 = esgotado/bloqueado, 1.0 = livre)"""
+        now = time.time()
+        if self._blocked_until.get(provider, 0) > now:
+            return 0.0
+        free = 1.0
+        for window, limit in self.limits(provider).items():
+            if limit > 0:
+                free = min(free, max(0.0, 1.0 - self.used(provider, window, now) / limit))
+        return free
+
+    def has_headroom(self, provider: str, cost: int = 1) -> bool:
+        now = time.time()
+        if self._blocked_until.get(provider, 0) > now:
+            return False
+        for window, limit in self.limits(provider).items():
+            if self.used(provider, window, now) + cost > limit * QUOTA_SOFT_RATIO:
+                return False
+        return True
+
+    def allow(self, provider: str, cost: int = 1) -> bool:
+        """has_headroom + spend: reserva a cota se houver folga"""
+        if not self.has_headroom(provider, cost):
+            self.stats["denied"] += 1
+            return False
+        self.spend(provider, cost)
+        return True
+
+    def spend(self, provider: str, cost: int = 1):
+        now = time.time()
+        for window in self.limits(provider):
+            key = (provider, window, self._window_start(window, now))
+            self._counts[key] += cost
+            # Só janelas longas valem persistir (as curtas já passaram no reinício)
+            if window >= 60:
+                self._dirty[key] += cost
+        self.stats["spent"] += cost
+
+    def note_rate_limited(self, provider: str, retry_after: Optional[float] = None):
+        """Provedor respondeu 429/418: sem tráfego até o Retry-After"""
+        pause = retry_after if retry_after and retry_after > 0 else QUOTA_BACKOFF_SECONDS
+        self._blocked_until[provider] = time.time() + pause
+        self.stats["rate_limited"] += 1
+        LOG.warning(f"[QUOTA] {provider} limitou as requisições - desviando tráfego por {pause:.0f}s")
+
+    def order(self, providers: Iterable[str], key: Callable[[str], str] = lambda p: p) -> List[str]:
+        """Mantém a ordem recebida, mas move para o fim quem está sem folga"""
+        providers = list(providers)
+        ok = [p for p in providers if self.has_headroom(key(p))]
+        return ok + [p for p in providers if p not in ok]
+
+    # ----- persistência -----
+    def _prune(self, now: float):
+        for key in [k for k in self._counts if k[2] + k[1] <= now]:
+            del self._counts[key]
+
+    def load_from_db(self, session_factory: Callable) -> int:
+        """Carrega as contagens das janelas ainda abertas"""
+        from models import QuotaUsage
+
+        self._session_factory = session_factory
+        now = time.time()
+        loaded = 0
+        with session_factory() as s:
+            rows = s.query(QuotaUsage).filter(QuotaUsage.window_start > int(now) - 31 * 86400).all()
+            for row in rows:
+                if row.window_start + row.window_seconds > now:
+                    key = (row.provider, row.window_seconds, row.window_start)
+                    self._counts[key] = max(self._counts[key], row.count)
+                    loaded += 1
+        LOG.info(f"[QUOTA] {loaded} janelas de cota carregadas do banco")
+        return loaded
+
+    def _save(self, pending: Dict[Tuple[str, int, int], int]):
+        from models import QuotaUsage
+
+        with self._session_factory() as s:
+            for (provider, window, start), delta in pending.items():
+                row = s.query(QuotaUsage).filter(
+                    QuotaUsage.provider == provider,
+                    QuotaUsage.window_seconds == window,
+                    QuotaUsage.window_start == start,
+                ).first()
+                if row is None:
+                    s.add(QuotaUsage(provider=provider, window_seconds=window, window_start=start, count=delta))
+                else:
+                    row.count = row.count + delta
+            # Janelas encerradas há mais de um mês não servem para nada
+            s.query(QuotaUsage).filter(QuotaUsage.window_start < int(time.time()) - 62 * 86400).delete()
+            s.commit()
+
+    async def flush(self):
+        self._prune(time.time())
+        if not self._dirty or self._session_factory is None:
+            return
+        pending, self._dirty = dict(self._dirty), defaultdict(int)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._save, pending)
+        except Exception as e:
+            LOG.warning(f"[QUOTA] Falha ao gravar cotas: {e}")
+            for key, delta in pending.items():
+                self._dirty[key] += delta
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(QUOTA_FLUSH_SECONDS)
+            await self.flush()
+
+    def start(self):
+        """Inicia a gravação periódica das contagens (precisa do event loop ativo)"""
+        if self._session_factory is not None and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        await self.flush()
+
+    def get_stats(self) -> Dict[str, object]:
+        now = time.time()
+        providers = sorted({key[0] for key in self._counts} | set(self._blocked_until))
+        usage = {}
+        for provider in providers:
+            usage[provider] = {
+                "headroom": round(self.headroom(provider), 3),
+                "windows": {
+                    str(window): f"{self.used(provider, window, now)}/{limit}"
+                    for window, limit in self.limits(provider).items()
+                },
+                "blocked_s": max(0, round(self._blocked_until.get(provider, 0) - now)) or None,
+            }
+        return {**self.stats, "providers": usage}
+
+
+# Instância global do livro de cotas
+quota_budget = QuotaBudget()
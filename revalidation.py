@@ -0,0 +1,253 @@
+# revalidation.py
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+LOG = logging.getLogger(__name__)
+
+# Validações simultâneas por chain conhecida (cada chain tem o seu limite)
+REVALIDATE_CHAIN_CONCURRENCY = int(os.getenv("REVALIDATE_CHAIN_CONCURRENCY", "4"))
+# Pagamentos sem chain registrada fazem a busca autochain completa: limite menor
+REVALIDATE_UNKNOWN_CONCURRENCY = int(os.getenv("REVALIDATE_UNKNOWN_CONCURRENCY", "2"))
+REVALIDATE_CHECKPOINT_EVERY = int(os.getenv("REVALIDATE_CHECKPOINT_EVERY", "20"))
+REVALIDATE_PROGRESS_SECONDS = float(os.getenv("REVALIDATE_PROGRESS_SECONDS", "3"))
+
+# Chave na tabela config onde o progresso é salvo (permite retomar após reinício)
+CHECKPOINT_KEY = "revalidation_checkpoint"
+
+
+@dataclass(frozen=True)
+class PaymentRow:
+    """Cópia dos campos do Payment usados na reavaliação (sem sessão aberta)"""
+    id: int
+    tx_hash: str
+    chain_id: Optional[str]
+    user_id: int
+    user_label: str
+    usd_value: float
+    vip_days: int
+
+
+@dataclass
+class RevalidationResult:
+    payment_id: int
+    kind: str  # upgrade, unchanged, error
+    hash: str
+    user: str
+    old_usd: float
+    new_usd: Optional[float] = None
+    old_days: int = 0
+    new_days: int = 0
+    error: Optional[str] = None
+
+
+ProgressCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class RevalidationEngine:
+    """
+    Reavaliação em massa dos pagamentos aprovados com preços atuais.
+
+    Os pagamentos são agrupados pela chain registrada: cada chain roda em
+    paralelo com seu próprio limite de concorrência e consulta só aquela
+    chain (sem busca em todas as redes); os sem chain usam a busca autochain.
+    O progresso vai para a tabela config a cada REVALIDATE_CHECKPOINT_EVERY
+    pagamentos, então um job interrompido (reinício, deploy) é retomado do
+    ponto em que parou. Só um job roda por vez.
+    """
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.state: Optional[Dict[str, Any]] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @staticmethod
+    def load_checkpoint(cfg_get: Callable[[str], Optional[str]]) -> Optional[Dict[str, Any]]:
+        raw = cfg_get(CHECKPOINT_KEY)
+        if not raw:
+            return None
+        try:
+            return json.loads(raw)
+        except ValueError:
+            LOG.warning("[REVALIDATE] Checkpoint inválido ignorado")
+            return None
+
+    @staticmethod
+    def new_state(rows: List[PaymentRow], scope: str) -> Dict[str, Any]:
+        return {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "scope": scope,
+            "ids": [row.id for row in rows],
+            "done": {},
+            "finished": False,
+        }
+
+    async def _revalidate(self, row: PaymentRow) -> RevalidationResult:
+        from payments import CHAINS, resolve_payment_on_known_chain, resolve_payment_usd_autochain
+        from rpc_client import background
+        from utils import choose_plan_from_usd
+
+        result = RevalidationResult(
+            payment_id=row.id, kind="error", hash=row.tx_hash[:12] + "...",
+            user=row.user_label, old_usd=row.usd_value, old_days=row.vip_days,
+        )
+        try:
+            with background():
+                if row.chain_id in CHAINS:
+                    ok, msg, usd, _details = await resolve_payment_on_known_chain(row.tx_hash, row.chain_id)
+                else:
+                    ok, msg, usd, _details = await resolve_payment_usd_autochain(
+                        row.tx_hash, force_refresh=True, user_id=row.user_id
+                    )
+        except Exception as e:
+            LOG.warning(f"[REVALIDATE] Erro ao reavaliar payment {row.id}: {e}")
+            result.error = str(e)[:120]
+            return result
+
+        if not ok or not usd:
+            result.error = msg
+            return result
+
+        new_days = choose_plan_from_usd(usd) or 0
+        result.new_usd = usd
+        result.new_days = new_days
+        result.kind = "upgrade" if new_days > row.vip_days else "unchanged"
+        return result
+
+    async def run(self,
+                  rows: List[PaymentRow],
+                  state: Dict[str, Any],
+                  cfg_set: Callable[[str, Optional[str]], None],
+                  progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        """Reavalia as linhas ainda não concluídas em `state`; retorna o estado final"""
+        from payments import CHAINS
+
+        self.state = state
+        loop = asyncio.get_running_loop()
+        done: Dict[str, Any] = state["done"]
+        todo = [row for row in rows if str(row.id) not in done]
+
+        # Um semáforo por chain: chains diferentes não disputam a mesma vaga
+        semaphores: Dict[Optional[str], asyncio.Semaphore] = {}
+        groups: Dict[Optional[str], List[PaymentRow]] = defaultdict(list)
+        for row in todo:
+            key = row.chain_id if row.chain_id in CHAINS else None
+            groups[key].append(row)
+            if key not in semaphores:
+                limit = REVALIDATE_CHAIN_CONCURRENCY if key else REVALIDATE_UNKNOWN_CONCURRENCY
+                semaphores[key] = asyncio.Semaphore(limit)
+        LOG.info(f"[REVALIDATE] {len(todo)} pagamentos em {len(groups)} grupos de chain "
+                 f"({len(done)} já concluídos no checkpoint)")
+
+        save_lock = asyncio.Lock()
+        unsaved = 0
+        last_progress = 0.0
+
+        async def save():
+            async with save_lock:
+                snapshot = json.dumps(state)
+                await loop.run_in_executor(None, cfg_set, CHECKPOINT_KEY, snapshot)
+
+        async def one(key: Optional[str], row: PaymentRow):
+            nonlocal unsaved, last_progress
+            async with semaphores[key]:
+                result = await self._revalidate(row)
+            done[str(row.id)] = asdict(result)
+            unsaved += 1
+            if unsaved >= REVALIDATE_CHECKPOINT_EVERY:
+                unsaved = 0
+                await save()
+            if progress and time.monotonic() - last_progress >= REVALIDATE_PROGRESS_SECONDS:
+                last_progress = time.monotonic()
+                try:
+                    await progress(state)
+                except Exception as e:
+                    LOG.debug(f"[REVALIDATE] Falha ao atualizar progresso: {e}")
+
+        await asyncio.gather(*[one(key, row) for key, group in groups.items() for row in group])
+        state["finished"] = True
+        state["finished_at"] = datetime.now(timezone.utc).isoformat()
+        await save()
+        return state
+
+    def start(self,
+              rows: List[PaymentRow],
+              state: Dict[str, Any],
+              cfg_set: Callable[[str, Optional[str]], None],
+              progress: Optional[ProgressCallback] = None,
+              on_done: Optional[ProgressCallback] = None) -> bool:
+        """Dispara o job em background; False se já houver um em andamento"""
+        if self.running:
+            return False
+
+        async def runner():
+            started = time.monotonic()
+            try:
+                final = await self.run(rows, state, cfg_set, progress)
+                LOG.info(f"[REVALIDATE] Concluído: {len(final['done'])} pagamentos em {time.monotonic() - started:.1f}s")
+                if on_done:
+                    await on_done(final)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                LOG.exception(f"[REVALIDATE] Job interrompido (retomável pelo checkpoint): {e}")
+
+        self._task = asyncio.create_task(runner())
+        return True
+
+
+def counts(state: Dict[str, Any]) -> Dict[str, int]:
+    totals = {"upgrade": 0, "unchanged": 0, "error": 0}
+    for result in state["done"].values():
+        totals[result["kind"]] = totals.get(result["kind"], 0) + 1
+    return totals
+
+
+def progress_text(state: Dict[str, Any]) -> str:
+    total = len(state["ids"])
+    processed = len(state["done"])
+    c = counts(state)
+    pct = (processed / total * 100) if total else 100.0
+    return (
+        f"🔄 <b>REAVALIAÇÃO DE PAGAMENTOS</b>\n\n"
+        f"📊 Progresso: {processed}/{total} ({pct:.0f}%)\n"
+        f"🚀 Upgrades: {c['upgrade']}\n"
+        f"➖ Sem mudança: {c['unchanged']}\n"
+        f"❌ Erros: {c['error']}"
+    )
+
+
+def summary_text(state: Dict[str, Any]) -> str:
+    c = counts(state)
+    upgrades = [r for r in state["done"].values() if r["kind"] == "upgrade"]
+    lines = [
+        "📊 <b>RESULTADOS DA REAVALIAÇÃO</b>\n",
+        f"✅ Podem ser upgradados: {c['upgrade']}",
+        f"➖ Sem mudança: {c['unchanged']}",
+        f"❌ Erros: {c['error']}\n",
+    ]
+    if upgrades:
+        lines.append("🚀 <b>UPGRADES DISPONÍVEIS:</b>\n")
+        for r in upgrades[:5]:
+            lines.append(
+                f"💰 {r['hash']} ({r['user']})\n"
+                f"   ${r['old_usd']:.2f} → ${r['new_usd']:.2f} USD\n"
+                f"   {r['old_days']} → {r['new_days']} dias (+{r['new_days'] - r['old_days']})\n"
+            )
+        if len(upgrades) > 5:
+            lines.append(f"... e mais {len(upgrades) - 5} upgrades\n")
+        lines.append("💡 Use /aplicar_upgrades para aplicar os upgrades")
+    return "\n".join(lines)
+
+
+# Instância global do motor de reavaliação
+revalidation_engine = RevalidationEngine()
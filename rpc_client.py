@@ -0,0 +1,499 @@
+# rpc_client.py
+import asyncio
+import itertools
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+import deadline
+from quota_budget import quota_budget, retry_after
+
+LOG = logging.getLogger(__name__)
+
+# Timeout por endpoint (segundos) - validação rápida
+RPC_TIMEOUT = float(os.getenv("RPC_TIMEOUT", "2.0"))
+# Pool de conexões keep-alive por chain
+RPC_MAX_CONNECTIONS = int(os.getenv("RPC_MAX_CONNECTIONS", "20"))
+RPC_MAX_KEEPALIVE = int(os.getenv("RPC_MAX_KEEPALIVE", "10"))
+RPC_KEEPALIVE_EXPIRY = float(os.getenv("RPC_KEEPALIVE_EXPIRY", "90"))
+# Hedged requests: após este atraso sem resposta válida, dispara a mesma
+# chamada no próximo endpoint (0 = desativado, modo sequencial)
+RPC_HEDGE_DELAY = float(os.getenv("RPC_HEDGE_DELAY", "0.35"))
+
+# False dentro de background(): laços em segundo plano não disparam hedges
+# (tasks criadas no escopo herdam o valor, como o prazo do deadline)
+_HEDGE: ContextVar[bool] = ContextVar("rpc_hedge", default=True)
+
+# Status HTTP com que endpoints públicos costumam recusar batch JSON-RPC
+BATCH_REJECT_STATUS = {400, 405, 413, 415, 422}
+
+# Placar de saúde dos endpoints (roteamento por latência/erros)
+RPC_EWMA_ALPHA = float(os.getenv("RPC_EWMA_ALPHA", "0.2"))
+# Latência presumida de endpoint ainda sem amostras (segundos)
+RPC_UNKNOWN_LATENCY = float(os.getenv("RPC_UNKNOWN_LATENCY", "0.5"))
+# Peso da taxa de erro no score: score = latência * (1 + peso * taxa_de_erro)
+RPC_ERROR_PENALTY = float(os.getenv("RPC_ERROR_PENALTY", "4"))
+# Endpoint que falhou há menos disso vai para o fim da fila
+RPC_FAILURE_COOLDOWN = float(os.getenv("RPC_FAILURE_COOLDOWN", "30"))
+
+
+class RpcError(Exception):
+    """Erro retornado pelo nó no campo "error" da resposta JSON-RPC"""
+
+    def __init__(self, url: str, error: Any):
+        self.url = url
+        self.error = error
+        message = error.get("message") if isinstance(error, dict) else str(error)
+        super().__init__(f"RPC error ({url[:40]}): {message}")
+
+
+@contextmanager
+def background() -> Iterator[None]:
+    """
+    Escopo sem hedged requests: consultas de segundo plano (reverificação de
+    pendentes, reavaliação) não têm pressa e cada hedge gasta cota de outro
+    endpoint. Uma chamada avulsa usa call(..., hedge=False).
+    """
+    token = _HEDGE.set(False)
+    try:
+        yield
+    finally:
+        _HEDGE.reset(token)
+
+
+def endpoint_host(url: str) -> str:
+    """Host do endpoint: identifica o provedor no livro de cotas"""
+    return urlsplit(url).netloc or url
+
+
+def endpoint_label(url: str) -> str:
+    """Host do endpoint para logs/estatísticas (caminho omitido: pode conter API key)"""
+    parts = urlsplit(url)
+    return parts.netloc + ("/…" if parts.path.strip("/") else "") if parts.netloc else url[:40]
+
+
+@dataclass
+class EndpointHealth:
+    """Saúde de um endpoint: médias móveis exponenciais de latência e erro"""
+    latency: float = 0.0
+    error_rate: float = 0.0
+    samples: int = 0
+    calls: int = 0
+    errors: int = 0
+    last_failure: float = 0.0  # time.monotonic()
+    last_error: str = ""
+
+
+class EndpointScoreboard:
+    """
+    Placar por endpoint JSON-RPC, alimentado por toda chamada feita pelos
+    clientes do pool (payments, watcher, oráculo de blocos) e por main.rpc_call.
+
+    O score (menor = melhor) é a latência EWMA inflada pela taxa de erro, com
+    penalidade extra para falhas recentes; os clientes ordenam os endpoints
+    por ele antes de cada chamada, em vez da ordem fixa de CHAINS.
+    """
+
+    def __init__(self, alpha: float = RPC_EWMA_ALPHA):
+        self.alpha = alpha
+        self.endpoints: Dict[str, EndpointHealth] = {}
+
+    def _health(self, url: str) -> EndpointHealth:
+        health = self.endpoints.get(url)
+        if health is None:
+            health = self.endpoints[url] = EndpointHealth()
+        return health
+
+    def _sample_latency(self, health: EndpointHealth, elapsed: float):
+        if health.samples == 0:
+            health.latency = elapsed
+        else:
+            health.latency += self.alpha * (elapsed - health.latency)
+        health.samples += 1
+
+    def record(self, url: str, elapsed: float, error: Optional[BaseException] = None):
+        health = self._health(url)
+        health.calls += 1
+        # Uma falha custa ao chamador pelo menos um timeout (erro rápido não parece endpoint rápido)
+        self._sample_latency(health, max(elapsed, RPC_TIMEOUT) if error is not None else elapsed)
+        health.error_rate += self.alpha * ((1.0 if error is not None else 0.0) - health.error_rate)
+        if error is not None:
+            health.errors += 1
+            health.last_failure = time.monotonic()
+            health.last_error = f"{type(error).__name__}: {str(error)[:80]}"
+
+    def record_abandoned(self, url: str, elapsed: float):
+        """Chamada cancelada (hedge perdedor): conta só o tempo já esperado como latência"""
+        self._sample_latency(self._health(url), elapsed)
+
+    @contextmanager
+    def measure(self, url: str, clamped: bool = False) -> Iterator[None]:
+        """
+        Mede a chamada. Com clamped=True o timeout foi encurtado pelo prazo do
+        chamador: estourá-lo não é culpa do endpoint e conta como abandono.
+        """
+        start = time.monotonic()
+        try:
+            yield
+        except asyncio.CancelledError:
+            self.record_abandoned(url, time.monotonic() - start)
+            raise
+        except httpx.TimeoutException as e:
+            if clamped:
+                self.record_abandoned(url, time.monotonic() - start)
+            else:
+                self.record(url, time.monotonic() - start, e)
+            raise
+        except Exception as e:
+            self.record(url, time.monotonic() - start, e)
+            raise
+        else:
+            self.record(url, time.monotonic() - start)
+
+    def score(self, url: str) -> float:
+        health = self.endpoints.get(url)
+        if health is None or health.samples == 0:
+            return RPC_UNKNOWN_LATENCY
+        score = health.latency * (1.0 + RPC_ERROR_PENALTY * health.error_rate)
+        if health.last_failure and time.monotonic() - health.last_failure < RPC_FAILURE_COOLDOWN:
+            score += RPC_TIMEOUT
+        return score
+
+    def rank(self, urls: List[str]) -> List[str]:
+        """Endpoints do melhor para o pior score (empate mantém a ordem configurada)"""
+        return sorted(urls, key=self.score)
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        now = time.monotonic()
+        stats = {}
+        for url in self.rank(list(self.endpoints)):
+            health = self.endpoints[url]
+            stats[endpoint_label(url)] = {
+                "score": round(self.score(url), 4),
+                "latency_ms": round(health.latency * 1000, 1),
+                "error_rate": round(health.error_rate, 3),
+                "calls": health.calls,
+                "errors": health.errors,
+                "last_failure_s_ago": round(now - health.last_failure, 1) if health.last_failure else None,
+                "last_error": health.last_error or None,
+            }
+        return stats
+
+
+class ChainRpcClient:
+    """
+    Cliente JSON-RPC assíncrono para uma chain.
+
+    Mantém um único httpx.AsyncClient com conexões keep-alive reaproveitadas
+    entre validações, evitando handshakes TCP/TLS a cada chamada e sem
+    bloquear o event loop.
+    """
+
+    def __init__(self,
+                 chain_id: str,
+                 endpoints: List[str],
+                 timeout: float = RPC_TIMEOUT,
+                 hedge_delay: float = RPC_HEDGE_DELAY):
+        self.chain_id = chain_id
+        self.endpoints = list(endpoints)
+        self.timeout = timeout
+        self.hedge_delay = hedge_delay
+        self._client: Optional[httpx.AsyncClient] = None
+        self._ids = itertools.count(1)
+        self._batch_unsupported: Set[str] = set()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Lazy initialization do cliente HTTP (precisa do event loop ativo)"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=RPC_MAX_CONNECTIONS,
+                    max_keepalive_connections=RPC_MAX_KEEPALIVE,
+                    keepalive_expiry=RPC_KEEPALIVE_EXPIRY,
+                ),
+                headers={"content-type": "application/json"},
+            )
+        return self._client
+
+    async def request(self, url: str, method: str, params: list, timeout: Optional[float] = None) -> Any:
+        """Executa uma chamada JSON-RPC em um endpoint específico"""
+        payload = {"jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": params}
+        r = await self.client.post(url, json=payload, timeout=deadline.clamp(timeout or self.timeout))
+        r.raise_for_status()
+        data = r.json()
+        if isinstance(data, dict) and data.get("error"):
+            raise RpcError(url, data["error"])
+        return data.get("result") if isinstance(data, dict) else None
+
+    async def request_batch(
+        self,
+        url: str,
+        calls: List[Tuple[str, list]],
+        timeout: Optional[float] = None,
+    ) -> List[Any]:
+        """
+        Envia várias chamadas em um único batch JSON-RPC (um round-trip).
+
+        Retorna os resultados na ordem de `calls`; entradas com erro viram None.
+        Endpoints que rejeitam batch passam a receber chamadas individuais
+        em paralelo.
+        """
+        if url in self._batch_unsupported:
+            return await self._request_each(url, calls, timeout)
+
+        payload = [
+            {"jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": params}
+            for method, params in calls
+        ]
+        r = await self.client.post(url, json=payload, timeout=deadline.clamp(timeout or self.timeout))
+        if r.status_code in BATCH_REJECT_STATUS:
+            return await self._disable_batch(url, calls, timeout, f"HTTP {r.status_code}")
+        r.raise_for_status()
+        try:
+            data = r.json()
+        except ValueError:
+            return await self._disable_batch(url, calls, timeout, "resposta não-JSON")
+        if not isinstance(data, list):
+            return await self._disable_batch(url, calls, timeout, "resposta não é lista")
+
+        by_id = {item.get("id"): item for item in data if isinstance(item, dict)}
+        results = []
+        for req in payload:
+            item = by_id.get(req["id"])
+            if item is None or item.get("error"):
+                results.append(None)
+            else:
+                results.append(item.get("result"))
+        return results
+
+    async def _disable_batch(self, url: str, calls: List[Tuple[str, list]], timeout: Optional[float], reason: str) -> List[Any]:
+        """Marca o endpoint como sem suporte a batch e refaz as chamadas individualmente"""
+        self._batch_unsupported.add(url)
+        LOG.info(f"[RPC {self.chain_id}] Endpoint não aceita batch ({reason}), usando chamadas individuais: {url[:50]}")
+        return await self._request_each(url, calls, timeout)
+
+    async def _request_each(self, url: str, calls: List[Tuple[str, list]], timeout: Optional[float]) -> List[Any]:
+        """Fallback do batch: chamadas individuais em paralelo no mesmo endpoint"""
+        results = await asyncio.gather(
+            *[self.request(url, method, params, timeout=timeout) for method, params in calls],
+            return_exceptions=True,
+        )
+        return [None if isinstance(r, Exception) else r for r in results]
+
+    async def call(
+        self,
+        method: str,
+        params: list,
+        timeout: Optional[float] = None,
+        require_result: bool = False,
+        hedge: bool = True,
+    ) -> Any:
+        """
+        Executa a chamada nos endpoints da chain e retorna o primeiro resultado.
+
+        Com require_result=True, um resultado nulo (ex.: tx ainda não vista por
+        aquele nó) conta como falha e o próximo endpoint é consultado.
+        hedge=False: só modo sequencial (consultas pesadas/em background).
+        """
+        accept = (lambda result: result is not None) if require_result else None
+        return await self._dispatch(
+            lambda url: self.request(url, method, params, timeout=timeout), method, accept, hedge=hedge
+        )
+
+    async def batch(
+        self,
+        calls: List[Tuple[str, list]],
+        timeout: Optional[float] = None,
+        require_first: bool = False,
+        hedge: bool = True,
+    ) -> Optional[List[Any]]:
+        """
+        Executa um batch JSON-RPC nos endpoints da chain.
+
+        Com require_first=True, o batch só é aceito se a primeira chamada tiver
+        resultado (ex.: a própria tx); caso contrário tenta o próximo endpoint
+        e retorna None se nenhum tiver. hedge=False como em call().
+        """
+        accept = (lambda results: bool(results) and results[0] is not None) if require_first else None
+        return await self._dispatch(
+            lambda url: self.request_batch(url, calls, timeout=timeout), "batch", accept,
+            cost=len(calls), hedge=hedge,
+        )
+
+    async def _dispatch(
+        self,
+        fn: Callable[[str], Awaitable[Any]],
+        label: str,
+        accept: Optional[Callable[[Any], bool]],
+        cost: int = 1,
+        hedge: bool = True,
+    ) -> Any:
+        """
+        Escolhe o modo (hedged ou sequencial) conforme hedge_delay e backups;
+        sem hedge quando a chamada pede (hedge=False) ou dentro de background().
+        Os endpoints seguem a ordem do placar de saúde e cada tentativa o alimenta;
+        hosts sem folga de cota (ou que responderam 429) vão para o fim. Cada
+        tentativa gasta `cost` da cota do host (um batch conta cada chamada).
+        Dentro de um deadline.budget(), cada tentativa tem o timeout limitado ao
+        prazo restante e backups/hedges que não cabem mais nele são pulados.
+        """
+        if deadline.expired():
+            raise deadline.DeadlineExceeded(f"prazo esgotado antes de {label} em {self.chain_id}")
+        endpoints = quota_budget.order(rpc_scoreboard.rank(self.endpoints), key=endpoint_host)
+
+        async def measured(url: str) -> Any:
+            host = endpoint_host(url)
+            quota_budget.spend(host, cost)
+            try:
+                with rpc_scoreboard.measure(url, clamped=deadline.is_clamped(self.timeout)):
+                    return await fn(url)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code in (418, 429):
+                    quota_budget.note_rate_limited(host, retry_after(e.response.headers))
+                raise
+
+        if hedge and _HEDGE.get() and self.hedge_delay > 0 and len(endpoints) > 1:
+            return await self._call_hedged(measured, label, accept, endpoints)
+        return await self._call_sequential(measured, label, accept, endpoints)
+
+    async def _call_sequential(
+        self,
+        fn: Callable[[str], Awaitable[Any]],
+        label: str,
+        accept: Optional[Callable[[Any], bool]],
+        endpoints: List[str],
+    ) -> Any:
+        """Tenta os endpoints um de cada vez, em ordem"""
+        last_err: Optional[Exception] = None
+        for i, url in enumerate(endpoints):
+            rpc_type = "principal" if i == 0 else f"backup-{i}"
+            if i > 0 and not deadline.can_afford():
+                LOG.info(f"[RPC {self.chain_id}] Sem prazo para {rpc_type} em {label} - desistindo")
+                break
+            try:
+                result = await fn(url)
+                if accept is not None and not accept(result):
+                    continue
+                return result
+            except httpx.TimeoutException as e:
+                last_err = e
+                LOG.warning(f"[RPC {self.chain_id}] Timeout {rpc_type} em {label}: {url[:50]}")
+            except Exception as e:
+                last_err = e
+                LOG.warning(f"[RPC {self.chain_id}] Erro {rpc_type} em {label}: {str(e)[:80]}")
+
+        if last_err is not None and accept is None:
+            raise last_err
+        return None
+
+    async def _call_hedged(
+        self,
+        fn: Callable[[str], Awaitable[Any]],
+        label: str,
+        accept: Optional[Callable[[Any], bool]],
+        endpoints: List[str],
+    ) -> Any:
+        """
+        Hedged request: começa no melhor endpoint do placar e, se não houver resposta
+        válida em hedge_delay segundos (ou se ele falhar), dispara a mesma chamada
+        no próximo endpoint. A primeira resposta válida vence e as demais são
+        canceladas. No caso comum (primeiro rápido) só uma requisição é feita.
+        """
+        pending: Dict[asyncio.Task, str] = {}
+        next_idx = 0
+        last_err: Optional[Exception] = None
+
+        def launch():
+            nonlocal next_idx
+            url = endpoints[next_idx]
+            next_idx += 1
+            task = asyncio.create_task(fn(url))
+            pending[task] = url
+
+        try:
+            launch()
+            while pending:
+                # Hedge só se ainda houver endpoint e prazo para ele
+                can_hedge = next_idx < len(endpoints) and deadline.can_afford(self.hedge_delay + deadline.DEADLINE_MIN_STEP)
+                wait_timeout = self.hedge_delay if can_hedge else None
+                done, _ = await asyncio.wait(
+                    pending.keys(), timeout=wait_timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # Endpoint lento: dispara hedge no próximo
+                    launch()
+                    continue
+
+                for task in done:
+                    url = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except httpx.TimeoutException as e:
+                        last_err = e
+                        LOG.warning(f"[RPC {self.chain_id}] Timeout em {label}: {url[:50]}")
+                        continue
+                    except Exception as e:
+                        last_err = e
+                        LOG.warning(f"[RPC {self.chain_id}] Erro em {label} ({url[:40]}): {str(e)[:80]}")
+                        continue
+                    if accept is not None and not accept(result):
+                        continue
+                    if url != endpoints[0]:
+                        LOG.info(f"[RPC {self.chain_id}] Resposta hedged vencedora: {url[:50]}")
+                    return result
+
+                # Todas as respostas concluídas foram inválidas: não esperar o atraso
+                if next_idx < len(endpoints) and deadline.can_afford():
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if last_err is not None and accept is None:
+            raise last_err
+        return None
+
+    async def aclose(self):
+        """Fecha as conexões do pool"""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+class RpcClientPool:
+    """Registro de clientes JSON-RPC, um por chain"""
+
+    def __init__(self):
+        self.clients: Dict[str, ChainRpcClient] = {}
+
+    def get(self, chain_id: str, endpoints: List[str]) -> ChainRpcClient:
+        """Obtém ou cria o cliente da chain"""
+        client = self.clients.get(chain_id)
+        if client is None:
+            client = ChainRpcClient(chain_id, endpoints)
+            self.clients[chain_id] = client
+        return client
+
+    async def aclose_all(self):
+        """Fecha todos os clientes (usar no shutdown)"""
+        await asyncio.gather(
+            *[c.aclose() for c in self.clients.values()],
+            return_exceptions=True,
+        )
+        LOG.info("Clientes JSON-RPC finalizados")
+
+
+# Instância global do placar de endpoints
+rpc_scoreboard = EndpointScoreboard()
+
+# Instância global do pool de clientes
+rpc_pool = RpcClientPool()
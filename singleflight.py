@@ -0,0 +1,48 @@
+# singleflight.py
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+LOG = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalescência de requisições concorrentes por chave.
+
+    Enquanto uma computação para a chave estiver em andamento, chamadas com a
+    mesma chave aguardam o mesmo resultado em vez de repetir o trabalho
+    (ex.: duplo clique no webapp + /tx para o mesmo hash). A computação roda
+    em uma task própria: se quem a iniciou for cancelado (timeout), os demais
+    continuam aguardando normalmente.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.stats = {"calls": 0, "shared": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.stats["calls"] += 1
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["shared"] += 1
+            LOG.info(f"[SINGLEFLIGHT {self.name}] Aguardando execução em andamento: {key[:24]}")
+        else:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._forget(k, t))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Evita "exception was never retrieved" quando todos os chamadores desistiram
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {**self.stats, "in_flight": len(self._inflight)}
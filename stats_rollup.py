@@ -0,0 +1,126 @@
+# stats_rollup.py
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+LOG = logging.getLogger(__name__)
+
+# Intervalo de recálculo das contagens (independe da frequência do scraper)
+STATS_ROLLUP_SECONDS = float(os.getenv("STATS_ROLLUP_SECONDS", "60"))
+
+Collector = Callable[[Any], Dict[str, Any]]
+
+
+class StatsRollup:
+    """
+    Contagens agregadas (pagamentos, VIPs, packs, arquivos do auto_sender)
+    recalculadas em background a cada STATS_ROLLUP_SECONDS.
+
+    /metrics e /stats só leem o último resultado em memória: o custo no
+    banco passa a ser um punhado de consultas agrupadas por minuto, não
+    vários COUNT(*) por scrape. Cada módulo registra um coletor
+    (fn(session) -> dict); invalidate(nome) força o recálculo daquele
+    coletor na próxima leitura (ex.: depois de um envio do auto_sender).
+    """
+
+    def __init__(self):
+        self._collectors: Dict[str, Collector] = {}
+        self._data: Dict[str, Dict[str, Any]] = {}
+        self._refreshed_at: Dict[str, float] = {}
+        self._stale: set = set()
+        self._lock = threading.Lock()
+        self._session_factory: Optional[Callable] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"refreshes": 0, "errors": 0, "on_demand": 0}
+
+    def register(self, name: str, collector: Collector):
+        self._collectors[name] = collector
+
+    def invalidate(self, name: str):
+        self._stale.add(name)
+
+    def _collect(self, name: str, session: Any) -> Dict[str, Any]:
+        data = self._collectors[name](session)
+        with self._lock:
+            self._data[name] = data
+            self._refreshed_at[name] = time.time()
+            self._stale.discard(name)
+        return data
+
+    def refresh(self, session_factory: Optional[Callable] = None):
+        """Recalcula todos os coletores (síncrono; rodar no executor)"""
+        session_factory = session_factory or self._session_factory
+        with session_factory() as s:
+            for name in list(self._collectors):
+                try:
+                    self._collect(name, s)
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    s.rollback()
+                    LOG.warning(f"[ROLLUP] Falha ao recalcular {name}: {e}")
+        self.stats["refreshes"] += 1
+
+    def get(self, name: str, session: Any = None) -> Optional[Dict[str, Any]]:
+        """
+        Último resultado do coletor. Sem resultado ou invalidado: recalcula na
+        hora com `session` (se dada); senão devolve o que houver (ou None).
+        """
+        data = self._data.get(name)
+        if (data is None or name in self._stale) and session is not None and name in self._collectors:
+            self.stats["on_demand"] += 1
+            return self._collect(name, session)
+        return data
+
+    async def get_async(self, name: str) -> Dict[str, Any]:
+        """get() para endpoints: o recálculo sob demanda roda no executor"""
+        data = self._data.get(name)
+        if data is not None and name not in self._stale:
+            return data
+
+        def collect():
+            session_factory = self._session_factory
+            if session_factory is None:
+                from main import SessionLocal
+                session_factory = SessionLocal
+            with session_factory() as s:
+                return self.get(name, s)
+
+        return await asyncio.get_running_loop().run_in_executor(None, collect) or {}
+
+    def age(self, name: str) -> Optional[float]:
+        at = self._refreshed_at.get(name)
+        return round(time.time() - at, 1) if at else None
+
+    async def _loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.refresh)
+            except Exception as e:
+                LOG.warning(f"[ROLLUP] Falha no recálculo das estatísticas: {e}")
+            await asyncio.sleep(STATS_ROLLUP_SECONDS)
+
+    def start(self, session_factory: Callable):
+        """Inicia o recálculo periódico (precisa do event loop ativo)"""
+        self._session_factory = session_factory
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "collectors": {name: self.age(name) for name in self._collectors}}
+
+
+# Instância global das estatísticas agregadas
+stats_rollup = StatsRollup()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes do cache em memória limitado (BoundedTTLCache em cache.py).
+Rodar: python -m pytest -q test_cache.py
+"""
+from types import SimpleNamespace
+
+import pytest
+
+import cache
+from cache import BoundedTTLCache
+
+NOW = 1_700_000_000.0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    current = {"t": NOW}
+    monkeypatch.setattr(cache, "time", SimpleNamespace(time=lambda: current["t"]))
+    return current
+
+
+@pytest.fixture
+def make(clock, tmp_path, monkeypatch):
+    """Cria caches com snapshot em tmp_path e tira-os do registro global no fim"""
+    monkeypatch.setattr(cache, "CACHE_SNAPSHOT_PATH", str(tmp_path / "snapshot.sqlite3"))
+    created = []
+
+    def factory(name="test", **kwargs):
+        c = BoundedTTLCache(name, **kwargs)
+        created.append(c)
+        return c
+
+    yield factory
+    for c in created:
+        cache._BOUNDED_CACHES.remove(c)
+
+
+def test_get_set_e_contadores(make):
+    c = make()
+    assert c.get("a") is None
+    assert c.get("a", "padrão") == "padrão"
+    c.set("a", {"price": 1.5})
+    assert c.get("a") == {"price": 1.5}
+    assert "a" in c and len(c) == 1
+    c.delete("a")
+    assert "a" not in c
+    assert c.get_stats()["hits"] == 1
+    assert c.get_stats()["misses"] == 2
+
+
+def test_lru_remove_o_menos_usado(make):
+    c = make(max_entries=3)
+    for key in "abc":
+        c.set(key, key)
+    c.get("a")  # "b" passa a ser o menos usado
+    c.set("d", "d")
+    assert [k for k, _ in c.items()] == ["c", "a", "d"]
+    assert c.get("b") is None
+    assert c.stats["evictions"] == 1
+
+
+def test_regravar_a_chave_nao_despeja(make):
+    c = make(max_entries=2)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.set("a", 3)
+    assert len(c) == 2
+    assert c.get("a") == 3
+    assert c.stats["evictions"] == 0
+
+
+def test_ttl_expira_a_entrada(make, clock):
+    c = make(ttl=60)
+    c.set("a", 1)
+    c.set("b", 2, ttl=120)
+    clock["t"] = NOW + 61
+    assert "a" not in c
+    assert [k for k, _ in c.items()] == ["b"]
+    assert c.get("a") is None
+    assert c.stats["expired"] == 1
+    assert c.get("b") == 2
+
+
+def test_snapshot_sobrevive_ao_reinicio(make, clock):
+    c = make("persist", max_entries=2, ttl=60, persist=True)
+    c.set("old", 1, ttl=10)
+    c.set("a", [1, 2])
+    c.set("b", {"x": 1})
+    assert c.save_snapshot() == 2
+
+    restored = make("persist", max_entries=2, ttl=60, persist=True)
+    assert dict(restored.items()) == {"a": [1, 2], "b": {"x": 1}}
+
+
+def test_snapshot_descarta_expiradas_e_respeita_o_limite(make, clock):
+    c = make("persist", max_entries=3, persist=True)
+    c.set("a", 1, ttl=10)
+    c.set("b", 2, ttl=100)
+    c.set("c", 3, ttl=200)
+    c.save_snapshot()
+    clock["t"] = NOW + 50
+
+    restored = make("persist", max_entries=1, persist=True)
+    # "a" expirou; das restantes fica a que expira por último
+    assert dict(restored.items()) == {"c": 3}
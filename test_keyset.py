@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes da paginação por keyset (keyset.py).
+Rodar: python -m pytest -q test_keyset.py
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from keyset import NEXT, PREV, Cursor, decode, fetch_page, nav_cursors
+
+
+# ----- cursor -----
+def test_cursor_ida_e_volta_naive():
+    cursor = Cursor("lh", NEXT, datetime(2025, 3, 1, 12, 30, 15, 123456), 987654, 3)
+    assert decode(cursor.encode()) == cursor
+
+
+def test_cursor_ida_e_volta_aware():
+    cursor = Cursor("lv", PREV, datetime(2025, 3, 1, 12, 30, tzinfo=timezone.utc), 42, 2)
+    decoded = decode(cursor.encode())
+    assert decoded == cursor
+    assert decoded.key.tzinfo is not None
+
+
+def test_cursor_cabe_no_callback_data():
+    cursor = Cursor("lh", NEXT, datetime(2099, 12, 31, 23, 59, 59, 999999, tzinfo=timezone.utc), 2 ** 63 - 1, 99999)
+    assert len(cursor.encode().encode()) <= 64
+
+
+@pytest.mark.parametrize("data", ["", "lh", "lh:x:n1:1:1", "lh:n:q1:1:1", "lh:n:n1:abc:1", "lh:n:n1:1"])
+def test_cursor_malformado(data):
+    assert decode(data) is None
+
+
+# ----- consulta -----
+sqlalchemy = pytest.importorskip("sqlalchemy")
+from sqlalchemy import Column, DateTime, Integer, create_engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+Base = declarative_base()
+
+
+class Item(Base):
+    __tablename__ = "items"
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, nullable=False)
+
+
+@pytest.fixture
+def session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    s = sessionmaker(bind=engine)()
+    base = datetime(2025, 1, 1)
+    # 12 itens; pares de ids com o mesmo created_at testam o desempate por id
+    for i in range(1, 13):
+        s.add(Item(id=i, created_at=base + timedelta(minutes=(i + 1) // 2)))
+    s.commit()
+    yield s
+    s.close()
+
+
+def _ids(page):
+    return [row.id for row in page.rows]
+
+
+def _key(row):
+    return row.created_at, row.id
+
+
+def test_percorre_todas_as_paginas_sem_repetir(session):
+    query = session.query(Item)
+    page = fetch_page(query, Item.created_at, Item.id, 5)
+    assert _ids(page) == [12, 11, 10, 9, 8]
+    assert not page.has_newer and page.has_older
+
+    seen = _ids(page)
+    number = 1
+    while page.has_older:
+        _newer, older = nav_cursors("it", page, number, _key)
+        page = fetch_page(query, Item.created_at, Item.id, 5, cursor=decode(older.encode()))
+        number = older.page
+        seen += _ids(page)
+
+    assert seen == list(range(12, 0, -1))
+    assert number == 3
+    assert page.has_newer
+
+
+def test_voltar_devolve_a_pagina_anterior(session):
+    query = session.query(Item)
+    first = fetch_page(query, Item.created_at, Item.id, 5)
+    _, older = nav_cursors("it", first, 1, _key)
+    second = fetch_page(query, Item.created_at, Item.id, 5, cursor=older)
+    newer, _ = nav_cursors("it", second, 2, _key)
+
+    back = fetch_page(query, Item.created_at, Item.id, 5, cursor=newer)
+    assert _ids(back) == _ids(first)
+    assert not back.has_newer
+    assert newer.page == 1
+
+
+def test_offset_para_salto_direto(session):
+    page = fetch_page(session.query(Item), Item.created_at, Item.id, 5, offset=10)
+    assert _ids(page) == [2, 1]
+    assert page.has_newer and not page.has_older
+
+
+def test_pagina_vazia_sem_cursores(session):
+    page = fetch_page(session.query(Item).filter(Item.id > 100), Item.created_at, Item.id, 5)
+    assert page.rows == []
+    assert nav_cursors("it", page, 1, _key) == (None, None)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes do MigrationRunner (migrations.py) em SQLite.
+Rodar: python -m pytest -q test_migrations.py
+"""
+import importlib
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+from sqlalchemy import create_engine, inspect, text
+
+from migrations import IncompleteMigration, Migration, MigrationRunner, create_indexes
+
+
+@pytest.fixture
+def engine(tmp_path):
+    eng = create_engine(f"sqlite:///{tmp_path / 'schema.db'}")
+    yield eng
+    eng.dispose()
+
+
+def _create_items(eng):
+    with eng.begin() as conn:
+        conn.execute(text("CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY, name VARCHAR(20))"))
+
+
+def test_registra_versoes_e_segundo_boot_nao_reaplica(engine):
+    calls = []
+    migrations = [
+        Migration(2, "indexes", lambda e: calls.append(2)),
+        Migration(1, "items", lambda e: (calls.append(1), _create_items(e))),
+    ]
+
+    assert MigrationRunner(migrations).run(engine) == 2
+    assert calls == [1, 2]
+    assert MigrationRunner.applied_versions(engine) == {1, 2}
+
+    assert MigrationRunner(migrations).run(engine) == 0
+    assert calls == [1, 2]
+
+
+def test_migracao_nova_roda_sozinha(engine):
+    calls = []
+    MigrationRunner([Migration(1, "items", _create_items)]).run(engine)
+
+    migrations = [Migration(1, "items", lambda e: calls.append(1)), Migration(2, "new", lambda e: calls.append(2))]
+    assert MigrationRunner(migrations).run(engine) == 1
+    assert calls == [2]
+
+
+def test_incompleta_nao_registra_e_repete_no_proximo_boot(engine):
+    attempts = []
+
+    def flaky(eng):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise IncompleteMigration("índices não criados: idx_x")
+
+    migrations = [
+        Migration(1, "items", _create_items),
+        Migration(2, "flaky", flaky),
+        Migration(3, "after", lambda e: None),
+    ]
+
+    assert MigrationRunner(migrations).run(engine) == 2
+    assert MigrationRunner.applied_versions(engine) == {1, 3}
+
+    assert MigrationRunner(migrations).run(engine) == 1
+    assert MigrationRunner.applied_versions(engine) == {1, 2, 3}
+    assert len(attempts) == 2
+
+
+def test_outro_erro_interrompe(engine):
+    def broken(eng):
+        raise RuntimeError("boom")
+
+    migrations = [Migration(1, "items", _create_items), Migration(2, "broken", broken), Migration(3, "after", lambda e: None)]
+    with pytest.raises(RuntimeError):
+        MigrationRunner(migrations).run(engine)
+    assert MigrationRunner.applied_versions(engine) == {1}
+
+
+def test_versoes_repetidas():
+    with pytest.raises(ValueError):
+        MigrationRunner([Migration(1, "a", lambda e: None), Migration(1, "b", lambda e: None)])
+
+
+def test_tabela_inexistente_retorna_none(engine):
+    assert MigrationRunner.applied_versions(engine) is None
+
+
+def test_create_indexes_cria_os_validos_e_acusa_os_invalidos(engine):
+    _create_items(engine)
+    statements = [
+        "CREATE INDEX IF NOT EXISTS idx_items_name ON items(name)",
+        "CREATE INDEX IF NOT EXISTS idx_items_missing ON items(missing_column)",
+    ]
+    with pytest.raises(IncompleteMigration, match="idx_items_missing"):
+        create_indexes(engine, statements)
+
+    names = {ix["name"] for ix in inspect(engine).get_indexes("items")}
+    assert "idx_items_name" in names
+    assert "idx_items_missing" not in names
+
+
+def test_schema_do_bot_fica_em_dia_apos_um_boot(tmp_path, monkeypatch):
+    """Migrações reais do main.py: um boot registra todas (índices críticos inclusos)"""
+    pytest.importorskip("telegram")
+    pytest.importorskip("fastapi")
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'bot.db'}")
+    monkeypatch.setenv("CACHE_SNAPSHOT_PATH", str(tmp_path / "cache_snapshot.sqlite3"))
+    monkeypatch.setenv("BOT_TOKEN", "123456:test")
+    main = importlib.import_module("main")
+    if main.engine.url.database != str(tmp_path / "bot.db"):
+        pytest.skip("main já importado com outro banco")
+
+    main.run_migrations()
+
+    latest = MigrationRunner(main.schema_migrations()).latest
+    assert MigrationRunner.applied_versions(main.engine) == set(range(1, latest + 1))
+    assert main.run_migrations() == 0
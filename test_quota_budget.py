@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes do livro-caixa de cotas (quota_budget.py).
+Rodar: python -m pytest -q test_quota_budget.py
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import quota_budget
+from quota_budget import QuotaBudget, retry_after
+
+# Início de um minuto (e de um segundo) cheio: as janelas não viram no meio do teste
+NOW = 1_700_000_040.0
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    current = {"t": NOW}
+    monkeypatch.setattr(quota_budget, "time", SimpleNamespace(time=lambda: current["t"]))
+    return current
+
+
+@pytest.fixture
+def budget(clock, monkeypatch):
+    monkeypatch.delenv("QUOTA_LIMITS", raising=False)
+    b = QuotaBudget()
+    b.quotas["test"] = {60: 10}
+    return b
+
+
+def test_spend_conta_em_todas_as_janelas(budget):
+    budget.spend("coingecko", 3)
+    assert budget.used("coingecko", 60) == 3
+    assert budget.used("coingecko", 30 * 86400) == 3
+    assert budget.stats["spent"] == 3
+
+
+def test_sem_folga_ao_atingir_a_fracao_suave(budget):
+    budget.spend("test", 8)
+    assert budget.has_headroom("test")
+    assert not budget.has_headroom("test", cost=2)
+    budget.spend("test")
+    assert not budget.has_headroom("test")
+    assert budget.headroom("test") == pytest.approx(0.1)
+
+
+def test_allow_reserva_ou_nega(budget):
+    assert all(budget.allow("test") for _ in range(9))
+    assert not budget.allow("test")
+    assert budget.used("test", 60) == 9
+    assert budget.stats["denied"] == 1
+
+
+def test_janela_nova_zera_a_contagem(budget, clock):
+    budget.spend("test", 9)
+    assert not budget.has_headroom("test")
+    clock["t"] = NOW + 60
+    assert budget.has_headroom("test")
+    assert budget.used("test", 60) == 0
+
+
+def test_429_bloqueia_ate_o_retry_after(budget, clock):
+    budget.note_rate_limited("test", retry_after=30)
+    assert budget.headroom("test") == 0.0
+    assert not budget.allow("test")
+    clock["t"] = NOW + 31
+    assert budget.has_headroom("test")
+    assert budget.stats["rate_limited"] == 1
+
+
+def test_429_sem_retry_after_usa_pausa_padrao(budget, clock):
+    budget.note_rate_limited("test")
+    clock["t"] = NOW + quota_budget.QUOTA_BACKOFF_SECONDS - 1
+    assert not budget.has_headroom("test")
+
+
+def test_order_move_esgotados_para_o_fim(budget):
+    budget.note_rate_limited("coingecko", 60)
+    assert budget.order(["coingecko", "binance", "kraken"]) == ["binance", "kraken", "coingecko"]
+
+    urls = ["https://a.example/rpc", "https://b.example/rpc"]
+    budget.note_rate_limited("a.example", 60)
+    assert budget.order(urls, key=lambda u: u.split("/")[2]) == urls[::-1]
+
+
+def test_host_de_rpc_usa_cota_padrao(budget):
+    assert budget.limits("rpc.ankr.com") == quota_budget.DEFAULT_RPC_QUOTA
+    assert budget.limits("desconhecido") == {}
+    # Sem cota: sempre com folga
+    budget.spend("desconhecido", 10 ** 6)
+    assert budget.has_headroom("desconhecido")
+
+
+def test_quota_limits_do_ambiente(monkeypatch):
+    monkeypatch.setenv("QUOTA_LIMITS", '{"coingecko": {"60": 30}, "rpc.ankr.com": {"1": 30}}')
+    quotas = quota_budget._load_quotas()
+    assert quotas["coingecko"] == {60: 30}
+    assert quotas["rpc.ankr.com"] == {1: 30}
+    assert quotas["binance"] == quota_budget.DEFAULT_QUOTAS["binance"]
+
+
+def test_quota_limits_invalido_mantem_padroes(monkeypatch):
+    monkeypatch.setenv("QUOTA_LIMITS", "{nao e json")
+    assert quota_budget._load_quotas() == quota_budget.DEFAULT_QUOTAS
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"retry-after": "12"}, 12.0),
+    ({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}, None),
+    ({}, None),
+])
+def test_retry_after(headers, expected):
+    assert retry_after(headers) == expected
+
+
+def test_contagens_sobrevivem_ao_reinicio(budget, tmp_path):
+    pytest.importorskip("sqlalchemy")
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from models import Base
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'quota.db'}")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+
+    budget.load_from_db(factory)
+    budget.spend("coingecko", 4)
+    asyncio.run(budget.flush())
+    budget.spend("coingecko", 2)
+    asyncio.run(budget.flush())
+
+    restarted = QuotaBudget()
+    restarted.load_from_db(factory)
+    assert restarted.used("coingecko", 30 * 86400) == 6
+    assert restarted.used("coingecko", 60) == 6
+    engine.dispose()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes do SingleFlight (singleflight.py).
+Rodar: python -m pytest -q test_singleflight.py
+"""
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_chamadas_concorrentes_compartilham_uma_execucao():
+    async def scenario():
+        flight = SingleFlight("test")
+        runs = []
+
+        async def fetch():
+            runs.append(1)
+            await asyncio.sleep(0.05)
+            return "result"
+
+        results = await asyncio.gather(*[flight.do("k", fetch) for _ in range(5)])
+        return flight, runs, results
+
+    flight, runs, results = asyncio.run(scenario())
+    assert results == ["result"] * 5
+    assert len(runs) == 1
+    assert flight.stats == {"calls": 5, "shared": 4}
+    assert flight.in_flight() == 0
+
+
+def test_chaves_diferentes_nao_compartilham():
+    async def scenario():
+        flight = SingleFlight("test")
+
+        async def fetch(value):
+            await asyncio.sleep(0.01)
+            return value
+
+        return await asyncio.gather(flight.do("a", lambda: fetch(1)), flight.do("b", lambda: fetch(2)))
+
+    assert asyncio.run(scenario()) == [1, 2]
+
+
+def test_chamada_seguinte_executa_de_novo():
+    async def scenario():
+        flight = SingleFlight("test")
+        runs = []
+
+        async def fetch():
+            runs.append(1)
+            return len(runs)
+
+        first = await flight.do("k", fetch)
+        second = await flight.do("k", fetch)
+        return first, second
+
+    assert asyncio.run(scenario()) == (1, 2)
+
+
+def test_erro_chega_a_todos_e_libera_a_chave():
+    async def scenario():
+        flight = SingleFlight("test")
+
+        async def boom():
+            await asyncio.sleep(0.01)
+            raise ValueError("falhou")
+
+        results = await asyncio.gather(flight.do("k", boom), flight.do("k", boom), return_exceptions=True)
+        return flight, results
+
+    flight, results = asyncio.run(scenario())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert flight.in_flight() == 0
+
+
+def test_cancelar_o_primeiro_nao_afeta_os_demais():
+    async def scenario():
+        flight = SingleFlight("test")
+        runs = []
+
+        async def fetch():
+            runs.append(1)
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        first = asyncio.create_task(flight.do("k", fetch))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(flight.do("k", fetch))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second, runs
+
+    result, runs = asyncio.run(scenario())
+    assert result == "ok"
+    assert len(runs) == 1
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Testes do índice de hashes usadas (used_hashes.py): filtro de Bloom,
+conjunto quente e ligação com os eventos do SQLAlchemy.
+Rodar: python -m pytest -q test_used_hashes.py
+"""
+import pytest
+
+from used_hashes import BloomFilter, UsedHashIndex
+
+
+def _hash(i: int) -> str:
+    return "0x" + f"{i:064x}"
+
+
+# ----- filtro de Bloom -----
+def test_bloom_sem_falso_negativo():
+    bloom = BloomFilter(1000, 0.01)
+    items = [_hash(i) for i in range(1000)]
+    for item in items:
+        bloom.add(item)
+    assert all(item in bloom for item in items)
+    assert bloom.count == 1000
+
+
+def test_bloom_taxa_de_falso_positivo_proxima_do_alvo():
+    bloom = BloomFilter(2000, 0.01)
+    for i in range(2000):
+        bloom.add(_hash(i))
+    false_positives = sum(_hash(i) in bloom for i in range(10_000, 20_000))
+    assert false_positives / 10_000 < 0.03
+
+
+# ----- índice em memória -----
+def test_antes_da_carga_sempre_consulta_o_banco():
+    index = UsedHashIndex()
+    index.remember(_hash(1))
+    assert index.might_contain(_hash(1)) is None
+    assert index.stats["not_ready"] == 1
+
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+from sqlalchemy import Column, Integer, String, create_engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+Base = declarative_base()
+
+
+class Payment(Base):
+    __tablename__ = "payments"
+    id = Column(Integer, primary_key=True)
+    tx_hash = Column(String, unique=True)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    with factory() as s:
+        s.add_all([Payment(tx_hash=_hash(i)) for i in range(50)])
+        s.commit()
+    return factory
+
+
+@pytest.fixture
+def index(db):
+    idx = UsedHashIndex()
+    idx.install(Payment)
+    idx.load(db, Payment)
+    return idx
+
+
+def test_carga_monta_o_filtro(index):
+    assert index.ready
+    assert index.stats["loaded"] == 50
+    assert index.might_contain(_hash(10_000)) is False
+    # No filtro mas fora do conjunto quente: "talvez", vai ao banco
+    assert index.might_contain(_hash(1)) is None
+
+
+def test_insert_commitado_vira_certeza(db, index):
+    new = _hash(500)
+    with db() as s:
+        s.add(Payment(tx_hash=new))
+        s.commit()
+    assert index.might_contain(new) is True
+
+
+def test_rollback_nao_entra_no_conjunto_quente(db, index):
+    new = _hash(600)
+    with db() as s:
+        s.add(Payment(tx_hash=new))
+        s.flush()
+        s.rollback()
+    # Fica só o falso positivo do filtro: a consulta ao banco decide
+    assert index.might_contain(new) is None
+
+
+def test_delete_sai_do_conjunto_quente(db, index):
+    target = _hash(3)
+    index.remember(target)
+    assert index.might_contain(target) is True
+    with db() as s:
+        s.delete(s.query(Payment).filter(Payment.tx_hash == target).one())
+        s.commit()
+    assert index.might_contain(target) is None
+
+
+def test_conjunto_quente_limitado(index, monkeypatch):
+    import used_hashes
+
+    monkeypatch.setattr(used_hashes, "USED_HASH_HOT_SIZE", 3)
+    for i in range(5):
+        index.remember(_hash(i))
+    assert index.get_stats()["hot"] == 3
+    assert index.might_contain(_hash(0)) is None
+    assert index.might_contain(_hash(4)) is True
+
+
+def test_insert_antes_da_carga_entra_no_filtro(db):
+    idx = UsedHashIndex()
+    idx.install(Payment)
+    early = _hash(700)
+    with db() as s:
+        s.add(Payment(tx_hash=early))
+        s.commit()
+    idx.load(db, Payment)
+    # Entra pela fila de antes da carga e de novo pela leitura do banco
+    assert idx.get_stats()["bloom_items"] == 52
+    assert idx.might_contain(early) is True
@@ -0,0 +1,163 @@
+# token_registry.py
+import asyncio
+import logging
+import threading
+from dataclasses import dataclass, replace
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Optional
+
+LOG = logging.getLogger(__name__)
+
+# Estratégias de precificação
+STRATEGY_PEGGED = "pegged"      # stablecoin pareada ao USD (preço 1.0)
+STRATEGY_NATIVE = "native"      # mapeada para um ativo do CoinGecko (ex.: BTCB -> bitcoin)
+STRATEGY_CONTRACT = "contract"  # consulta por contrato (simple/token_price)
+
+# Ids do CoinGecko tratados como pareados ao dólar
+PEGGED_CG_IDS = {"tether", "usd-coin", "dai", "binance-usd", "first-digital-usd"}
+
+
+def token_key(chain_id: str, address: str) -> str:
+    return f"{chain_id.lower()}:{address.lower()}"
+
+
+@dataclass(frozen=True)
+class TokenInfo:
+    """Metadados de um token ERC-20 em uma chain"""
+    chain_id: str
+    address: str
+    decimals: int
+    symbol: str
+    cg_id: Optional[str] = None
+    strategy: str = STRATEGY_CONTRACT
+
+    @property
+    def key(self) -> str:
+        return token_key(self.chain_id, self.address)
+
+
+def strategy_for(cg_id: Optional[str]) -> str:
+    if not cg_id:
+        return STRATEGY_CONTRACT
+    return STRATEGY_PEGGED if cg_id in PEGGED_CG_IDS else STRATEGY_NATIVE
+
+
+class TokenRegistry:
+    """
+    Registro de tokens ERC-20 (decimals, símbolo, cg_id, estratégia de preço).
+
+    Fica em memória (carregado do banco no startup) e se completa sozinho:
+    um token visto pela primeira vez tem decimals()/symbol() lidos on-chain
+    uma única vez e é persistido na tabela token_metadata. Tokens repetidos
+    não precisam de nenhuma chamada de metadados.
+    """
+
+    def __init__(self):
+        self.tokens: Dict[str, TokenInfo] = {}
+        self._session_factory: Optional[Callable] = None
+        self._lock = threading.Lock()
+
+    def get(self, chain_id: str, address: str) -> Optional[TokenInfo]:
+        return self.tokens.get(token_key(chain_id, address))
+
+    def seed(self, infos: Iterable[TokenInfo]):
+        """Tokens conhecidos (estáticos); não sobrescreve o que veio do banco"""
+        with self._lock:
+            for info in infos:
+                self.tokens.setdefault(info.key, info)
+
+    def load_from_db(self, session_factory: Callable) -> int:
+        """Carrega a tabela token_metadata e grava nela os tokens semeados que faltam"""
+        from models import TokenMetadata
+
+        self._session_factory = session_factory
+        with session_factory() as s:
+            rows = s.query(TokenMetadata).all()
+            stored = set()
+            with self._lock:
+                for row in rows:
+                    info = TokenInfo(
+                        chain_id=row.chain_id,
+                        address=row.address,
+                        decimals=row.decimals,
+                        symbol=row.symbol,
+                        cg_id=row.cg_id,
+                        strategy=row.strategy,
+                    )
+                    self.tokens[info.key] = info
+                    stored.add(info.key)
+                missing = [info for key, info in self.tokens.items() if key not in stored]
+
+            for info in missing:
+                s.add(self._to_row(info))
+            if missing:
+                s.commit()
+
+        LOG.info(f"[TOKENS] {len(rows)} tokens carregados do banco, {len(missing)} semeados")
+        return len(self.tokens)
+
+    def register(self,
+                 chain_id: str,
+                 address: str,
+                 decimals: int,
+                 symbol: str,
+                 cg_id: Optional[str] = None) -> TokenInfo:
+        """Registra um token visto pela primeira vez (memória + persistência em background)"""
+        known = self.get(chain_id, address)
+        if known is not None:
+            info = replace(known, decimals=decimals, symbol=known.symbol or symbol)
+        else:
+            info = TokenInfo(
+                chain_id=chain_id.lower(),
+                address=address.lower(),
+                decimals=decimals,
+                symbol=symbol,
+                cg_id=cg_id,
+                strategy=strategy_for(cg_id),
+            )
+        with self._lock:
+            self.tokens[info.key] = info
+        LOG.info(f"[TOKENS] Novo token registrado: {info.key} {info.symbol} ({info.decimals} decimals)")
+
+        if self._session_factory is not None:
+            try:
+                loop = asyncio.get_running_loop()
+                loop.run_in_executor(None, self._persist, info)
+            except RuntimeError:
+                self._persist(info)
+        return info
+
+    def _to_row(self, info: TokenInfo):
+        from models import TokenMetadata
+
+        return TokenMetadata(
+            token_key=info.key,
+            chain_id=info.chain_id,
+            address=info.address,
+            decimals=info.decimals,
+            symbol=info.symbol[:32],
+            cg_id=info.cg_id,
+            strategy=info.strategy,
+        )
+
+    def _persist(self, info: TokenInfo):
+        from models import TokenMetadata
+
+        try:
+            with self._session_factory() as s:
+                row = s.query(TokenMetadata).filter(TokenMetadata.token_key == info.key).first()
+                if row is None:
+                    s.add(self._to_row(info))
+                else:
+                    row.decimals = info.decimals
+                    row.symbol = info.symbol[:32]
+                    row.cg_id = info.cg_id
+                    row.strategy = info.strategy
+                    row.updated_at = datetime.now(timezone.utc)
+                s.commit()
+        except Exception as e:
+            LOG.warning(f"[TOKENS] Falha ao persistir {info.key}: {e}")
+
+
+# Instância global do registro
+token_registry = TokenRegistry()
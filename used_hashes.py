@@ -0,0 +1,209 @@
+# used_hashes.py
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+LOG = logging.getLogger(__name__)
+
+# Dimensionamento do filtro: capacidade mínima e taxa de falso positivo alvo
+USED_HASH_BLOOM_CAPACITY = int(os.getenv("USED_HASH_BLOOM_CAPACITY", "100000"))
+USED_HASH_BLOOM_FP_RATE = float(os.getenv("USED_HASH_BLOOM_FP_RATE", "0.001"))
+# Hashes recentes guardados exatamente (respondem "já usada" sem banco)
+USED_HASH_HOT_SIZE = int(os.getenv("USED_HASH_HOT_SIZE", "5000"))
+USED_HASH_LOAD_BATCH = int(os.getenv("USED_HASH_LOAD_BATCH", "5000"))
+
+# Chave em session.info com as hashes inseridas ainda não commitadas
+_PENDING_KEY = "used_hashes_pending"
+
+
+def _normalize(tx_hash: str) -> str:
+    return tx_hash.strip().lower()
+
+
+class BloomFilter:
+    """Filtro de Bloom simples (bytearray + double hashing com blake2b)"""
+
+    def __init__(self, capacity: int, fp_rate: float):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.capacity = capacity
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class UsedHashIndex:
+    """
+    Índice em memória das tx_hash já gravadas em Payment, para que hashes
+    novas (o caso comum) não precisem de ida ao banco antes da validação.
+
+    - Filtro de Bloom com todas as hashes, montado no startup e alimentado a
+      cada INSERT: "não está no filtro" = com certeza não usada.
+    - Conjunto exato das hashes recentes (inseridas/confirmadas no banco):
+      responde "já usada" sem consulta (spam reenviando a mesma hash).
+    - Qualquer outro caso ("talvez") cai na consulta normal ao banco.
+
+    O filtro é atualizado por eventos do SQLAlchemy no modelo Payment, então
+    todo caminho que grava pagamentos (webapp, /tx, webhook, admin) é coberto.
+    O conjunto quente só recebe hashes depois do commit e perde as apagadas;
+    o filtro nunca remove (apagadas viram "talvez" e vão ao banco).
+    """
+
+    def __init__(self):
+        self._bloom: Optional[BloomFilter] = None
+        self._hot: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Inserções vistas antes de o filtro existir (entram nele na carga)
+        self._early: list = []
+        self._installed = False
+        # Chave própria em session.info: os eventos de Session são globais
+        self._pending_key = f"{_PENDING_KEY}:{id(self)}"
+        self.ready = False
+        self.stats = {"negative": 0, "hot_hits": 0, "maybe": 0, "not_ready": 0, "loaded": 0}
+
+    # ----- consulta -----
+    def might_contain(self, tx_hash: str) -> Optional[bool]:
+        """False = com certeza livre; True = com certeza usada; None = consultar o banco"""
+        if not self.ready:
+            self.stats["not_ready"] += 1
+            return None
+        with self._lock:
+            if tx_hash in self._hot:
+                self._hot.move_to_end(tx_hash)
+                self.stats["hot_hits"] += 1
+                return True
+            if _normalize(tx_hash) not in self._bloom:
+                self.stats["negative"] += 1
+                return False
+        self.stats["maybe"] += 1
+        return None
+
+    def remember(self, tx_hash: str):
+        """Hash confirmada no banco (consulta ou commit): entra no conjunto quente"""
+        if not tx_hash:
+            return
+        with self._lock:
+            self._hot[tx_hash] = None
+            self._hot.move_to_end(tx_hash)
+            while len(self._hot) > USED_HASH_HOT_SIZE:
+                self._hot.popitem(last=False)
+
+    def forget(self, tx_hash: str):
+        with self._lock:
+            self._hot.pop(tx_hash, None)
+
+    def _add(self, tx_hash: str):
+        if not tx_hash:
+            return
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(_normalize(tx_hash))
+            else:
+                self._early.append(tx_hash)
+
+    # ----- eventos do SQLAlchemy -----
+    def install(self, payment_cls: Any):
+        """Liga o índice aos INSERT/UPDATE/DELETE de Payment e aos commits das sessões"""
+        if self._installed:
+            return
+        from sqlalchemy import event
+        from sqlalchemy.orm import Session, object_session
+
+        def after_insert(mapper, connection, target):
+            # No filtro já no flush: um rollback só deixa um falso positivo
+            self._add(target.tx_hash)
+            session = object_session(target)
+            if session is not None and target.tx_hash:
+                session.info.setdefault(self._pending_key, []).append(target.tx_hash)
+
+        def after_update(mapper, connection, target):
+            self._add(target.tx_hash)
+
+        def after_delete(mapper, connection, target):
+            if target.tx_hash:
+                self.forget(target.tx_hash)
+
+        def after_commit(session):
+            for tx_hash in session.info.pop(self._pending_key, ()):
+                self.remember(tx_hash)
+
+        def after_rollback(session):
+            session.info.pop(self._pending_key, None)
+
+        event.listen(payment_cls, "after_insert", after_insert)
+        event.listen(payment_cls, "after_update", after_update)
+        event.listen(payment_cls, "after_delete", after_delete)
+        event.listen(Session, "after_commit", after_commit)
+        event.listen(Session, "after_rollback", after_rollback)
+        self._installed = True
+
+    # ----- carga inicial -----
+    def load(self, session_factory: Callable, payment_cls: Any) -> int:
+        """Monta o filtro com todas as hashes gravadas (síncrono; rodar no executor)"""
+        from sqlalchemy import func
+
+        started = time.monotonic()
+        with session_factory() as s:
+            total = s.query(func.count(payment_cls.id)).scalar() or 0
+            bloom = BloomFilter(max(USED_HASH_BLOOM_CAPACITY, total * 2), USED_HASH_BLOOM_FP_RATE)
+            # Inserções durante a carga já caem no filtro novo
+            with self._lock:
+                self._bloom = bloom
+                for tx_hash in self._early:
+                    bloom.add(_normalize(tx_hash))
+                self._early = []
+            query = (
+                s.query(payment_cls.tx_hash)
+                .filter(payment_cls.tx_hash.isnot(None))
+                .execution_options(yield_per=USED_HASH_LOAD_BATCH)
+            )
+            loaded = 0
+            for (tx_hash,) in query:
+                self._add(tx_hash)
+                loaded += 1
+        self.stats["loaded"] = loaded
+        self.ready = True
+        LOG.info(f"[USED-HASHES] {loaded} hashes no filtro ({bloom.size // 8 // 1024} KiB, "
+                 f"{bloom.hashes} funções) em {time.monotonic() - started:.2f}s")
+        return loaded
+
+    async def load_async(self, session_factory: Callable, payment_cls: Any):
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self.load, session_factory, payment_cls)
+        except Exception as e:
+            LOG.warning(f"[USED-HASHES] Filtro não carregado, consultas seguem no banco: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        bloom = self._bloom
+        return {
+            **self.stats,
+            "ready": self.ready,
+            "hot": len(self._hot),
+            "bloom_items": bloom.count if bloom else 0,
+            "bloom_kib": (bloom.size // 8 // 1024) if bloom else 0,
+        }
+
+
+# Instância global do índice de hashes usadas
+used_hashes = UsedHashIndex()
@@ -71,52 +71,59 @@ def choose_plan_from_usd(amount_usd: float, prices: Dict[int, float] = None) ->
         LOG.info(f"[PLAN-SELECT] ${amount_usd:.2f} → 365 dias (ANUAL)")
         return 365
 
-async def vip_upsert_and_get_until(tg_id: int, username: Optional[str], days: int, first_name: Optional[str] = None) -> datetime:
-    """Create or replace VIP membership and return the new expiry (SEMPRE COMEÇA DO ZERO)."""
+def vip_upsert_in_session(s, tg_id: int, username: Optional[str], days: int, first_name: Optional[str] = None) -> datetime:
+    """
+    Create or replace VIP membership inside an open session (no commit) and return
+    the new expiry (SEMPRE COMEÇA DO ZERO). Lets the caller commit it together with the Payment.
+    """
     import logging
-    from main import SessionLocal, VipMembership, now_utc
+    from main import VipMembership, now_utc
 
     LOG = logging.getLogger("payments")
     now = now_utc()
 
-    with SessionLocal() as s:
-        # Buscar VIP existente
-        m = s.query(VipMembership).filter(VipMembership.user_id == tg_id).first()
-
-        if not m:
-            # Criar novo membro VIP
-            new_until = now + timedelta(days=days)
-            LOG.info(f"[VIP-CREATE] Criando novo VIP para user {tg_id}: {days} dias até {new_until.strftime('%d/%m/%Y')}")
-            m = VipMembership(
-                user_id=tg_id,
-                username=username,
-                first_name=first_name,
-                active=True,
-                expires_at=new_until,
-                created_at=now
-            )
-            s.add(m)
-        else:
-            # SUBSTITUIR VIP existente - SEMPRE COMEÇA DO ZERO
-            old_expires = m.expires_at.strftime('%d/%m/%Y %H:%M') if m.expires_at else 'N/A'
-            new_until = now + timedelta(days=days)
-
-            LOG.info(f"[VIP-REPLACE] Substituindo VIP de user {tg_id}:")
-            LOG.info(f"[VIP-REPLACE]   Anterior: expirava em {old_expires}")
-            LOG.info(f"[VIP-REPLACE]   Novo: {days} dias até {new_until.strftime('%d/%m/%Y %H:%M')}")
-
-            # Atualizar com novo período (SEMPRE DO ZERO)
-            m.expires_at = new_until
-            m.active = True
-            m.created_at = now  # Atualizar data de criação para refletir novo período
-            if username:
-                m.username = username
-            if first_name:
-                m.first_name = first_name
-
-        s.commit()
-        LOG.info(f"[VIP-FINAL] VIP ativo até: {m.expires_at.strftime('%d/%m/%Y %H:%M')}")
-        return m.expires_at
+    # Buscar VIP existente
+    m = s.query(VipMembership).filter(VipMembership.user_id == tg_id).first()
+
+    if not m:
+        # Criar novo membro VIP
+        new_until = now + timedelta(days=days)
+        LOG.info(f"[VIP-CREATE] Criando novo VIP para user {tg_id}: {days} dias até {new_until.strftime('%d/%m/%Y')}")
+        m = VipMembership(
+            user_id=tg_id,
+            username=username,
+            first_name=first_name,
+            active=True,
+            expires_at=new_until,
+            created_at=now
+        )
+        s.add(m)
+    else:
+        # SUBSTITUIR VIP existente - SEMPRE COMEÇA DO ZERO
+        old_expires = m.expires_at.strftime('%d/%m/%Y %H:%M') if m.expires_at else 'N/A'
+        new_until = now + timedelta(days=days)
+
+        LOG.info(f"[VIP-REPLACE] Substituindo VIP de user {tg_id}:")
+        LOG.info(f"[VIP-REPLACE]   Anterior: expirava em {old_expires}")
+        LOG.info(f"[VIP-REPLACE]   Novo: {days} dias até {new_until.strftime('%d/%m/%Y %H:%M')}")
+
+        # Atualizar com novo período (SEMPRE DO ZERO)
+        m.expires_at = new_until
+        m.active = True
+        m.created_at = now  # Atualizar data de criação para refletir novo período
+        if username:
+            m.username = username
+        if first_name:
+            m.first_name = first_name
+
+    LOG.info(f"[VIP-FINAL] VIP ativo até: {m.expires_at.strftime('%d/%m/%Y %H:%M')}")
+    return m.expires_at
+
+async def vip_upsert_and_get_until(tg_id: int, username: Optional[str], days: int, first_name: Optional[str] = None) -> datetime:
+    """Create or replace VIP membership and return the new expiry (SEMPRE COMEÇA DO ZERO)."""
+    from async_db import async_db
+
+    return await async_db.run(vip_upsert_in_session, tg_id, username, days, first_name)
 
 async def create_one_time_invite(
     bot: Bot,
@@ -0,0 +1,227 @@
+# validation_jobs.py
+import asyncio
+import logging
+import os
+import secrets
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+LOG = logging.getLogger(__name__)
+
+# Workers compartilhados por todas as validações (webapp e /tx)
+VALIDATION_WORKERS = int(os.getenv("VALIDATION_WORKERS", "8"))
+VALIDATION_QUEUE_MAX = int(os.getenv("VALIDATION_QUEUE_MAX", "500"))
+# Por quanto tempo o resultado de um job fica consultável
+VALIDATION_JOB_TTL = int(os.getenv("VALIDATION_JOB_TTL", "900"))
+# Resultado pendente sem pending_tx (UID temporário): o job volta para a fila
+# sozinho, com espera dobrando a cada tentativa, até VALIDATION_PENDING_MAX_AGE
+VALIDATION_RECHECK_SECONDS = float(os.getenv("VALIDATION_RECHECK_SECONDS", "15"))
+VALIDATION_RECHECK_MAX_DELAY = float(os.getenv("VALIDATION_RECHECK_MAX_DELAY", "120"))
+VALIDATION_PENDING_MAX_AGE = int(os.getenv("VALIDATION_PENDING_MAX_AGE", "1800"))
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class ValidationJob:
+    """Um pedido de validação na fila; quem acompanha espera por wait_change()"""
+
+    def __init__(self, key: str, fn: Callable[[], Awaitable[Any]]):
+        # Id imprevisível: o resultado pode conter o link de convite VIP
+        self.id = secrets.token_urlsafe(16)
+        self.key = key
+        self.fn = fn
+        self.status = STATUS_QUEUED
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.version = 0
+        self.rechecks = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (STATUS_DONE, STATUS_FAILED)
+
+    def _set(self, status: str, result: Any = None, error: Optional[str] = None):
+        self.status = status
+        self.result = result
+        self.error = error
+        if self.finished:
+            self.finished_at = time.time()
+        self.version += 1
+        # Acorda todos os que esperavam a versão anterior
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait_change(self, version: int, timeout: float) -> bool:
+        """Espera uma versão mais nova que `version`; False se o tempo acabar"""
+        if self.version != version:
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {"job_id": self.id, "status": self.status, "version": self.version}
+        if self.finished or self.status == STATUS_PENDING:
+            data["result"] = self.result
+            if self.error:
+                data["error"] = self.error
+        return data
+
+
+class ValidationJobPool:
+    """
+    Fila de validações com um pool pequeno de workers.
+
+    Os handlers (POST /api/validate, /tx) só enfileiram e respondem na hora;
+    o trabalho pesado (busca autochain, banco, convite) roda aqui. Pedidos
+    repetidos com a mesma chave enquanto o primeiro não terminou recebem o
+    mesmo job (duplo clique não gera trabalho dobrado).
+
+    Um resultado com "recheck" (transação ainda sem confirmação que ninguém
+    mais acompanha) deixa o job em STATUS_PENDING e o reenfileira com
+    backoff: quem segue no SSE recebe o convite quando a tx amadurecer.
+    Quem reenviar a mesma chave depois da aprovação (página fechada no meio
+    tempo) recebe o job aprovado de volta enquanto ele estiver guardado.
+    """
+
+    def __init__(self, workers: int = VALIDATION_WORKERS):
+        self.workers = workers
+        self.jobs: Dict[str, ValidationJob] = {}
+        self._active: Dict[str, ValidationJob] = {}
+        # Último job de cada chave (devolve a aprovação a quem reenviar)
+        self._last: Dict[str, ValidationJob] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self.stats = {"submitted": 0, "deduped": 0, "done": 0, "failed": 0, "rejected": 0, "rechecks": 0}
+
+    def start(self):
+        """Inicia os workers (precisa do event loop ativo)"""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=VALIDATION_QUEUE_MAX)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        LOG.info(f"[JOBS] {self.workers} workers de validação iniciados")
+
+    async def stop(self):
+        for job in list(self._active.values()):
+            if job._timer is not None:
+                job._timer.cancel()
+                job._set(STATUS_FAILED, error="Servidor reiniciando, tente novamente.")
+                self._release(job)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _cleanup(self):
+        cutoff = time.time() - VALIDATION_JOB_TTL
+        for job_id in [j.id for j in self.jobs.values() if j.finished and j.finished_at < cutoff]:
+            job = self.jobs.pop(job_id)
+            if self._last.get(job.key) is job:
+                del self._last[job.key]
+
+    def submit(self, key: str, fn: Callable[[], Awaitable[Any]]) -> ValidationJob:
+        """Enfileira (ou reaproveita) um job; asyncio.QueueFull se a fila estiver cheia"""
+        self.start()
+        self._cleanup()
+        active = self._active.get(key)
+        if active is not None and not active.finished:
+            self.stats["deduped"] += 1
+            return active
+        last = self._last.get(key)
+        if last is not None and last.status == STATUS_DONE and isinstance(last.result, dict) and last.result.get("ok"):
+            self.stats["deduped"] += 1
+            return last
+
+        job = ValidationJob(key, fn)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            raise
+        self.jobs[job.id] = job
+        self._active[key] = job
+        self._last[key] = job
+        self.stats["submitted"] += 1
+        return job
+
+    def is_active(self, key: str) -> bool:
+        job = self._active.get(key)
+        return job is not None and not job.finished
+
+    def get(self, job_id: str) -> Optional[ValidationJob]:
+        return self.jobs.get(job_id)
+
+    def _release(self, job: ValidationJob):
+        if self._active.get(job.key) is job:
+            del self._active[job.key]
+        job.fn = None
+        job._timer = None
+
+    def _wants_recheck(self, job: ValidationJob, result: Any) -> bool:
+        return (isinstance(result, dict) and bool(result.get("recheck"))
+                and time.time() - job.created_at < VALIDATION_PENDING_MAX_AGE)
+
+    def _schedule_recheck(self, job: ValidationJob):
+        delay = min(VALIDATION_RECHECK_MAX_DELAY, VALIDATION_RECHECK_SECONDS * 2 ** min(job.rechecks, 10))
+        job.rechecks += 1
+        job._timer = asyncio.get_running_loop().call_later(delay, self._requeue, job)
+
+    def _requeue(self, job: ValidationJob):
+        job._timer = None
+        try:
+            self._queue.put_nowait(job)
+            self.stats["rechecks"] += 1
+        except asyncio.QueueFull:
+            # Fila cheia: encerra com o último resultado pendente
+            job._set(STATUS_DONE, job.result)
+            self.stats["done"] += 1
+            self._release(job)
+
+    async def _worker(self, idx: int):
+        while True:
+            job = await self._queue.get()
+            try:
+                job._set(STATUS_RUNNING, job.result)
+                result = await job.fn()
+                if self._wants_recheck(job, result):
+                    job._set(STATUS_PENDING, result)
+                    self._schedule_recheck(job)
+                else:
+                    job._set(STATUS_DONE, result)
+                    self.stats["done"] += 1
+            except asyncio.CancelledError:
+                job._set(STATUS_FAILED, error="Servidor reiniciando, tente novamente.")
+                raise
+            except Exception as e:
+                LOG.exception(f"[JOBS] Job {job.key[:40]} falhou: {e}")
+                job._set(STATUS_FAILED, error=str(e)[:200])
+                self.stats["failed"] += 1
+            finally:
+                if job.finished:
+                    self._release(job)
+                self._queue.task_done()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "workers": len(self._tasks),
+            "queued": self._queue.qsize() if self._queue else 0,
+            "running": sum(1 for j in self._active.values() if j.status == STATUS_RUNNING),
+            "pending": sum(1 for j in self._active.values() if j.status == STATUS_PENDING),
+            "kept": len(self.jobs),
+        }
+
+
+# Instância global do pool de validações
+validation_jobs = ValidationJobPool()
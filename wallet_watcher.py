@@ -0,0 +1,432 @@
+# wallet_watcher.py
+import asyncio
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import deadline
+from chain_head import BLOCK_TIMES, DEFAULT_BLOCK_TIME, head_tracker
+from quota_budget import quota_budget
+from rpc_client import endpoint_host
+
+LOG = logging.getLogger(__name__)
+
+WATCHER_ENABLED = os.getenv("WATCHER_ENABLED", "1") == "1"
+# Chains acompanhadas (as demais continuam só na busca autochain)
+WATCHER_CHAINS = [
+    c.strip().lower()
+    for c in os.getenv("WATCHER_CHAINS", "0x1,0x38,0x89,0xa4b1,0xa,0x2105").split(",")
+    if c.strip()
+]
+# Blocos por eth_getLogs (reduzido automaticamente se o nó recusar o intervalo)
+WATCHER_LOG_RANGE = int(os.getenv("WATCHER_LOG_RANGE", "2000"))
+WATCHER_LOG_RANGE_MIN = int(os.getenv("WATCHER_LOG_RANGE_MIN", "50"))
+# Transferências nativas exigem ler blocos inteiros (com as txs): desligadas por
+# padrão, só nas chains listadas aqui (ex.: "0x1,0x38")
+WATCHER_NATIVE_CHAINS = [
+    c.strip().lower()
+    for c in os.getenv("WATCHER_NATIVE_CHAINS", "").split(",")
+    if c.strip()
+]
+# Lote nativo = blocos produzidos em um ciclo x WATCHER_NATIVE_CATCHUP, no máximo WATCHER_NATIVE_BATCH
+WATCHER_NATIVE_BATCH = int(os.getenv("WATCHER_NATIVE_BATCH", "20"))
+WATCHER_NATIVE_CATCHUP = float(os.getenv("WATCHER_NATIVE_CATCHUP", "2"))
+WATCHER_NATIVE_MAX_LAG = int(os.getenv("WATCHER_NATIVE_MAX_LAG", "2000"))
+# Quantos blocos para trás varrer na primeira execução (sem checkpoint)
+WATCHER_BACKFILL_BLOCKS = int(os.getenv("WATCHER_BACKFILL_BLOCKS", "5000"))
+WATCHER_MIN_INTERVAL = float(os.getenv("WATCHER_MIN_INTERVAL", "5"))
+WATCHER_RPC_TIMEOUT = float(os.getenv("WATCHER_RPC_TIMEOUT", "10"))
+# Após erros seguidos o intervalo dobra a cada falha, até este teto (segundos)
+WATCHER_MAX_BACKOFF = float(os.getenv("WATCHER_MAX_BACKOFF", "300"))
+# Checkpoints vão ao banco no máximo a cada N segundos (reprocessar é idempotente)
+WATCHER_CHECKPOINT_SECONDS = float(os.getenv("WATCHER_CHECKPOINT_SECONDS", "30"))
+
+# keccak("Transfer(address,address,uint256)")
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+
+STREAM_LOGS = "logs"
+STREAM_NATIVE = "native"
+
+
+@dataclass(frozen=True)
+class IncomingTransfer:
+    """Transferência recebida na carteira (nativa ou ERC-20)"""
+    chain_id: str
+    tx_hash: str
+    log_index: int          # -1 para transferência nativa
+    kind: str               # native, erc20
+    token_address: Optional[str]
+    from_address: Optional[str]
+    amount_raw: int
+    block_number: int
+
+
+def _to_int(value: Any) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, int):
+        return value
+    value = str(value)
+    return int(value, 16) if value.startswith(("0x", "0X")) else int(value)
+
+
+def _interval(chain_id: str) -> float:
+    """Espera entre ciclos de uma chain em dia: um bloco, no mínimo WATCHER_MIN_INTERVAL"""
+    return max(WATCHER_MIN_INTERVAL, BLOCK_TIMES.get(chain_id, DEFAULT_BLOCK_TIME))
+
+
+def _native_batch(chain_id: str) -> int:
+    """Blocos por lote nativo: os produzidos em um ciclo, com folga para recuperar atraso"""
+    per_cycle = _interval(chain_id) / BLOCK_TIMES.get(chain_id, DEFAULT_BLOCK_TIME)
+    return max(1, min(WATCHER_NATIVE_BATCH, math.ceil(per_cycle * WATCHER_NATIVE_CATCHUP)))
+
+
+class WalletWatcher:
+    """
+    Acompanha os blocos novos das chains principais e indexa, na tabela
+    incoming_payments, tudo o que chega em WALLET_ADDRESS:
+
+    - ERC-20: eth_getLogs do tópico Transfer filtrado pelo destinatário
+      (intervalos grandes, uma chamada por intervalo);
+    - nativo (só nas chains de WATCHER_NATIVE_CHAINS): transações dos
+      blocos com to == carteira (lotes de eth_getBlockByNumber do tamanho
+      de um ciclo, adiados se os endpoints estiverem sem cota).
+      Transferências internas de contratos não aparecem aqui e continuam
+      pela busca normal.
+
+    Cada fluxo (chain, logs/native) tem um checkpoint persistido em
+    watcher_checkpoints; após um período fora do ar a varredura continua de
+    onde parou (backfill). Na validação, um hash já indexado vira uma
+    consulta local que aponta a chain, sem a busca em todas as redes.
+    """
+
+    def __init__(self):
+        self.wallet = ""
+        self.chains: List[str] = []
+        self.native_chains: List[str] = []
+        self._rpc_factory: Optional[Callable] = None
+        self._session_factory: Optional[Callable] = None
+        self._checkpoints: Dict[Tuple[str, str], int] = {}
+        self._dirty: Dict[Tuple[str, str], int] = {}
+        self._last_flush = 0.0
+        self._log_range: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"blocks_logs": 0, "blocks_native": 0, "native_deferred": 0, "matches": 0,
+                      "errors": 0, "lookups": 0, "lookup_hits": 0}
+
+    def configure(self,
+                  wallet: str,
+                  rpc_factory: Callable,
+                  session_factory: Callable,
+                  chains: Iterable[str]):
+        self.wallet = (wallet or "").lower()
+        self._rpc_factory = rpc_factory
+        self._session_factory = session_factory
+        self.chains = [c for c in WATCHER_CHAINS if c in set(chains)]
+        self.native_chains = [c for c in self.chains if c in WATCHER_NATIVE_CHAINS]
+
+    @property
+    def enabled(self) -> bool:
+        return bool(WATCHER_ENABLED and self.wallet and self._rpc_factory
+                    and self._session_factory and self.chains)
+
+    @property
+    def running(self) -> bool:
+        """Varredura ativa: só então o índice pode ter algo novo a dizer"""
+        return self.enabled and self._task is not None and not self._task.done()
+
+    @property
+    def _wallet_topic(self) -> str:
+        return "0x" + "0" * 24 + self.wallet[2:]
+
+    # ----- banco (executado fora do event loop) -----
+    async def _run_db(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+    def _load_checkpoints(self):
+        from models import WatcherCheckpoint
+
+        with self._session_factory() as s:
+            for row in s.query(WatcherCheckpoint).all():
+                self._checkpoints[(row.chain_id, row.stream)] = row.last_block
+        LOG.info(f"[WATCHER] {len(self._checkpoints)} checkpoints carregados")
+
+    def _save_checkpoints(self, pending: Dict[Tuple[str, str], int]):
+        from models import WatcherCheckpoint
+
+        with self._session_factory() as s:
+            for (chain_id, stream), block in pending.items():
+                row = s.query(WatcherCheckpoint).filter(
+                    WatcherCheckpoint.chain_id == chain_id,
+                    WatcherCheckpoint.stream == stream,
+                ).first()
+                if row is None:
+                    s.add(WatcherCheckpoint(chain_id=chain_id, stream=stream, last_block=block,
+                                            updated_at=datetime.now(timezone.utc)))
+                elif block > row.last_block:
+                    row.last_block = block
+                    row.updated_at = datetime.now(timezone.utc)
+            s.commit()
+
+    def _store(self, transfers: List[IncomingTransfer]) -> int:
+        from models import IncomingPayment
+
+        added = 0
+        with self._session_factory() as s:
+            for t in transfers:
+                exists = s.query(IncomingPayment.id).filter(
+                    IncomingPayment.chain_id == t.chain_id,
+                    IncomingPayment.tx_hash == t.tx_hash,
+                    IncomingPayment.log_index == t.log_index,
+                ).first()
+                if exists:
+                    continue
+                s.add(IncomingPayment(
+                    chain_id=t.chain_id,
+                    tx_hash=t.tx_hash,
+                    log_index=t.log_index,
+                    kind=t.kind,
+                    token_address=t.token_address,
+                    from_address=t.from_address,
+                    amount_raw=str(t.amount_raw),
+                    block_number=t.block_number,
+                ))
+                added += 1
+            s.commit()
+        return added
+
+    def _find(self, tx_hash: str) -> List[IncomingTransfer]:
+        from models import IncomingPayment
+
+        with self._session_factory() as s:
+            rows = s.query(IncomingPayment).filter(IncomingPayment.tx_hash == tx_hash).all()
+            return [
+                IncomingTransfer(
+                    chain_id=row.chain_id,
+                    tx_hash=row.tx_hash,
+                    log_index=row.log_index,
+                    kind=row.kind,
+                    token_address=row.token_address,
+                    from_address=row.from_address,
+                    amount_raw=int(row.amount_raw),
+                    block_number=row.block_number,
+                )
+                for row in rows
+            ]
+
+    # ----- consulta -----
+    async def lookup(self, tx_hash: str) -> List[IncomingTransfer]:
+        """Transferências indexadas para o hash (lista vazia se não visto ou watcher parado)"""
+        # Watcher desligado/sem chains: nem vale a ida ao banco em cada validação
+        if not self.running:
+            return []
+        self.stats["lookups"] += 1
+        try:
+            # Índice é só uma dica: sem prazo para o banco, segue sem ele
+            found = await deadline.wait(self._run_db(self._find, tx_hash.lower()))
+        except Exception as e:
+            LOG.warning(f"[WATCHER] Falha na consulta do índice: {e}")
+            return []
+        if found:
+            self.stats["lookup_hits"] += 1
+        return found
+
+    # ----- checkpoints -----
+    def _start_block(self, chain_id: str, stream: str, head: int, max_lag: Optional[int] = None) -> int:
+        last = self._checkpoints.get((chain_id, stream))
+        start = head - WATCHER_BACKFILL_BLOCKS if last is None else last + 1
+        if max_lag is not None and head - start > max_lag:
+            LOG.warning(f"[WATCHER {chain_id}] {stream}: {head - start} blocos atrasado, "
+                        f"pulando para os últimos {max_lag}")
+            start = head - max_lag
+        return max(0, start)
+
+    async def _advance(self, chain_id: str, stream: str, block: int, force: bool = False):
+        key = (chain_id, stream)
+        self._checkpoints[key] = block
+        self._dirty[key] = block
+        if force or time.monotonic() - self._last_flush >= WATCHER_CHECKPOINT_SECONDS:
+            await self.flush()
+
+    async def flush(self):
+        """Grava no banco os checkpoints avançados desde a última gravação"""
+        if not self._dirty or self._session_factory is None:
+            return
+        pending, self._dirty = self._dirty, {}
+        self._last_flush = time.monotonic()
+        try:
+            await self._run_db(self._save_checkpoints, pending)
+        except Exception as e:
+            LOG.warning(f"[WATCHER] Falha ao gravar checkpoints: {e}")
+            for key, block in pending.items():
+                self._dirty.setdefault(key, block)
+
+    async def _record(self, transfers: List[IncomingTransfer]) -> int:
+        if not transfers:
+            return 0
+        added = await self._run_db(self._store, transfers)
+        self.stats["matches"] += added
+        for t in transfers:
+            LOG.info(f"[WATCHER {t.chain_id}] Pagamento recebido ({t.kind}): {t.tx_hash} bloco {t.block_number}")
+        return added
+
+    # ----- varredura -----
+    async def _scan_logs(self, chain_id: str, rpc, head: int) -> bool:
+        """
+        Um intervalo de eth_getLogs; retorna True se ainda há blocos atrasados.
+        Intervalo recusado pelo nó: reduz e retorna False (tenta de novo no
+        próximo ciclo, sem repetir em sequência).
+        """
+        start = self._start_block(chain_id, STREAM_LOGS, head)
+        if start > head:
+            return False
+        span = self._log_range.get(chain_id, WATCHER_LOG_RANGE)
+        end = min(head, start + span - 1)
+        query = {
+            "fromBlock": hex(start),
+            "toBlock": hex(end),
+            "topics": [TRANSFER_TOPIC, None, self._wallet_topic],
+        }
+        try:
+            logs = await rpc.call("eth_getLogs", [query], timeout=WATCHER_RPC_TIMEOUT, hedge=False)
+        except Exception as e:
+            if span > WATCHER_LOG_RANGE_MIN:
+                # Nós públicos limitam o intervalo/quantidade de logs: tenta um intervalo menor
+                self._log_range[chain_id] = max(WATCHER_LOG_RANGE_MIN, span // 2)
+                LOG.info(f"[WATCHER {chain_id}] eth_getLogs recusado ({str(e)[:60]}), intervalo -> {self._log_range[chain_id]}")
+                return False
+            raise
+
+        transfers = []
+        for log in logs or []:
+            topics = log.get("topics") or []
+            if log.get("removed") or len(topics) < 3:
+                continue
+            data = log.get("data") or "0x"
+            transfers.append(IncomingTransfer(
+                chain_id=chain_id,
+                tx_hash=str(log.get("transactionHash") or "").lower(),
+                log_index=_to_int(log.get("logIndex")),
+                kind="erc20",
+                token_address=(log.get("address") or "").lower(),
+                from_address="0x" + str(topics[1])[-40:].lower(),
+                amount_raw=int(data, 16) if data not in ("0x", "") else 0,
+                block_number=_to_int(log.get("blockNumber")),
+            ))
+        await self._record(transfers)
+
+        self.stats["blocks_logs"] += end - start + 1
+        if span < WATCHER_LOG_RANGE:
+            self._log_range[chain_id] = min(WATCHER_LOG_RANGE, span * 2)
+        await self._advance(chain_id, STREAM_LOGS, end, force=bool(transfers))
+        return end < head
+
+    async def _scan_native(self, chain_id: str, rpc, head: int) -> bool:
+        """Um lote de blocos completos; retorna True se ainda há blocos atrasados"""
+        start = self._start_block(chain_id, STREAM_NATIVE, head, max_lag=WATCHER_NATIVE_MAX_LAG)
+        if start > head:
+            return False
+        end = min(head, start + _native_batch(chain_id) - 1)
+        calls = [("eth_getBlockByNumber", [hex(n), True]) for n in range(start, end + 1)]
+        # Cada bloco do batch conta na cota do host: sem folga em nenhum endpoint, fica para o próximo ciclo
+        hosts = {endpoint_host(url) for url in getattr(rpc, "endpoints", None) or []}
+        if hosts and not any(quota_budget.has_headroom(host, cost=len(calls)) for host in hosts):
+            self.stats["native_deferred"] += 1
+            return False
+        blocks = await rpc.batch(calls, timeout=WATCHER_RPC_TIMEOUT, hedge=False)
+
+        transfers = []
+        scanned = start - 1
+        for block in blocks or []:
+            # Para no primeiro bloco ausente (endpoint atrás do head): retoma dali no próximo ciclo
+            if not block:
+                break
+            number = _to_int(block.get("number"))
+            for tx in block.get("transactions") or []:
+                if not isinstance(tx, dict):
+                    continue
+                value = _to_int(tx.get("value"))
+                if value > 0 and (tx.get("to") or "").lower() == self.wallet:
+                    transfers.append(IncomingTransfer(
+                        chain_id=chain_id,
+                        tx_hash=str(tx.get("hash") or "").lower(),
+                        log_index=-1,
+                        kind="native",
+                        token_address=None,
+                        from_address=(tx.get("from") or "").lower(),
+                        amount_raw=value,
+                        block_number=number,
+                    ))
+            scanned = number
+        await self._record(transfers)
+
+        if scanned < start:
+            return False
+        self.stats["blocks_native"] += scanned - start + 1
+        await self._advance(chain_id, STREAM_NATIVE, scanned, force=bool(transfers))
+        return scanned < head
+
+    async def _watch_chain(self, chain_id: str):
+        rpc = self._rpc_factory(chain_id)
+        interval = _interval(chain_id)
+        native = chain_id in self.native_chains
+        failures = 0
+        while True:
+            try:
+                head = await head_tracker.latest(rpc)
+                behind = await self._scan_logs(chain_id, rpc, head)
+                if native:
+                    behind = await self._scan_native(chain_id, rpc, head) or behind
+                failures = 0
+                # Atrasado (backfill): segue direto; em dia: espera novos blocos
+                delay = 0 if behind else interval
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                failures += 1
+                delay = min(WATCHER_MAX_BACKOFF, interval * 2 ** min(failures, 10))
+                LOG.warning(f"[WATCHER {chain_id}] Erro na varredura ({failures}x, nova tentativa em "
+                            f"{delay:.0f}s): {str(e)[:100]}")
+            await asyncio.sleep(delay)
+
+    async def _run(self):
+        await self._run_db(self._load_checkpoints)
+        await asyncio.gather(*[self._watch_chain(cid) for cid in self.chains])
+
+    def start(self):
+        """Inicia a varredura de todas as chains acompanhadas (precisa do event loop ativo)"""
+        if not self.enabled:
+            LOG.info("[WATCHER] Desativado (sem WALLET_ADDRESS, sem chains ou WATCHER_ENABLED=0)")
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            LOG.info(f"[WATCHER] Acompanhando {len(self.chains)} chains: {', '.join(self.chains)} "
+                     f"(nativo: {', '.join(self.native_chains) or 'nenhuma'})")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        await self.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "chains": len(self.chains),
+            "native_chains": self.native_chains,
+            "checkpoints": {f"{c}:{s}": b for (c, s), b in self._checkpoints.items()},
+        }
+
+
+# Instância global do watcher
+wallet_watcher = WalletWatcher()
@@ -103,6 +103,25 @@ function renderPlans(plansObj) {
   }
 }
 
+// --- render de redes (dica de chain para a validação) ---
+function renderNetworks(networks) {
+  const el = $("network");
+  if (!el) return;
+  // Mantém só a opção "detectar automaticamente"
+  el.length = 1;
+  for (const name of networks) {
+    const opt = document.createElement("option");
+    opt.value = name;
+    opt.textContent = name;
+    el.appendChild(opt);
+  }
+}
+
+function selectedNetwork() {
+  const el = $("network");
+  return el && el.value ? el.value : null;
+}
+
 // --- carrega carteira + planos do backend ---
 async function loadConfig() {
   // Remover verificação de segurança - acesso direto permitido
@@ -144,6 +163,8 @@ async function loadConfig() {
       console.log("[auto-fill] User ID preenchido automaticamente:", uid);
     }
     
+    renderNetworks(j.networks || []);
+
     // Mensagens contextuais opcionais
     if (ctxInfo) {
       const parts = [];
@@ -168,6 +189,107 @@ async function loadConfig() {
   }
 }
 
+// --- acompanhamento do job de validação (GET /api/validate/{id}) ---
+const VALIDATION_WAIT_MS = 120000;
+// Job "pending": o servidor reverifica sozinho até a transação confirmar
+const VALIDATION_PENDING_WAIT_MS = 1800000;
+
+function jobProgress(job) {
+  if (job.status === "queued") updateProgress(65, "Validação na fila...");
+  else if (job.status === "running") updateProgress(75, "Buscando a transação nas blockchains...");
+  else if (job.status === "pending") {
+    updateProgress(70, "Aguardando confirmação da transação...", "info");
+    if (job.result?.message) showAlert(job.result.message, false);
+  }
+}
+
+// SSE quando disponível; long-poll como alternativa (proxies que cortam streams)
+function waitForValidationJob(jobId) {
+  const url = `/api/validate/${encodeURIComponent(jobId)}`;
+  if (!window.EventSource) return pollValidationJob(url);
+
+  return new Promise((resolve, reject) => {
+    const es = new EventSource(url);
+    const expire = () => {
+      es.close();
+      reject(Object.assign(new Error("timeout"), { name: "AbortError" }));
+    };
+    let timer = setTimeout(expire, VALIDATION_WAIT_MS);
+    let pending = false;
+
+    es.addEventListener("status", (ev) => {
+      const job = JSON.parse(ev.data);
+      jobProgress(job);
+      if (job.status === "pending" && !pending) {
+        pending = true;
+        clearTimeout(timer);
+        timer = setTimeout(expire, VALIDATION_PENDING_WAIT_MS);
+      }
+      if (job.status === "done" || job.status === "failed") {
+        clearTimeout(timer);
+        es.close();
+        resolve(job);
+      }
+    });
+    es.onerror = () => {
+      // Conexão SSE caiu: segue acompanhando por long-poll
+      clearTimeout(timer);
+      es.close();
+      pollValidationJob(url).then(resolve, reject);
+    };
+  });
+}
+
+async function pollValidationJob(url) {
+  const started = Date.now();
+  let deadline = started + VALIDATION_WAIT_MS;
+  let version = -1;
+  while (Date.now() < deadline) {
+    const r = await fetch(`${url}?wait=25&version=${version}`, { cache: "no-store" });
+    if (!r.ok) throw new Error(`Erro ${r.status} ao consultar a validação`);
+    const job = await r.json();
+    jobProgress(job);
+    if (job.status === "done" || job.status === "failed") return job;
+    if (job.status === "pending") deadline = started + VALIDATION_PENDING_WAIT_MS;
+    version = job.version;
+  }
+  throw Object.assign(new Error("timeout"), { name: "AbortError" });
+}
+
+function handleValidationResult(j) {
+  if (j.ok) {
+    updateProgress(90, "Pagamento confirmado! ✅", "success");
+
+    // mostra mensagem e redireciona para o convite se existir
+    showAlert(j.message || "Pagamento confirmado!", true);
+
+    if (j.invite) {
+      updateProgress(100, "Redirecionando para o grupo VIP...", "success");
+      // redireciona imediatamente
+      setTimeout(() => {
+        window.location.href = j.invite;
+      }, 1500); // delay maior para ver o progresso completo
+    } else if (j.no_auto_invite) {
+      updateProgress(100, "VIP ativado! Entre em contato para receber o convite.", "success");
+      // VIP ativado mas sem convite automático
+      showAlert((j.message || "Pagamento confirmado!") + "<br><br><strong>🎉 VIP Ativado!</strong><br>Entre em contato no bot para receber o convite do grupo.", true);
+      setTimeout(hideProgress, 3000);
+    } else {
+      updateProgress(95, "Pagamento confirmado, mas sem link de convite", "info");
+      showAlert((j.message || "Pagamento confirmado!") + "<br><br>Não recebemos o link de convite. Tente novamente.", true);
+      setTimeout(hideProgress, 3000);
+    }
+  } else if (j.pending) {
+    updateProgress(50, "Transação ainda sem confirmação - reverificação automática ativa", "info");
+    hideProgress();
+    showAlert(j.message || "Transação pendente. Vamos reverificar automaticamente.", false);
+  } else {
+    updateProgress(0, "Pagamento não reconhecido ou inválido", "error");
+    hideProgress();
+    showAlert(j.message || "Pagamento não reconhecido.", false);
+  }
+}
+
 // --- validar pagamento (POST /api/validate) ---
 let isValidating = false; // Flag para prevenir duplo clique
 async function validatePayment() {
@@ -242,21 +364,19 @@ async function validatePayment() {
   try {
     updateProgress(60, "Enviando dados para validação...");
 
-    // Timeout de 60 segundos para a requisição
+    // O POST só enfileira (202 + job_id); o resultado chega por SSE/long-poll
     const controller = new AbortController();
-    const timeoutId = setTimeout(() => controller.abort(), 60000);
+    const timeoutId = setTimeout(() => controller.abort(), 15000);
 
     const r = await fetch("/api/validate", {
       method: "POST",
       headers: { "content-type": "application/json" },
-      body: JSON.stringify({ uid: userID, username: null, hash }),
+      body: JSON.stringify({ uid: userID, username: null, hash, chain: selectedNetwork() }),
       signal: controller.signal,
       cache: 'no-store'
     }).finally(() => clearTimeout(timeoutId));
 
-    updateProgress(70, "Processando resposta do servidor...");
-
-    const j = await r.json().catch(() => ({}));
+    let j = await r.json().catch(() => ({}));
     if (!r.ok) {
       updateProgress(0, `Erro do servidor ${r.status}: ${j.detail || "Falha na validação"}`, "error");
       hideProgress();
@@ -264,40 +384,22 @@ async function validatePayment() {
       return;
     }
 
-    updateProgress(80, "Validação concluída, processando resultado...");
-
-    if (j.ok) {
-      updateProgress(90, "Pagamento confirmado! ✅", "success");
-
-      // mostra mensagem e redireciona para o convite se existir
-      showAlert(j.message || "Pagamento confirmado!", true);
-
-      if (j.invite) {
-        updateProgress(100, "Redirecionando para o grupo VIP...", "success");
-        // redireciona imediatamente
-        setTimeout(() => {
-          window.location.href = j.invite;
-        }, 1500); // delay maior para ver o progresso completo
-      } else if (j.no_auto_invite) {
-        updateProgress(100, "VIP ativado! Entre em contato para receber o convite.", "success");
-        // VIP ativado mas sem convite automático
-        showAlert((j.message || "Pagamento confirmado!") + "<br><br><strong>🎉 VIP Ativado!</strong><br>Entre em contato no bot para receber o convite do grupo.", true);
-        setTimeout(hideProgress, 3000);
-      } else {
-        updateProgress(95, "Pagamento confirmado, mas sem link de convite", "info");
-        showAlert((j.message || "Pagamento confirmado!") + "<br><br>Não recebemos o link de convite. Tente novamente.", true);
-        setTimeout(hideProgress, 3000);
+    if (r.status === 202 && j.job_id) {
+      updateProgress(65, "Validação na fila...");
+      const job = await waitForValidationJob(j.job_id);
+      if (job.status === "failed" || !job.result) {
+        throw new Error(job.error || "Falha na validação");
       }
-    } else {
-      updateProgress(0, "Pagamento não reconhecido ou inválido", "error");
-      hideProgress();
-      showAlert(j.message || "Pagamento não reconhecido.", false);
+      j = job.result;
     }
+
+    updateProgress(80, "Validação concluída, processando resultado...");
+    handleValidationResult(j);
   } catch (err) {
     console.error(err);
 
     if (err.name === 'AbortError') {
-      updateProgress(0, "Timeout: Validação demorou mais de 60 segundos", "error");
+      updateProgress(0, "Timeout: Validação demorou mais de 2 minutos", "error");
       hideProgress();
       showAlert("A validação está demorando muito. A transação pode estar em uma blockchain menos comum. Tente novamente em alguns minutos ou entre em contato com o suporte.", false);
     } else {
@@ -373,6 +475,7 @@ async function loadBasicInfo() {
     };
     console.log("[loadBasicInfo] Renderizando planos padrão:", defaultPlans);
     renderPlans(defaultPlans);
+    renderNetworks(["ETH", "BSC", "POLYGON", "ARBITRUM", "BASE"]);
 
     // Mostrar mensagem apenas se não tiver UID válido
     if (!uid || uid === "null" || uid === "undefined") {